@@ -15,7 +15,7 @@ def about_page():
     - **Document Context**: View the full context of referenced documents
     - **OCR Processing**: Extract text from images and PDFs with embedded images
     - **Document Tagging**: Add tags to documents for better organization and search
-    - **Vector Database Options**: Choose between Chroma (in-memory) and Pinecone (cloud-based) for document storage
+    - **Vector Database Options**: Choose between Chroma or FAISS (local) and Pinecone (cloud-based) for document storage
     
     ## How to Use
     
@@ -34,7 +34,8 @@ def about_page():
     
     ## Vector Database Options
     
-    - **Chroma (Default)**: Fast, in-memory vector database that works well for local usage
+    - **FAISS (Default for local use)**: In-memory similarity search (exact, or 8-bit quantized for large collections) with the fastest inserts; the index is saved to disk between sessions
+    - **Chroma**: Local vector database; embeddings are persisted to disk unless in-memory storage is selected
     - **Pinecone**: Cloud-based vector database for persistent storage and larger document collections
     
     ## Privacy & Security
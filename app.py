@@ -1,8 +1,11 @@
 import streamlit as st
 import os
 import gc
+import glob
 import tempfile
 import atexit
+import time
+from datetime import datetime
 from ui_components import apply_custom_css, add_tag_management_js
 from sidebar import build_sidebar
 from chat_interface import build_chat_interface
@@ -10,6 +13,10 @@ from about_page import about_page
 from system_check import check_dependencies
 from auth import display_auth_interface, create_default_admin
 from document_manager import build_document_manager
+from vector_store import load_documents, load_vectorstore, get_library_directory, faiss
+from document_processing import TEMP_FILE_PREFIX
+from sidebar_components import get_embedding_model_setting
+from utils import index_documents
 
 # Configure tempfile to not delete files immediately
 # This allows us to handle file closing more carefully
@@ -17,12 +24,13 @@ tempfile.tempdir = tempfile.gettempdir()
 
 # Register cleanup function to remove any leftover temporary files on exit
 def cleanup_temp_files():
+    """Remove temporary upload files created by this app"""
     temp_dir = tempfile.gettempdir()
-    try:
-        # Force garbage collection to release file handles
-        gc.collect()
-    except Exception as e:
-        print(f"Error during cleanup: {e}")
+    for tmp_path in glob.glob(os.path.join(temp_dir, f"{TEMP_FILE_PREFIX}*")):
+        try:
+            os.unlink(tmp_path)
+        except OSError as e:
+            print(f"Error during cleanup: {e}")
 
 atexit.register(cleanup_temp_files)
 
@@ -38,19 +46,30 @@ st.set_page_config(
 apply_custom_css()
 add_tag_management_js()
 
+@st.cache_resource
+def freeze_startup_objects():
+    """Move objects allocated at startup into the permanent GC generation (once per process)"""
+    gc.freeze()
+    return True
+
 # Initialize session state
 def initialize_session_state():
     """Initialize session state variables"""
+    # Everything below only needs to run once per session
+    if st.session_state.get("_initialized"):
+        return
+    
     if 'chat_history' not in st.session_state:
         st.session_state.chat_history = []
+    # The user's own library is loaded once they have logged in (see load_user_library)
     if 'documents' not in st.session_state:
         st.session_state.documents = []
+    if 'documents_by_id' not in st.session_state:
+        st.session_state.documents_by_id = {}
     if 'vectorstore' not in st.session_state:
         st.session_state.vectorstore = None
     if 'current_tab' not in st.session_state:
         st.session_state.current_tab = "Chat"
-    if 'tags' not in st.session_state:
-        st.session_state.tags = set()  # Set of all unique tags
     if 'debug_mode' not in st.session_state:
         st.session_state.debug_mode = False
     if "settings" not in st.session_state:
@@ -63,10 +82,55 @@ def initialize_session_state():
         st.session_state.show_sources = True
     if "show_citations" not in st.session_state:
         st.session_state.show_citations = True
-    # Set Pinecone as default vector store
+    # Default to Pinecone when it is configured, otherwise to FAISS for local use
     if "vectorstore_type" not in st.session_state:
-        st.session_state.vectorstore_type = "pinecone"
+        if os.environ.get("PINECONE_API_KEY"):
+            st.session_state.vectorstore_type = "pinecone"
+        else:
+            st.session_state.vectorstore_type = "faiss" if faiss is not None else "chroma"
+    
+    # Keep long-lived startup objects out of future collections
+    freeze_startup_objects()
+    
+    st.session_state._initialized = True
         
+def load_user_library():
+    """
+    Load the logged-in user's documents and vector store
+    
+    Each user has their own saved library, so loading is redone only when a
+    different user logs in to this session.
+    """
+    username = st.session_state.current_user["username"]
+    if st.session_state.get("library_owner") == username:
+        return
+    
+    if st.session_state.get("library_owner") is not None:
+        # Another user was logged in to this browser session; drop their conversation
+        st.session_state.chat_history = []
+        st.session_state.pending_questions = []
+        st.session_state.removed_doc_ids = set()
+        # A rebuild of the previous user's library is left to finish on its own
+        st.session_state.pending_rebuild = None
+        st.session_state.pop("deferred_sync", None)
+    
+    library_dir = get_library_directory(username)
+    st.session_state.library_dir = library_dir
+    # Documents saved by a previous session, whose vectors are already stored
+    st.session_state.documents = load_documents(library_dir)
+    st.session_state.documents_by_id = index_documents(st.session_state.documents)
+    # Reuse embeddings persisted by a previous session instead of re-embedding
+    st.session_state.vectorstore = load_vectorstore(
+        st.session_state.documents,
+        library_dir,
+        vectorstore_type=st.session_state.vectorstore_type,
+        pinecone_index=st.session_state.get("pinecone_index") or os.environ.get("PINECONE_INDEX"),
+        embedding_model=get_embedding_model_setting()
+    )
+    st.session_state.indexed_embedding_model = get_embedding_model_setting()
+    st.session_state.vectorstore_version = st.session_state.get("vectorstore_version", 0) + 1
+    st.session_state.library_owner = username
+
 # Handle custom component events
 def handle_custom_events():
     # Handle tag removal events
@@ -84,7 +148,7 @@ def handle_custom_events():
 # Display a welcome message after login
 def display_welcome_message():
     if st.session_state.current_user:
-        current_time = st.session_state.get('last_activity').strftime('%H:%M')
+        current_time = datetime.fromtimestamp(st.session_state.get('login_time', time.time())).strftime('%H:%M')
         st.write(f"### Welcome to Legal Document AI Assistant, {st.session_state.current_user['full_name']}!")
         st.write(f"You logged in at {current_time}. Start by uploading documents in the sidebar.")
         
@@ -112,6 +176,9 @@ def main():
     # This will stop execution if user is not authenticated
     display_auth_interface()
     
+    # Load the logged-in user's own documents and vector store
+    load_user_library()
+    
     # Handle any custom events
     handle_custom_events()
     
@@ -1,12 +1,16 @@
 import streamlit as st
 import hashlib
+import hmac
 import os
 import json
-from datetime import datetime, timedelta
+import time
+from datetime import datetime
 
 # Constants
 USER_DB_FILE = ".streamlit/users.json"
 SESSION_EXPIRY = 12  # hours
+SESSION_EXPIRY_SECONDS = SESSION_EXPIRY * 3600
+SCRYPT_PARAMS = {"n": 2**14, "r": 8, "p": 1}
 
 def initialize_auth():
     """Initialize authentication system"""
@@ -16,8 +20,8 @@ def initialize_auth():
         st.session_state.current_user = None
     if 'auth_message' not in st.session_state:
         st.session_state.auth_message = None
-    if 'last_activity' not in st.session_state:
-        st.session_state.last_activity = datetime.now()
+    if 'last_activity_ts' not in st.session_state:
+        st.session_state.last_activity_ts = time.monotonic()
     
     # Create users directory if it doesn't exist
     os.makedirs(os.path.dirname(USER_DB_FILE), exist_ok=True)
@@ -27,11 +31,38 @@ def initialize_auth():
         with open(USER_DB_FILE, 'w') as f:
             json.dump({"users": []}, f)
 
-def hash_password(password):
-    """Create a SHA-256 hash of the password"""
-    return hashlib.sha256(password.encode()).hexdigest()
+def hash_password(password, salt=None):
+    """
+    Derive a scrypt hash of the password
+    
+    Args:
+        password: Plain-text password
+        salt: Hex-encoded salt; a new random salt is generated if omitted
+        
+    Returns:
+        Tuple of (hex-encoded hash, hex-encoded salt)
+    """
+    if salt is None:
+        salt = os.urandom(16).hex()
+    derived = hashlib.scrypt(password.encode(), salt=bytes.fromhex(salt), **SCRYPT_PARAMS)
+    return derived.hex(), salt
 
-def load_users():
+def _verify(password, password_hash, salt):
+    """
+    Check a password against a stored hash
+    
+    Only called on a login attempt, so the key derivation is a one-off cost and
+    passwords are never kept around after the check.
+    
+    Users created before salts were introduced have a plain SHA-256 hash and no salt.
+    """
+    if salt is None:
+        candidate = hashlib.sha256(password.encode()).hexdigest()
+    else:
+        candidate, _ = hash_password(password, salt)
+    return hmac.compare_digest(candidate, password_hash)
+
+def load_users_from_disk():
     """Load users from the database file"""
     try:
         with open(USER_DB_FILE, 'r') as f:
@@ -40,10 +71,31 @@ def load_users():
         # Return empty user database if file doesn't exist or is invalid
         return {"users": []}
 
+def index_users(user_data):
+    """Build a username -> user dict index over the user list"""
+    return {user['username']: user for user in user_data['users']}
+
+@st.cache_resource
+def _users_cache():
+    """Process-wide holder for the decoded user database, shared by all sessions"""
+    user_data = load_users_from_disk()
+    return {"data": user_data, "by_username": index_users(user_data)}
+
+def load_users():
+    """Load users from the in-memory cache (the file is only read once per process)"""
+    return _users_cache()["data"]
+
+def get_user(username):
+    """Look up a user by username, or None if there is no such user"""
+    return _users_cache()["by_username"].get(username)
+
 def save_users(user_data):
-    """Save users to the database file"""
+    """Save users to the database file and update the in-memory cache"""
     with open(USER_DB_FILE, 'w') as f:
         json.dump(user_data, f, indent=2)
+    cache = _users_cache()
+    cache["data"] = user_data
+    cache["by_username"] = index_users(user_data)
 
 def create_user(username, password, full_name, email, firm_name=None, user_role="user"):
     """Create a new user"""
@@ -51,13 +103,15 @@ def create_user(username, password, full_name, email, firm_name=None, user_role=
     user_data = load_users()
     
     # Check if username already exists
-    if any(user['username'] == username for user in user_data['users']):
+    if get_user(username) is not None:
         return False, "Username already exists"
     
     # Create new user
+    password_hash, salt = hash_password(password)
     new_user = {
         "username": username,
-        "password_hash": hash_password(password),
+        "password_hash": password_hash,
+        "salt": salt,
         "full_name": full_name,
         "email": email,
         "firm_name": firm_name,
@@ -76,9 +130,14 @@ def authenticate(username, password):
     user_data = load_users()
     
     # Find user by username
-    user = next((user for user in user_data['users'] if user['username'] == username), None)
+    user = get_user(username)
     
-    if user and user['password_hash'] == hash_password(password):
+    if user and _verify(password, user['password_hash'], user.get('salt')):
+        # Upgrade legacy SHA-256 hashes to scrypt on successful login
+        if user.get('salt') is None:
+            user['password_hash'], user['salt'] = hash_password(password)
+            save_users(user_data)
+        
         # Set session state for authenticated user
         st.session_state.authenticated = True
         st.session_state.current_user = {
@@ -88,7 +147,9 @@ def authenticate(username, password):
             "firm_name": user.get('firm_name'),
             "role": user.get('role', 'user')
         }
-        st.session_state.last_activity = datetime.now()
+        st.session_state.last_activity_ts = time.monotonic()
+        # Wall-clock login time, only formatted for display
+        st.session_state.login_time = time.time()
         return True, "Authentication successful"
     
     return False, "Invalid username or password"
@@ -104,14 +165,12 @@ def is_session_expired():
     if not st.session_state.authenticated:
         return False
     
-    now = datetime.now()
-    expiry_time = st.session_state.last_activity + timedelta(hours=SESSION_EXPIRY)
-    
-    if now > expiry_time:
+    now = time.monotonic()
+    if now - st.session_state.last_activity_ts > SESSION_EXPIRY_SECONDS:
         return True
     
     # Update last activity time
-    st.session_state.last_activity = now
+    st.session_state.last_activity_ts = now
     return False
 
 def check_authentication():
@@ -1,11 +1,40 @@
 import streamlit as st
 import os
+import asyncio
+import functools
+import html
+import re
+import tiktoken
 from langchain_openai import ChatOpenAI
 from langchain.prompts import PromptTemplate
+from langchain_core.documents import Document
 from citation_handler import CitationTrackingHandler
+from semantic_cache import QueryCache
 from document_context import build_document_context_panel
-from utils import format_tags_html
+from utils import format_tags_html, submit_async, run_async, iterate_async, get_http_client, get_async_http_client
 
+# Number of most recent chat messages rendered on every rerun
+CHAT_HISTORY_WINDOW = 20
+
+# Maximum number of tokens of retrieved context sent to the chat model
+MAX_CONTEXT_TOKENS = 3000
+
+# Maximum number of questions answered together in one model call, and the line
+# the model starts each of their answers with
+MAX_BATCHED_QUESTIONS = 3
+ANSWER_MARKER = re.compile(r"^\s*\**Answer (\d+):\**[ \t]*", re.MULTILINE)
+
+# Maximal marginal relevance retrieval: candidates fetched per query, and the
+# relevance/diversity trade-off used to pick the final k from them
+MMR_FETCH_K = 20
+MMR_LAMBDA_MULT = 0.5
+
+# Retrievers and semantic query caches kept per process. Every document change
+# gives a new fingerprint (and a rebuild a new vectorstore), so older entries
+# are evicted instead of pinning replaced stores and their cached embeddings
+RETRIEVAL_CACHE_MAX_ENTRIES = 16
+
+@functools.lru_cache(maxsize=2)
 def get_system_prompt(legal_expert_mode=True):
     """
     Get the system prompt for the chat model based on settings
@@ -50,6 +79,129 @@ def get_system_prompt(legal_expert_mode=True):
         Focus on accuracy and clarity in your responses.
         """
 
+@st.cache_resource(show_spinner=False)
+def get_llm(model_name, temperature, streaming=True, openai_api_key=None):
+    """
+    Get a shared ChatOpenAI client for the given settings
+    
+    Args:
+        model_name: Name of the chat model
+        temperature: Sampling temperature
+        streaming: Whether the client streams tokens
+        openai_api_key: API key the client is bound to (part of the cache key)
+        
+    Returns:
+        ChatOpenAI instance reused across reruns
+    """
+    return ChatOpenAI(
+        model_name=model_name,
+        temperature=temperature,
+        streaming=streaming,
+        openai_api_key=openai_api_key,
+        http_client=get_http_client(),
+        http_async_client=get_async_http_client()
+    )
+
+@st.cache_resource(show_spinner=False, max_entries=RETRIEVAL_CACHE_MAX_ENTRIES)
+def get_retriever(_vectorstore, vs_id, k=5):
+    """
+    Get a shared retriever for a vectorstore
+    
+    Args:
+        _vectorstore: The vectorstore to wrap (excluded from the cache key)
+        vs_id: Identity of the vectorstore, used as the cache key
+        k: Number of documents to return
+        
+    Returns:
+        Retriever reused until the vectorstore is replaced
+    """
+    return _vectorstore.as_retriever(
+        search_type="mmr",
+        search_kwargs={"k": k, "fetch_k": MMR_FETCH_K, "lambda_mult": MMR_LAMBDA_MULT}
+    )
+
+def get_vectorstore_fingerprint():
+    """Fingerprint of the indexed documents, so cached retrievals invalidate on document changes"""
+    documents = st.session_state.documents
+    vectorstore_type = st.session_state.get("vectorstore_type", "chroma")
+    vectorstore_version = st.session_state.get("vectorstore_version", 0)
+    embedding_model = st.session_state.get("indexed_embedding_model", "")
+    return f"{vectorstore_type}:{embedding_model}:{vectorstore_version}:{len(documents)}:{hash(tuple(d['id'] for d in documents))}"
+
+@st.cache_resource(show_spinner=False, max_entries=RETRIEVAL_CACHE_MAX_ENTRIES)
+def get_query_cache(vs_fingerprint, k=5):
+    """Semantic query cache for one set of indexed documents"""
+    return QueryCache()
+
+@st.cache_data(ttl=600, show_spinner=False)
+def cached_retrieve(_vectorstore, query, vs_fingerprint, k=5):
+    """
+    Retrieve documents for a query, caching results for repeated questions
+    
+    Exact repeats are served by st.cache_data. Otherwise the query is embedded once
+    and checked against a semantic cache of earlier queries; on a miss the same
+    embedding is used for a maximal marginal relevance search, which skips chunks
+    that are near-duplicates of ones already selected.
+    
+    Args:
+        _vectorstore: The vectorstore to search (excluded from the cache key)
+        query: The user's question
+        vs_fingerprint: Fingerprint of the indexed documents
+        k: Number of documents to return
+        
+    Returns:
+        List of {"page_content", "metadata"} dicts
+    """
+    embeddings = getattr(_vectorstore, "embeddings", None)
+    if embeddings is None:
+        # The store can't expose its embedder, so fall back to the plain retriever
+        retriever = get_retriever(_vectorstore, id(_vectorstore), k)
+        return [
+            {"page_content": doc.page_content, "metadata": dict(doc.metadata)}
+            for doc in retriever.invoke(query)
+        ]
+    
+    query_embedding = embeddings.embed_query(query)
+    query_cache = get_query_cache(vs_fingerprint, k)
+    results = query_cache.lookup(query_embedding)
+    if results is None:
+        results = [
+            {"page_content": doc.page_content, "metadata": dict(doc.metadata)}
+            for doc in _vectorstore.max_marginal_relevance_search_by_vector(
+                query_embedding, k=k, fetch_k=MMR_FETCH_K, lambda_mult=MMR_LAMBDA_MULT
+            )
+        ]
+        query_cache.insert(query_embedding, results)
+    return results
+
+@functools.lru_cache(maxsize=8)
+def get_token_encoding(model_name):
+    """Get the tiktoken encoding for a model, falling back to cl100k_base for unknown models"""
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+def budgeted_context(retrieved_docs, model_name, max_tokens=MAX_CONTEXT_TOKENS):
+    """
+    Yield document contents in retrieval order until the token budget is used up
+    
+    The top-ranked document is always included, so the context is never empty.
+    
+    Args:
+        retrieved_docs: Documents in retrieval rank order
+        model_name: Chat model used to count tokens
+        max_tokens: Token budget for the context
+    """
+    encoding = get_token_encoding(model_name)
+    used_tokens = 0
+    for doc in retrieved_docs:
+        doc_tokens = len(encoding.encode(doc.page_content))
+        if used_tokens and used_tokens + doc_tokens > max_tokens:
+            break
+        used_tokens += doc_tokens
+        yield doc.page_content
+
 def build_chat_interface():
     """Build the main chat interface"""
     # Create two columns for the chat layout
@@ -73,58 +225,131 @@ def build_chat_messages_panel():
     
     # Toggle button for showing/hiding citations
     show_citations = st.toggle("Show Citations in Messages", value=st.session_state.show_citations)
-    st.session_state.show_citations = show_citations
+    if st.session_state.show_citations != show_citations:
+        st.session_state.show_citations = show_citations
     
     # Display chat messages from history
     display_chat_history(show_citations)
     
-    # User input area
-    user_input = st.text_area("Your message:", key="user_input", height=100)
-    
     # Get OpenAI API key
     openai_api_key = os.environ.get("OPENAI_API_KEY", "")
     
     # Check conditions for enabling the chat
     chat_disabled = not openai_api_key or st.session_state.vectorstore is None
     
-    # Send button with conditional enabling
-    send_button = st.button("Send", disabled=chat_disabled)
-    
     if chat_disabled:
         display_chat_disabled_warnings(openai_api_key)
     
     # Process user input and generate response
-    if send_button and user_input and not chat_disabled:
+    user_input = st.chat_input("Ask about your documents", disabled=chat_disabled)
+    if user_input:
         process_chat_input(user_input)
 
 def display_chat_history(show_citations=True):
-    """Display the chat history with messages and citations"""
-    for i, message in enumerate(st.session_state.chat_history):
-        avatar = "👨‍⚖️" if message["role"] == "user" else "🤖"
-        with st.container():
-            st.markdown(f"""
-            <div class="chat-message {message['role']}">
-                <div class="avatar">{avatar}</div>
-                <div class="message">{message['content']}</div>
-            </div>
-            """, unsafe_allow_html=True)
+    """
+    Display the chat history with messages and citations
+    
+    Only the last CHAT_HISTORY_WINDOW messages are rendered by default; older ones
+    are rendered only when requested. Citations of earlier messages use native
+    <details> elements, so only the latest message creates expander widgets.
+    """
+    history = st.session_state.chat_history
+    if not history:
+        return
+    
+    older = history[:-CHAT_HISTORY_WINDOW]
+    recent = history[-CHAT_HISTORY_WINDOW:]
+    
+    # Older messages are only built when the user asks for them
+    if older and st.toggle(f"Show {len(older)} earlier messages", key="show_earlier_messages"):
+        for message in older:
+            display_chat_message(message, show_citations)
+    
+    for message in recent[:-1]:
+        display_chat_message(message, show_citations)
+    
+    display_chat_message(recent[-1], show_citations, interactive=True)
+
+def format_citations_html(citations):
+    """
+    Build static HTML for a message's citations
+    
+    Args:
+        citations: List of citation dicts
+        
+    Returns:
+        HTML string
+    """
+    html_parts = ["<div>Sources:</div>"]
+    for citation in citations:
+        # Tag HTML is precomputed when the citation is created
+        tag_html = citation.get("_tag_html", "")
+        html_parts.append(
+            f"<details><summary>From: {html.escape(str(citation['source']))} (Page {citation['page'] + 1})</summary>"
+            f"<div class=\"citation\">{html.escape(citation['text'])}</div>{tag_html}</details>"
+        )
+    return "\n".join(html_parts)
+
+def format_hidden_citations_html(citations):
+    """Build the placeholder shown in place of hidden citations"""
+    return f"<div style='font-style: italic; color: #888;'>{len(citations)} citations hidden. Toggle 'Show Citations in Messages' to view them.</div>"
+
+def display_chat_message(message, show_citations=True, interactive=False):
+    """
+    Display a single chat message and its citations
+    
+    Non-interactive messages are emitted as one markdown element (text plus static
+    citation HTML), so each earlier message costs a single element per rerun.
+    
+    Args:
+        message: Chat history entry
+        show_citations: Whether to show the citations
+        interactive: Use expander widgets for citations instead of static HTML
+    """
+    avatar = "👨‍⚖️" if message["role"] == "user" else "🤖"
+    with st.chat_message(message["role"], avatar=avatar):
+        if interactive:
+            st.markdown(message["content"])
+            display_message_citations(message, show_citations, interactive)
+            return
+        
+        # Only the citation markup is rendered as raw HTML; the message text is plain markdown
+        st.markdown(message["content"])
+        if message.get("citations"):
+            if show_citations:
+                st.markdown(format_citations_html(message["citations"]), unsafe_allow_html=True)
+            else:
+                st.markdown(format_hidden_citations_html(message["citations"]), unsafe_allow_html=True)
+
+def display_message_citations(message, show_citations=True, interactive=False):
+    """
+    Display the citations attached to a chat message
+    
+    Args:
+        message: Chat history entry
+        show_citations: Whether to show the citations
+        interactive: Use expander widgets for citations instead of static HTML
+    """
+    # Display citations if available and if show_citations is True
+    if message.get("citations") and show_citations:
+        if not interactive:
+            st.markdown(format_citations_html(message["citations"]), unsafe_allow_html=True)
+            return
+        
+        st.markdown("Sources:")
+        for citation in message["citations"]:
+            # Tag HTML is precomputed when the citation is created
+            tag_html = citation.get("_tag_html", "")
             
-            # Display citations if available and if show_citations is True
-            if message.get("citations") and show_citations:
-                st.markdown("<div style='margin-left: 40px;'>Sources:</div>", unsafe_allow_html=True)
-                for citation in message["citations"]:
-                    # Include tags in the citation display if they exist
-                    tag_html = format_tags_html(citation.get("tags", [])) if citation.get("tags") else ""
-                    
-                    with st.expander(f"From: {citation['source']} (Page {citation['page'] + 1})"):
-                        st.markdown(f"""
-                        <div class="citation">
-                            {citation['text']}
-                        </div>
-                        {tag_html}
-                        """, unsafe_allow_html=True)
-            elif message.get("citations") and not show_citations:
-                st.markdown(f"<div style='margin-left: 40px; font-style: italic; color: #888;'>{len(message['citations'])} citations hidden. Toggle 'Show Citations in Messages' to view them.</div>", unsafe_allow_html=True)
+            with st.expander(f"From: {citation['source']} (Page {citation['page'] + 1})"):
+                st.markdown(f"""
+                <div class="citation">
+                    {html.escape(citation['text'])}
+                </div>
+                {tag_html}
+                """, unsafe_allow_html=True)
+    elif message.get("citations") and not show_citations:
+        st.markdown(format_hidden_citations_html(message["citations"]), unsafe_allow_html=True)
 
 def display_chat_disabled_warnings(openai_api_key):
     """Display warnings when chat is disabled"""
@@ -133,102 +358,278 @@ def display_chat_disabled_warnings(openai_api_key):
     if st.session_state.vectorstore is None:
         st.warning("Please upload at least one document to enable chat.")
 
+def build_question(questions):
+    """Combine one or more questions into the question sent to the model"""
+    if len(questions) == 1:
+        return questions[0]
+    return (
+        "Answer each question in turn, starting each answer on its own line with \"Answer <number>:\".\n"
+        + "\n".join(f"{i}. {q}" for i, q in enumerate(questions, 1))
+    )
+
+def build_context(retrieved_docs_per_question, model_name):
+    """Build the prompt context, with a share of the token budget and a heading per question"""
+    if len(retrieved_docs_per_question) == 1:
+        return "\n\n".join(budgeted_context(retrieved_docs_per_question[0], model_name))
+    
+    max_tokens = MAX_CONTEXT_TOKENS // len(retrieved_docs_per_question)
+    return "\n\n".join(
+        f"Context for question {i}:\n\n" + "\n\n".join(budgeted_context(docs, model_name, max_tokens))
+        for i, docs in enumerate(retrieved_docs_per_question, 1)
+    )
+
+def split_answers(response, count):
+    """
+    Split the model's response to batched questions into one answer per question
+    
+    Args:
+        response: Response text, with each answer starting with "Answer <number>:"
+        count: Number of questions asked
+        
+    Returns:
+        List of answers in question order, or None if the response isn't laid out that way
+    """
+    if count == 1:
+        return [response]
+    
+    parts = ANSWER_MARKER.split(response)
+    # parts is [text before the first marker, number, answer, number, answer, ...]
+    if [int(number) for number in parts[1::2]] != list(range(1, count + 1)):
+        return None
+    return [answer.strip() for answer in parts[2::2]]
+
+def add_answer_to_history(question_message, answer_message):
+    """Add an answer right after the question it answers, or at the end if the question is gone"""
+    history = st.session_state.chat_history
+    position = next((i for i, message in enumerate(history) if message is question_message), None)
+    if position is None:
+        history.append(answer_message)
+    else:
+        history.insert(position + 1, answer_message)
+
 def process_chat_input(user_input):
-    """Process the user input and generate a response"""
+    """
+    Process the user input and generate a response
+    
+    Sending a message while an answer is still streaming reruns the script and
+    cuts that turn short, leaving its question in the session's pending queue.
+    The queued questions are answered with this one, MAX_BATCHED_QUESTIONS per
+    model call, each with its own retrieval and its own answer. A turn that fails
+    clears the queue, so its questions aren't asked again with the next one.
+    """
     # Add user message to chat history
-    st.session_state.chat_history.append({
+    user_message = {
         "role": "user",
         "content": user_input
-    })
+    }
+    st.session_state.chat_history.append(user_message)
+    with st.chat_message("user", avatar="👨‍⚖️"):
+        st.markdown(user_input)
     
-    # Setup citation handler
-    citation_handler = CitationTrackingHandler()
+    pending = st.session_state.setdefault("pending_questions", [])
+    pending.append(user_message)
     
-    # Get the retriever from the vectorstore
-    retriever = st.session_state.vectorstore.as_retriever(
-        search_type="similarity",
-        search_kwargs={"k": 5}  # Return top 5 relevant documents
-    )
+    # Reuse the session's citation handler; on_retriever_end resets it for each turn
+    citation_handler = st.session_state.setdefault("citation_handler", CitationTrackingHandler())
     
     # Initialize the model with system prompt from settings
     model_name = st.session_state.settings.get("model_name", "gpt-4")
     temperature = st.session_state.settings.get("temperature", 0.0)
     legal_expert_mode = st.session_state.settings.get("legal_expert_mode", True)
     
-    # Get the system prompt based on settings
-    system_prompt = get_system_prompt(legal_expert_mode)
+    # Get the ChatOpenAI client (without system parameter)
+    llm = get_llm(model_name, temperature, True, os.environ.get("OPENAI_API_KEY", ""))
     
-    # Initialize the ChatOpenAI (without system parameter)
-    llm = ChatOpenAI(
-        model_name=model_name,
-        temperature=temperature
-        # Remove the system parameter
-    )
+    # A full batch is sent right away, and the rest of the queue in follow-up calls
+    while pending:
+        batch = pending[:MAX_BATCHED_QUESTIONS]
+        if not answer_questions(batch, citation_handler, llm, legal_expert_mode):
+            pending.clear()
+            return
+        del pending[:len(batch)]
+
+def answer_questions(question_messages, citation_handler, llm, legal_expert_mode):
+    """
+    Answer queued questions in one model call, adding each answer after its question
+    
+    Args:
+        question_messages: Chat history entries of the questions, oldest first
+        citation_handler: The session's citation handler
+        llm: Chat model client
+        legal_expert_mode: Whether to use the legal expert prompt
+        
+    Returns:
+        Whether the questions were answered
+    """
+    questions = [message["content"] for message in question_messages]
     
     # Show spinner while processing
-    with st.spinner("Thinking..."):
+    with st.chat_message("assistant", avatar="🤖"), st.spinner("Thinking..."):
         try:
-            # First retrieve relevant documents using invoke() method
-            retrieved_docs = retriever.invoke(user_input)
+            # Start retrieval (top 5 per question) on the shared event loop
+            retrieval = submit_async(prepare_turn_async(
+                st.session_state.vectorstore,
+                questions,
+                get_vectorstore_fingerprint(),
+                llm.model_name,
+                5
+            ))
+            prompt = get_prompt_template(legal_expert_mode)
+            retrieved_docs_per_question = retrieval.result()
             
             # Debug information
             if st.session_state.get("debug_mode", False):
-                st.write(f"Retrieved {len(retrieved_docs)} documents")
-                for i, doc in enumerate(retrieved_docs[:2]):
-                    st.write(f"Document {i}:")
-                    st.write(f"  Content: {doc.page_content[:100]}...")
-                    st.write(f"  Metadata: {doc.metadata}")
-            
-            # Process citations from retrieved documents
-            citation_handler.on_retriever_end(retrieved_docs)
-            
-            # Set up a simple template that includes the system prompt
-            template = f"""
-            {system_prompt}
-            
-            Answer the question based on the following context:
-
-            Context:
-            {{context}}
-
-            Question: {{question}}
-
-            Instructions:
-            1. Base your answer only on the provided context
-            2. If you don't know the answer based on the context, say so
-            3. Keep your answer concise and focused on the question
-            4. Include specific references to the documents you're using
-            5. Use formal legal terminology when appropriate
-            6. Provide only factually accurate information and do not make anything up
-            7. If you're unsure about a fact, clearly state your uncertainty
-            """
-            
-            prompt = PromptTemplate(
-                input_variables=["context", "question"],
-                template=template
-            )
+                for question, retrieved_docs in zip(questions, retrieved_docs_per_question):
+                    st.write(f"Retrieved {len(retrieved_docs)} documents for: {question}")
+                    for i, doc in enumerate(retrieved_docs[:2]):
+                        st.write(f"Document {i}:")
+                        st.write(f"  Content: {doc.page_content[:100]}...")
+                        st.write(f"  Metadata: {doc.metadata}")
             
             # Format context from retrieved documents
-            context = "\n\n".join([doc.page_content for doc in retrieved_docs])
+            context = build_context(retrieved_docs_per_question, llm.model_name)
+            
+            prompt_text = prompt.format(context=context, question=build_question(questions))
             
             # Call LLM
-            response = llm.invoke(
-                prompt.format(context=context, question=user_input)
-            ).content
+            if st.session_state.get("debug_mode", False):
+                # Skip streaming in debug mode so errors surface in one place
+                response = run_async(llm.ainvoke(prompt_text)).content
+                citations_per_question = []
+                for retrieved_docs in retrieved_docs_per_question:
+                    citation_handler.on_retriever_end(retrieved_docs)
+                    citations_per_question.append(citation_handler.citations)
+                st.markdown(response)
+            else:
+                # The request starts right away; citations are built in worker threads while tokens stream
+                token_stream = iterate_async(llm.astream(prompt_text))
+                citation_futures = [
+                    submit_async(asyncio.to_thread(citation_handler.process_documents, retrieved_docs))
+                    for retrieved_docs in retrieved_docs_per_question
+                ]
+                
+                # Stream tokens into a placeholder as they arrive
+                placeholder = st.empty()
+                response = placeholder.write_stream(chunk.content for chunk in token_stream)
+                citations_per_question = [future.result()[0] for future in citation_futures]
+                citation_handler.citations = citations_per_question[-1]
             
-            # Add assistant message to chat history
-            st.session_state.chat_history.append({
-                "role": "assistant",
-                "content": response,
-                "citations": citation_handler.citations
-            })
+            # Precompute tag HTML once per citation instead of on every rerun
+            for citations in citations_per_question:
+                for citation in citations:
+                    citation["_tag_html"] = format_tags_html(citation.get("tags", []))
             
-            # Clear user input
-            st.rerun()
+            # Add each answer to the chat history after its question, keeping a response that
+            # can't be split as one message. No rerun needed: the response was streamed above,
+            # so only the citations are added in place
+            answers = split_answers(response, len(question_messages))
+            if answers is None:
+                answers = [response]
+                citations_per_question = [[c for citations in citations_per_question for c in citations]]
+                question_messages = question_messages[-1:]
+            for question_message, answer, citations in zip(question_messages, answers, citations_per_question):
+                assistant_message = {
+                    "role": "assistant",
+                    "content": answer,
+                    "citations": citations
+                }
+                add_answer_to_history(question_message, assistant_message)
+            display_message_citations(assistant_message, st.session_state.show_citations, interactive=True)
+            return True
             
         except Exception as e:
             st.error(f"Error generating response: {str(e)}")
             
             # Enable debug mode automatically when there's an error
             st.session_state.debug_mode = True
-            st.warning("Debug mode enabled due to error.")
\ No newline at end of file
+            st.warning("Debug mode enabled due to error.")
+            return False
+
+async def retrieve_documents_async(vectorstore, query, vs_fingerprint, k=5):
+    """
+    Retrieve documents without blocking the event loop
+    
+    Args:
+        vectorstore: The vectorstore to search
+        query: The user's question
+        vs_fingerprint: Fingerprint of the indexed documents
+        k: Number of documents to return
+        
+    Returns:
+        List of LangChain Documents
+    """
+    # Reuse cached results for repeated questions
+    cached_docs = await asyncio.to_thread(cached_retrieve, vectorstore, query, vs_fingerprint, k)
+    return [Document(**doc) for doc in cached_docs]
+
+@functools.lru_cache(maxsize=2)
+def get_prompt_template(legal_expert_mode=True):
+    """
+    Get the question-answering prompt for the given mode, built once per process
+    
+    Args:
+        legal_expert_mode: Whether to use legal expert mode
+        
+    Returns:
+        PromptTemplate with "context" and "question" variables
+    """
+    return build_prompt_template(get_system_prompt(legal_expert_mode))
+
+async def prepare_turn_async(vectorstore, queries, vs_fingerprint, model_name, k=5):
+    """
+    Retrieve documents for each question while the token encoding for the context budget loads
+    
+    Loading a tiktoken encoding can take a noticeable moment on first use, so it
+    runs concurrently with retrieval instead of after it.
+    
+    Args:
+        vectorstore: The vectorstore to search
+        queries: The questions being answered in this turn
+        vs_fingerprint: Fingerprint of the indexed documents
+        model_name: Chat model whose encoding is used for the context budget
+        k: Number of documents to return per question
+        
+    Returns:
+        List of retrieved Documents for each question, in order
+    """
+    *retrieved_docs_per_question, _ = await asyncio.gather(
+        *(retrieve_documents_async(vectorstore, query, vs_fingerprint, k) for query in queries),
+        asyncio.to_thread(get_token_encoding, model_name)
+    )
+    return retrieved_docs_per_question
+
+def build_prompt_template(system_prompt):
+    """
+    Build the question-answering prompt around the system prompt
+    
+    Args:
+        system_prompt: System prompt for the current settings
+        
+    Returns:
+        PromptTemplate with "context" and "question" variables
+    """
+    # Set up a simple template that includes the system prompt
+    template = f"""
+    {system_prompt}
+    
+    Answer the question based on the following context:
+
+    Context:
+    {{context}}
+
+    Question: {{question}}
+
+    Instructions:
+    1. Base your answer only on the provided context
+    2. If you don't know the answer based on the context, say so
+    3. Keep your answer concise and focused on the question
+    4. Include specific references to the documents you're using
+    5. Use formal legal terminology when appropriate
+    6. Provide only factually accurate information and do not make anything up
+    7. If you're unsure about a fact, clearly state your uncertainty
+    """
+    
+    return PromptTemplate(
+        input_variables=["context", "question"],
+        template=template
+    )
@@ -1,5 +1,23 @@
+import functools
+import streamlit as st
+import xxhash
 from langchain_core.callbacks import BaseCallbackHandler
 
+# Citation fields read from chunk metadata, with the value used when a field is missing
+CITATION_DEFAULTS = {
+    "source": "Unknown",
+    "doc_id": "Unknown",
+    "doc_type": "Unknown",
+    "case_id": "Unknown",
+    "page": 0,
+    "chunk": 0
+}
+
+@functools.lru_cache(maxsize=4096)
+def split_tags(tags_str):
+    """Split a comma-separated tags string from chunk metadata into a tuple of tags"""
+    return tuple(tags_str.split(",")) if tags_str else ()
+
 class CitationTrackingHandler(BaseCallbackHandler):
     """
     Callback handler for tracking citations in LangChain.
@@ -10,37 +28,32 @@ class CitationTrackingHandler(BaseCallbackHandler):
     def __init__(self):
         """Initialize the citation handler"""
         self.citations = []
-        self.citation_sources = set()  # Track unique citation sources to prevent duplicates
+        self.citation_sources = set()  # Tuple keys of citations already seen, to prevent duplicates
         
     def on_chain_start(self, serialized, inputs, **kwargs):
         """Called when the chain starts running."""
-        import streamlit as st
         if st.session_state.get("debug_mode", False):
             st.write("Chain started")
         
     def on_chain_end(self, outputs, **kwargs):
         """Called when the chain finishes running."""
-        import streamlit as st
+        debug_mode = st.session_state.get("debug_mode", False)
         
         # Check if we have source documents in the output
         if 'source_documents' in outputs and outputs['source_documents']:
-            if st.session_state.get("debug_mode", False):
+            if debug_mode:
                 st.write(f"Chain finished with {len(outputs['source_documents'])} source documents")
             
             # Process the source documents
             self.on_retriever_end(outputs['source_documents'])
         else:
-            if st.session_state.get("debug_mode", False):
+            if debug_mode:
                 st.write("Chain finished but no source documents were found in outputs")
     
     def on_retriever_start(self, query, **kwargs):
         """Called when the retriever starts retrieving documents."""
-        import streamlit as st
         if st.session_state.get("debug_mode", False):
             st.write(f"Retriever started with query: {query}")
-        # Clear existing citations when starting a new retrieval
-        self.citations = []
-        self.citation_sources = set()
         
     def on_retriever_end(self, documents, **kwargs):
         """
@@ -50,162 +63,90 @@ class CitationTrackingHandler(BaseCallbackHandler):
             documents: The documents returned by the retriever
             **kwargs: Additional keyword arguments
         """
-        import streamlit as st
-        
-        self.citations = []
-        self.citation_sources = set()
+        debug_mode = st.session_state.get("debug_mode", False)
+        debug_messages = [] if debug_mode else None
+        # The only place citations are reset; fresh containers are assigned rather than
+        # cleared, since earlier chat messages keep references to their citation lists
+        self.citations, self.citation_sources = self.process_documents(documents, debug_messages)
         
         if not documents:
-            if st.session_state.get("debug_mode", False):
+            if debug_mode:
                 st.warning("No documents were retrieved")
             return
         
-        if st.session_state.get("debug_mode", False):
+        if debug_mode:
             st.write(f"Retrieved {len(documents)} documents")
+            for message in debug_messages:
+                st.write(message)
+            st.write(f"Total citations processed: {len(self.citations)}")
+    
+    def process_documents(self, documents, debug_messages=None):
+        """
+        Convert retrieved documents to citations, dropping duplicates.
+        
+        This doesn't touch Streamlit, so it can run off the script thread.
+        
+        Args:
+            documents: The documents returned by the retriever
+            debug_messages: Optional list that debug output is appended to
+            
+        Returns:
+            Tuple of (citations, set of citation keys seen)
+        """
+        citations = []
+        citation_sources = set()
         
-        for doc in documents:
+        for doc in documents or []:
             try:
-                # Make sure we're dealing with a Document object
+                # Pull content and metadata out of whichever format we were given
                 if hasattr(doc, 'page_content') and hasattr(doc, 'metadata'):
-                    # Get content and metadata
-                    content = doc.page_content
-                    metadata = doc.metadata
-                    
-                    # Debug the metadata
-                    if st.session_state.get("debug_mode", False):
-                        st.write(f"Document metadata: {metadata}")
-                    
-                    # Create a unique key for this citation to check for duplicates
-                    doc_id = metadata.get("doc_id", "Unknown")
-                    source = metadata.get("source", "Unknown")
-                    page = metadata.get("page", 0)
-                    chunk = metadata.get("chunk", 0)
-                    citation_key = f"{doc_id}_{page}_{chunk}_{source}"
-                    
-                    # Skip if we've already seen this exact citation
-                    if citation_key in self.citation_sources:
-                        if st.session_state.get("debug_mode", False):
-                            st.write(f"Skipping duplicate citation: {citation_key}")
-                        continue
-                    
-                    # Add this citation key to our set of seen citations
-                    self.citation_sources.add(citation_key)
-                    
-                    # Convert tags_str back to a list if it exists
-                    tags = []
-                    tags_str = metadata.get("tags_str", "")
-                    if tags_str and isinstance(tags_str, str):
-                        tags = tags_str.split(",")
-                    
-                    self.citations.append({
-                        "text": content,
-                        "source": source,
-                        "doc_id": doc_id,
-                        "doc_type": metadata.get("doc_type", "Unknown"),
-                        "case_id": metadata.get("case_id", "Unknown"),
-                        "tags": tags,
-                        "page": page,
-                        "chunk": chunk
-                    })
-                    
-                    if st.session_state.get("debug_mode", False):
-                        st.write(f"Successfully processed citation from {metadata.get('source', 'Unknown')}")
+                    content, metadata = doc.page_content, doc.metadata
                 elif isinstance(doc, dict):
-                    # It's a dictionary format
-                    metadata = doc.get("metadata", {})
-                    
-                    # Create a unique key for this citation to check for duplicates
-                    doc_id = metadata.get("doc_id", "Unknown")
-                    source = metadata.get("source", "Unknown")
-                    page = metadata.get("page", 0)
-                    chunk = metadata.get("chunk", 0)
-                    citation_key = f"{doc_id}_{page}_{chunk}_{source}"
-                    
-                    # Skip if we've already seen this exact citation
-                    if citation_key in self.citation_sources:
-                        if st.session_state.get("debug_mode", False):
-                            st.write(f"Skipping duplicate citation: {citation_key}")
-                        continue
-                    
-                    # Add this citation key to our set of seen citations
-                    self.citation_sources.add(citation_key)
+                    content, metadata = doc.get("page_content", ""), doc.get("metadata", {})
+                else:
+                    content, metadata = (doc if isinstance(doc, str) else str(doc)), None
+                
+                if metadata is None:
+                    # Plain strings and unknown formats carry no metadata, so key on a digest of the text
+                    citation_key = ("str" if isinstance(doc, str) else "unk", xxhash.xxh3_64_intdigest(content))
+                    fields = CITATION_DEFAULTS
+                    tags = ()
+                else:
+                    if debug_messages is not None:
+                        debug_messages.append(f"Document metadata: {metadata}")
+                    fields = {key: metadata.get(key, default) for key, default in CITATION_DEFAULTS.items()}
+                    citation_key = (fields["doc_id"], fields["page"], fields["chunk"], fields["source"])
                     
                     # Convert tags_str back to a list if it exists
-                    tags = []
                     tags_str = metadata.get("tags_str", "")
-                    if tags_str and isinstance(tags_str, str):
-                        tags = tags_str.split(",")
-                    
-                    self.citations.append({
-                        "text": doc.get("page_content", ""),
-                        "source": source,
-                        "doc_id": doc_id,
-                        "doc_type": metadata.get("doc_type", "Unknown"),
-                        "case_id": metadata.get("case_id", "Unknown"),
-                        "tags": tags,
-                        "page": page,
-                        "chunk": chunk
-                    })
-                elif isinstance(doc, str):
-                    # It's just a string - not much we can do about deduplication here
-                    # but we can still track it for future duplicates
-                    citation_key = f"string_{hash(doc)}"
-                    
-                    # Skip if we've already seen this exact citation
-                    if citation_key in self.citation_sources:
-                        continue
-                    
-                    # Add this citation key to our set of seen citations
-                    self.citation_sources.add(citation_key)
-                    
-                    self.citations.append({
-                        "text": doc,
-                        "source": "Unknown",
-                        "doc_id": "Unknown",
-                        "doc_type": "Unknown",
-                        "case_id": "Unknown",
-                        "tags": [],
-                        "page": 0,
-                        "chunk": 0
-                    })
-                else:
-                    # Unknown format - try to get some info
-                    # Generate a unique key based on the string representation
-                    citation_key = f"unknown_{hash(str(doc))}"
-                    
-                    # Skip if we've already seen this exact citation
-                    if citation_key in self.citation_sources:
-                        continue
-                    
-                    # Add this citation key to our set of seen citations
-                    self.citation_sources.add(citation_key)
-                    
-                    self.citations.append({
-                        "text": str(doc),
-                        "source": "Unknown",
-                        "doc_id": "Unknown",
-                        "doc_type": "Unknown",
-                        "case_id": "Unknown",
-                        "tags": [],
-                        "page": 0,
-                        "chunk": 0
-                    })
+                    tags = split_tags(tags_str) if isinstance(tags_str, str) else ()
+                
+                # Skip if we've already seen this exact citation
+                if citation_key in citation_sources:
+                    if debug_messages is not None:
+                        debug_messages.append(f"Skipping duplicate citation: {citation_key}")
+                    continue
+                
+                # Add this citation key to our set of seen citations
+                citation_sources.add(citation_key)
+                
+                citations.append({"text": content, **fields, "tags": tags})
             except Exception as e:
                 # If anything goes wrong, add an error citation
-                if st.session_state.get("debug_mode", False):
-                    st.error(f"Error processing citation: {str(e)}")
+                if debug_messages is not None:
+                    debug_messages.append(f"Error processing citation: {str(e)}")
                 
                 # For errors, we still want to show unique errors
-                citation_key = f"error_{str(e)}"
+                citation_key = ("error", str(e))
                 
                 # Skip if we've already seen this exact error
-                if citation_key in self.citation_sources:
+                if citation_key in citation_sources:
                     continue
                 
                 # Add this citation key to our set of seen citations
-                self.citation_sources.add(citation_key)
+                citation_sources.add(citation_key)
                 
-                self.citations.append({
+                citations.append({
                     "text": f"[Error processing document: {str(e)}]",
                     "source": "Error",
                     "doc_id": "Error",
@@ -216,5 +157,4 @@ class CitationTrackingHandler(BaseCallbackHandler):
                     "chunk": 0
                 })
         
-        if st.session_state.get("debug_mode", False):
-            st.write(f"Total citations processed: {len(self.citations)}")
\ No newline at end of file
+        return citations, citation_sources
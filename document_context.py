@@ -12,7 +12,8 @@ def build_document_context_panel():
     
     # Toggle button for showing/hiding sources
     show_sources = st.toggle("Show Sources", value=st.session_state.show_sources)
-    st.session_state.show_sources = show_sources
+    if st.session_state.show_sources != show_sources:
+        st.session_state.show_sources = show_sources
     
     # Get unique citation sources from the last assistant message
     last_assistant_msg = next(
@@ -20,26 +21,29 @@ def build_document_context_panel():
         None
     )
     
-    if last_assistant_msg and last_assistant_msg.get("citations") and show_sources:
+    citations = last_assistant_msg.get("citations") if last_assistant_msg else None
+    
+    if citations and show_sources:
         # Show number of citations in debug mode
         if st.session_state.get("debug_mode", False):
-            st.write(f"Number of citations: {len(last_assistant_msg['citations'])}")
+            st.write(f"Number of citations: {len(citations)}")
         
         # Process citations
-        unique_sources = get_unique_sources_from_citations(last_assistant_msg['citations'])
+        unique_sources = get_unique_sources_from_citations(citations)
         
         if unique_sources:
             display_source_documents(unique_sources)
         else:
             st.info("No valid documents found in citations.")
-    elif last_assistant_msg and last_assistant_msg.get("citations") and not show_sources:
-        st.info(f"{len(get_unique_sources_from_citations(last_assistant_msg['citations']))} sources are hidden. Toggle 'Show Sources' to view them.")
+    elif citations and not show_sources:
+        st.info(f"{len(get_unique_sources_from_citations(citations))} sources are hidden. Toggle 'Show Sources' to view them.")
     else:
         st.info("No documents referenced in the current conversation.")
     
     # Add option to clear chat history
     if st.button("Clear Chat History"):
         st.session_state.chat_history = []
+        st.session_state.pending_questions = []
         st.rerun()
 
 def get_unique_sources_from_citations(citations):
@@ -50,7 +54,7 @@ def get_unique_sources_from_citations(citations):
         citations: List of citation objects
         
     Returns:
-        Dictionary of unique document sources
+        Dictionary of unique document sources keyed by (source, doc_id), in citation order
     """
     unique_sources = {}
     
@@ -62,8 +66,8 @@ def get_unique_sources_from_citations(citations):
         if source == "Unknown" or source == "Error":
             continue
             
-        # Use source + doc_id as the unique key to prevent duplicates
-        unique_key = f"{source}_{doc_id}"
+        # Use (source, doc_id) as the unique key to prevent duplicates
+        unique_key = (source, doc_id)
         
         if unique_key not in unique_sources:
             unique_sources[unique_key] = {
@@ -92,7 +96,7 @@ def display_source_documents(unique_sources):
                 st.markdown(format_tags_html(info["tags"]), unsafe_allow_html=True)
             
             # Get the full document text
-            doc = next((d for d in st.session_state.documents if d["id"] == info["doc_id"]), None)
+            doc = st.session_state.documents_by_id.get(info["doc_id"])
             if doc:
                 st.write(f"**Uploaded:** {doc['uploaded_at']}")
                 
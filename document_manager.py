@@ -1,7 +1,53 @@
 import streamlit as st
-import base64
 from datetime import datetime
 import io
+import functools
+import bisect
+import re
+import orjson
+from string import Template
+import pandas as pd
+import streamlit.components.v1 as components
+from utils import get_document_facets, get_page_texts
+from ui_components import paginate
+
+# Separator between pages in the search index; it can't occur in a search query
+PAGE_SEPARATOR = "\n\0\n"
+
+# Scrollable full-document view. Each page gets an empty placeholder sized by its
+# length, and its text is only put in the DOM once it scrolls near the viewport.
+FULL_DOCUMENT_TEMPLATE = Template("""
+<div id="document" style="height:480px;overflow-y:scroll;padding:10px;border:1px solid #ddd;border-radius:5px;font-family:sans-serif;">
+</div>
+<script>
+const pages = $pages_json;
+const container = document.getElementById("document");
+const observer = new IntersectionObserver((entries) => {
+    for (const entry of entries) {
+        const page = entry.target;
+        if (entry.isIntersecting && !page.dataset.loaded) {
+            const body = page.querySelector("div");
+            body.textContent = pages[page.dataset.page];
+            page.style.minHeight = "";
+            page.dataset.loaded = "1";
+            observer.unobserve(page);
+        }
+    }
+}, {root: container, rootMargin: "500px 0px"});
+pages.forEach((text, i) => {
+    const page = document.createElement("section");
+    page.dataset.page = i;
+    page.style.minHeight = Math.max(40, Math.ceil(text.length / 80) * 18) + "px";
+    const heading = document.createElement("h3");
+    heading.textContent = "Page " + (i + 1);
+    const body = document.createElement("div");
+    body.style.whiteSpace = "pre-wrap";
+    page.append(heading, body);
+    container.appendChild(page);
+    observer.observe(page);
+});
+</script>
+""")
 
 def build_document_manager():
     """
@@ -34,65 +80,105 @@ def document_library():
         return
     
     # Create filters
+    document_types, case_ids, all_tags, tag_counts = get_document_facets(st.session_state.documents)
     col1, col2, col3 = st.columns(3)
     
     with col1:
-        document_types = ["All Types"] + list(set(doc["type"] for doc in st.session_state.documents))
-        selected_type = st.selectbox("Document Type", document_types)
+        selected_type = st.selectbox("Document Type", ["All Types", *document_types])
     
     with col2:
-        case_ids = ["All Cases"] + list(set(doc["case_id"] for doc in st.session_state.documents if doc["case_id"]))
-        selected_case = st.selectbox("Case ID", case_ids)
+        selected_case = st.selectbox("Case ID", ["All Cases", *case_ids])
     
     with col3:
-        # Get all unique tags
-        all_tags = set()
-        for doc in st.session_state.documents:
-            if "tags" in doc and doc["tags"]:
-                all_tags.update(doc["tags"])
-        
-        selected_tag = st.selectbox("Filter by Tag", ["No Tag Filter"] + sorted(list(all_tags)))
-    
-    # Filter the documents based on selections
-    filtered_docs = []
-    for doc in st.session_state.documents:
-        type_match = selected_type == "All Types" or doc["type"] == selected_type
-        case_match = selected_case == "All Cases" or doc["case_id"] == selected_case
-        tag_match = selected_tag == "No Tag Filter" or (
-            "tags" in doc and selected_tag in doc["tags"]
+        selected_tag = st.selectbox(
+            "Filter by Tag",
+            ["No Tag Filter", *all_tags],
+            format_func=lambda tag: f"{tag} ({tag_counts[tag]})" if tag in tag_counts else tag
         )
-        
-        if type_match and case_match and tag_match:
-            filtered_docs.append(doc)
+    
+    # Filter the documents with vectorized masks over the library table
+    documents_df = get_documents_frame(st.session_state.documents)
+    mask = pd.Series(True, index=documents_df.index)
+    if selected_type != "All Types":
+        mask &= documents_df["type"] == selected_type
+    if selected_case != "All Cases":
+        mask &= documents_df["case_id"] == selected_case
+    if selected_tag != "No Tag Filter":
+        mask &= documents_df["tags"].map(lambda tags: selected_tag in tags)
+    filtered_df = documents_df[mask]
     
     # Display document count
-    st.write(f"Found {len(filtered_docs)} document(s)")
-    
-    # Display documents as cards
-    if filtered_docs:
-        for doc in filtered_docs:
-            with st.expander(f"{doc['title']} ({doc['type']})"):
-                # Document info
-                st.write(f"**Case ID:** {doc.get('case_id', 'N/A')}")
-                st.write(f"**Uploaded:** {doc.get('uploaded_at', 'Unknown')}")
-                if "tags" in doc and doc["tags"]:
-                    st.write(f"**Tags:** {', '.join(doc['tags'])}")
-                
-                # Action buttons
-                col1, col2, col3 = st.columns(3)
-                with col1:
-                    if st.button("View Document", key=f"view_{doc['id']}"):
-                        st.session_state.selected_doc_for_viewing = doc
-                        st.rerun()
-                
-                with col2:
-                    if st.button("Download", key=f"download_{doc['id']}"):
-                        download_document(doc)
-                
-                with col3:
-                    if st.button("History", key=f"history_{doc['id']}"):
-                        st.session_state.selected_doc_for_history = doc
-                        st.rerun()
+    st.write(f"Found {len(filtered_df)} document(s)")
+    
+    if filtered_df.empty:
+        return
+    
+    # One virtualized table instead of an expander and three buttons per document
+    selection = st.dataframe(
+        filtered_df,
+        hide_index=True,
+        use_container_width=True,
+        column_order=["title", "type", "case_id", "uploaded_at", "tags"],
+        column_config={
+            "title": "Title",
+            "type": "Type",
+            "case_id": "Case ID",
+            "uploaded_at": "Uploaded",
+            "tags": st.column_config.ListColumn("Tags")
+        },
+        on_select="rerun",
+        selection_mode="single-row",
+        key="document_library_table"
+    )
+    
+    # A selection can outlive a filter change, so ignore rows that no longer exist
+    selected_rows = [row for row in selection.selection.rows if row < len(filtered_df)]
+    if not selected_rows:
+        st.caption("Select a document in the table to view, download or see its history.")
+        return
+    
+    doc = st.session_state.documents_by_id[filtered_df.iloc[selected_rows[0]]["id"]]
+    
+    # Action buttons for the selected document
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        if st.button("View Document", key="library_view"):
+            st.session_state.selected_doc_for_viewing = doc
+            st.rerun()
+    
+    with col2:
+        if st.button("Prepare Download", key="library_download"):
+            download_document(doc)
+    
+    with col3:
+        if st.button("History", key="library_history"):
+            st.session_state.selected_doc_for_history = doc
+            st.rerun()
+
+def get_documents_frame(documents):
+    """
+    Get the document library as a DataFrame with one row per document
+    
+    Memoized on the displayed fields, so the frame is only rebuilt when a document
+    is added, removed or edited.
+    
+    Args:
+        documents: List of all documents
+        
+    Returns:
+        DataFrame with id, title, type, case_id, uploaded_at and tags columns
+    """
+    return _documents_frame_cached(tuple(
+        (doc["id"], doc["title"], doc["type"], doc.get("case_id", ""), doc.get("uploaded_at", ""), tuple(doc.get("tags") or ()))
+        for doc in documents
+    ))
+
+@functools.lru_cache(maxsize=8)
+def _documents_frame_cached(rows):
+    """Build the library DataFrame from row tuples"""
+    documents_df = pd.DataFrame(rows, columns=["id", "title", "type", "case_id", "uploaded_at", "tags"])
+    documents_df["tags"] = documents_df["tags"].map(list)
+    return documents_df
 
 def document_viewer():
     """
@@ -107,16 +193,13 @@ def document_viewer():
             st.info("No documents have been uploaded yet.")
             return
             
-        doc_options = [(doc["id"], doc["title"]) for doc in st.session_state.documents]
-        selected_option = st.selectbox("Select a document to view", 
-                                      options=doc_options, 
-                                      format_func=lambda x: x[1])
+        documents_by_id = st.session_state.documents_by_id
+        selected_doc_id = st.selectbox("Select a document to view", 
+                                      options=list(documents_by_id), 
+                                      format_func=lambda doc_id: documents_by_id[doc_id]["title"])
         
-        if selected_option:
-            doc_id = selected_option[0]
-            st.session_state.selected_doc_for_viewing = next(
-                (doc for doc in st.session_state.documents if doc["id"] == doc_id), None
-            )
+        if selected_doc_id:
+            st.session_state.selected_doc_for_viewing = documents_by_id.get(selected_doc_id)
             st.rerun()
         else:
             st.info("Please select a document to view.")
@@ -164,16 +247,13 @@ def document_history():
             st.info("No documents have been uploaded yet.")
             return
             
-        doc_options = [(doc["id"], doc["title"]) for doc in st.session_state.documents]
-        selected_option = st.selectbox("Select a document to view history", 
-                                      options=doc_options, 
-                                      format_func=lambda x: x[1])
+        documents_by_id = st.session_state.documents_by_id
+        selected_doc_id = st.selectbox("Select a document to view history", 
+                                      options=list(documents_by_id), 
+                                      format_func=lambda doc_id: documents_by_id[doc_id]["title"])
         
-        if selected_option:
-            doc_id = selected_option[0]
-            st.session_state.selected_doc_for_history = next(
-                (doc for doc in st.session_state.documents if doc["id"] == doc_id), None
-            )
+        if selected_doc_id:
+            st.session_state.selected_doc_for_history = documents_by_id.get(selected_doc_id)
             st.rerun()
         else:
             st.info("Please select a document to view history.")
@@ -250,62 +330,49 @@ def document_history():
 # Helper functions
 
 def download_document(doc):
-    """Provide a download link for a document"""
+    """Offer the document's text as a file download"""
     # For this demo, we'll create a text version of the document
     # In a real application, you would provide the original file
     
-    content = ""
-    
     # Extract text content from pages
-    for i, page in enumerate(doc.get("pages", [])):
-        content += f"--- Page {i+1} ---\n\n"
-        
-        if hasattr(page, 'page_content'):
-            content += page.page_content
-        elif isinstance(page, str):
-            content += page
-        elif isinstance(page, dict) and "page_content" in page:
-            content += page["page_content"]
-        else:
-            content += str(page)
-        
-        content += "\n\n"
+    content = "".join(
+        f"--- Page {i+1} ---\n\n{text}\n\n"
+        for i, text in enumerate(get_page_texts(doc))
+    )
     
-    # Create a download link
-    b64 = base64.b64encode(content.encode()).decode()
+    # The bytes are served by Streamlit's media endpoint instead of being inlined in the page
     filename = f"{doc['title'].replace(' ', '_')}.txt"
-    href = f'<a href="data:file/txt;base64,{b64}" download="{filename}">Download {filename}</a>'
-    st.markdown(href, unsafe_allow_html=True)
+    st.download_button(
+        f"Download {filename}",
+        data=content.encode(),
+        file_name=filename,
+        mime="text/plain",
+        key=f"download_file_{doc['id']}"
+    )
 
 def display_full_document(doc):
-    """Display the full document content"""
-    # Extract text content from pages
-    content = ""
+    """
+    Display the full document content
     
-    for i, page in enumerate(doc.get("pages", [])):
-        content += f"<h3>Page {i+1}</h3>\n\n"
-        
-        if hasattr(page, 'page_content'):
-            content += page.page_content
-        elif isinstance(page, str):
-            content += page
-        elif isinstance(page, dict) and "page_content" in page:
-            content += page["page_content"]
-        else:
-            content += str(page)
-        
-        content += "\n\n"
+    The page texts are sent to the browser once as a JSON array and only the
+    pages scrolled into view are rendered, so long documents don't put every
+    page into the DOM.
+    """
+    if "pages_json" not in doc:
+        # Escape "</" so page text can't close the script tag
+        doc["pages_json"] = orjson.dumps(get_page_texts(doc)).decode().replace("</", "<\\/")
     
     # Display in scrollable container
-    st.markdown(
-        f'<div style="height:500px;overflow-y:scroll;padding:10px;border:1px solid #ddd;border-radius:5px;">{content}</div>',
-        unsafe_allow_html=True
+    components.html(
+        FULL_DOCUMENT_TEMPLATE.substitute(pages_json=doc["pages_json"]),
+        height=500,
+        scrolling=False
     )
 
 def display_document_pages(doc):
     """Display document by pages with navigation"""
     # Page selector
-    pages = doc.get("pages", [])
+    pages = get_page_texts(doc)
     if not pages:
         st.warning("This document has no pages.")
         return
@@ -313,17 +380,7 @@ def display_document_pages(doc):
     page_number = st.slider("Page", 1, len(pages), 1)
     
     # Get the selected page (0-indexed)
-    page = pages[page_number - 1]
-    
-    # Extract text content
-    if hasattr(page, 'page_content'):
-        content = page.page_content
-    elif isinstance(page, str):
-        content = page
-    elif isinstance(page, dict) and "page_content" in page:
-        content = page["page_content"]
-    else:
-        content = str(page)
+    content = pages[page_number - 1]
     
     # Display the page content
     st.subheader(f"Page {page_number} of {len(pages)}")
@@ -347,55 +404,97 @@ def display_document_pages(doc):
                 st.session_state.page_number = page_number + 1
                 st.rerun()
 
+def get_search_index(doc):
+    """
+    Get the lower-cased, concatenated text of a document and the offset of each page in it
+    
+    Built on first search and kept on the document, so later searches are a
+    str.find over one string instead of lower-casing every page again.
+    
+    Returns:
+        Tuple of (lower-cased text, list of page start offsets)
+    """
+    if "search_index" not in doc:
+        page_starts = []
+        offset = 0
+        lowered_pages = []
+        for text in get_page_texts(doc):
+            lowered = text.lower()
+            page_starts.append(offset)
+            lowered_pages.append(lowered)
+            offset += len(lowered) + len(PAGE_SEPARATOR)
+        doc["search_index"] = (PAGE_SEPARATOR.join(lowered_pages), page_starts)
+    return doc["search_index"]
+
+@st.cache_data(max_entries=128, show_spinner=False)
+def find_passages(doc_id, search_query, _doc):
+    """
+    Find the first occurrence of a query on each page of a document
+    
+    Args:
+        doc_id: ID of the document, used with the query as the cache key
+        search_query: Text to search for (case-insensitive)
+        _doc: The document to search (excluded from the cache key)
+        
+    Returns:
+        List of result dicts with page number, highlighted snippet and page content
+    """
+    # Search the whole document at once, keeping the first occurrence on each page
+    results = []
+    page_texts = get_page_texts(_doc)
+    text_lower, page_starts = get_search_index(_doc)
+    query_lower = search_query.lower()
+    highlight_pattern = re.compile(re.escape(search_query), re.IGNORECASE)
+    
+    match = text_lower.find(query_lower)
+    while match != -1:
+        i = bisect.bisect_right(page_starts, match) - 1
+        content = page_texts[i]
+        pos = match - page_starts[i]
+        
+        # Continue from the start of the next page
+        if i + 1 < len(page_starts):
+            match = text_lower.find(query_lower, page_starts[i + 1])
+        else:
+            match = -1
+        
+        # Extract a snippet around the query (100 chars before and after)
+        start = max(0, pos - 100)
+        end = min(len(content), pos + len(search_query) + 100)
+        
+        # Extract the snippet
+        snippet = content[start:end]
+        
+        # Highlight every match in the snippet, keeping its original case
+        highlighted = highlight_pattern.sub(
+            r"<span style='background-color:yellow'>\g<0></span>",
+            snippet
+        )
+        
+        results.append({
+            "page": i + 1,
+            "snippet": highlighted,
+            "full_content": content
+        })
+    
+    return results
+
 def search_document_passage(doc):
     """Search for a specific passage in the document"""
-    # Search input
-    search_query = st.text_input("Search for passage", "")
+    # Search input; the form only reruns the app when the search is submitted
+    with st.form("passage_search_form"):
+        search_query = st.text_input("Search for passage", "")
+        st.form_submit_button("Search")
     
     if search_query:
-        # Search in all pages
-        results = []
-        
-        for i, page in enumerate(doc.get("pages", [])):
-            # Extract text content
-            if hasattr(page, 'page_content'):
-                content = page.page_content
-            elif isinstance(page, str):
-                content = page
-            elif isinstance(page, dict) and "page_content" in page:
-                content = page["page_content"]
-            else:
-                content = str(page)
-            
-            # Check if query is in content (case-insensitive)
-            if search_query.lower() in content.lower():
-                # Find the position of the query
-                pos = content.lower().find(search_query.lower())
-                
-                # Extract a snippet around the query (100 chars before and after)
-                start = max(0, pos - 100)
-                end = min(len(content), pos + len(search_query) + 100)
-                
-                # Extract the snippet
-                snippet = content[start:end]
-                
-                # Highlight the query in the snippet
-                highlighted = snippet.replace(
-                    search_query, 
-                    f"<span style='background-color:yellow'>{search_query}</span>"
-                )
-                
-                results.append({
-                    "page": i + 1,
-                    "snippet": highlighted,
-                    "full_content": content
-                })
+        results = find_passages(doc["id"], search_query, doc)
         
         # Display results
         if results:
             st.success(f"Found {len(results)} occurrences of '{search_query}'")
             
-            for i, result in enumerate(results):
+            page_results, start = paginate(results, key="passage_results_page")
+            for i, result in enumerate(page_results, start):
                 with st.expander(f"Result {i+1} (Page {result['page']})"):
                     st.markdown(f"<div>{result['snippet']}</div>", unsafe_allow_html=True)
                     
@@ -1,43 +1,80 @@
 import os
+import functools
+import hashlib
+import shutil
 import tempfile
 import uuid
 import time
+import streamlit as st
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
 # Document processing
 import PyPDF2
 import docx
-import pytesseract
 from PIL import Image
 import io
+import threading
+
+# PyMuPDF, used for single-pass PDF text extraction and page rendering when installed
+try:
+    import fitz
+except ImportError:
+    fitz = None
+
+# Pages are OCR'd in parallel, one per worker thread, so keep Tesseract itself
+# single-threaded instead of oversubscribing the cores (read when Tesseract starts)
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+# In-process Tesseract binding, used for OCR when installed
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+# OpenCV, used to binarize and deskew scanned images before OCR when installed
+try:
+    import cv2
+    import numpy as np
+except ImportError:
+    cv2 = None
 
 # Vector database and embeddings
-from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader, TextLoader
+from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader
 from langchain_core.documents import Document
+from utils import page_text, report
+
+# Prefix for temporary upload files, so leftovers can be cleaned up on exit
+TEMP_FILE_PREFIX = "docassistant_"
+
+# Per-thread tesserocr API instances
+_tesseract_local = threading.local()
+
+# Uploads are hashed and copied to disk in chunks of this size
+FILE_CHUNK_SIZE = 1024 * 1024
+
+# PDF pages whose text layer has at least this many non-whitespace characters are not OCR'd
+MIN_TEXT_LAYER_CHARS = 100
+
+# Zoom used when rendering PDF pages for OCR (1.5x of 72 DPI is 108 DPI)
+OCR_ZOOM = 1.5
 
 def extract_text_from_pdf(file):
     """Extract text from PDF using PyPDF2"""
     pdf_reader = PyPDF2.PdfReader(file)
-    text = ""
-    for page_num in range(len(pdf_reader.pages)):
-        text += pdf_reader.pages[page_num].extract_text() + "\n"
-    return text
+    return "".join((page.extract_text() or "") + "\n" for page in pdf_reader.pages)
 
 def extract_text_from_docx(file):
     """Extract text from DOCX using python-docx"""
     doc = docx.Document(file)
-    text = ""
-    for paragraph in doc.paragraphs:
-        text += paragraph.text + "\n"
-    return text
+    return "".join(paragraph.text + "\n" for paragraph in doc.paragraphs)
 
-def extract_text_from_image(file):
-    """Extract text from image using OCR"""
-    import streamlit as st
-    
-    # Check if OCR is enabled in session state
-    if not st.session_state.get("perform_ocr", False):
-        st.info("OCR is disabled. No text will be extracted from this image.")
+def extract_text_from_image(file, perform_ocr=None):
+    """Extract text from image using OCR (if enabled, by default in session state)"""
+    if perform_ocr is None:
+        perform_ocr = st.session_state.get("perform_ocr", False)
+    if not perform_ocr:
+        report("info", "OCR is disabled. No text will be extracted from this image.")
         return "OCR is disabled. No text was extracted from this image."
     
     image = Image.open(file)
@@ -45,12 +82,50 @@ def extract_text_from_image(file):
     # Preprocess the image for better OCR results
     # Convert to grayscale
     image = image.convert('L')
+    if cv2 is not None:
+        image = preprocess_scan(image)
     
     # Perform OCR
-    text = pytesseract.image_to_string(image)
+    text = ocr_page_image(image)
     
     return text
 
+def preprocess_scan(image):
+    """
+    Binarize (Otsu) and deskew a grayscale scan with OpenCV
+    
+    Clean black-on-white text is read faster and more accurately by Tesseract.
+    
+    Args:
+        image: Grayscale PIL image
+        
+    Returns:
+        Preprocessed PIL image
+    """
+    arr = np.asarray(image)
+    _, bw = cv2.threshold(arr, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    
+    # Estimate the skew from the bounding box of the dark (text) pixels
+    coords = cv2.findNonZero(255 - bw)
+    if coords is None:
+        return Image.fromarray(bw)
+    angle = cv2.minAreaRect(coords)[-1]
+    # minAreaRect reports angles in [0, 90) or [-90, 0) depending on the OpenCV version
+    if angle > 45:
+        angle -= 90
+    elif angle < -45:
+        angle += 90
+    if abs(angle) < 0.1:
+        return Image.fromarray(bw)
+    
+    height, width = bw.shape
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    deskewed = cv2.warpAffine(
+        bw, matrix, (width, height),
+        flags=cv2.INTER_NEAREST, borderMode=cv2.BORDER_CONSTANT, borderValue=255
+    )
+    return Image.fromarray(deskewed)
+
 def extract_text_from_file(file, file_extension):
     """Extract text from file based on its extension"""
     if file_extension == ".pdf":
@@ -64,156 +139,325 @@ def extract_text_from_file(file, file_extension):
     else:
         return None
 
-def process_document(uploaded_file, doc_type, case_id, doc_title, tags=[]):
-    """Process a document and extract its text and metadata"""
-    import streamlit as st
-    import gc
+@st.cache_resource(show_spinner=False)
+def get_ocr_executor():
+    """Process-wide thread pool for OCR, so per-thread Tesseract instances are reused"""
+    return ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="ocr")
+
+def get_tesseract_api():
+    """
+    Get this thread's in-process Tesseract instance
     
-    # Create a temporary file
-    tmp_path = None
+    PyTessBaseAPI isn't thread-safe, so each OCR thread keeps its own and the
+    language model is only loaded once per thread.
+    """
+    api = getattr(_tesseract_local, "api", None)
+    if api is None:
+        api = tesserocr.PyTessBaseAPI()
+        _tesseract_local.api = api
+    return api
+
+def ocr_page_image(image):
+    """
+    OCR a single page image
     
-    try:
-        # Create a named temporary file without auto-deletion
-        with tempfile.NamedTemporaryFile(delete=False, suffix=Path(uploaded_file.name).suffix) as tmp:
-            tmp.write(uploaded_file.getvalue())
-            tmp_path = tmp.name
-            # Make sure file is closed properly before proceeding
-            tmp.flush()
-            os.fsync(tmp.fileno())
+    Args:
+        image: PIL image, encoded image bytes, or a raw 8-bit grayscale/RGB buffer
+            as a (samples, width, height, bytes per pixel, stride) tuple
         
-        # Extract text based on file type
-        file_extension = Path(uploaded_file.name).suffix.lower()
+    Returns:
+        Text found in the image
+    """
+    if isinstance(image, tuple):
+        samples, width, height, bytes_per_pixel, stride = image
+        if tesserocr is not None:
+            # Hand the raw pixels straight to Tesseract, with no image codec in between
+            api = get_tesseract_api()
+            api.SetImageBytes(samples, width, height, bytes_per_pixel, stride)
+            return api.GetUTF8Text()
+        mode = "L" if bytes_per_pixel == 1 else "RGB"
+        image = Image.frombuffer(mode, (width, height), samples, "raw", mode, stride, 1)
+    elif isinstance(image, bytes):
+        image = Image.open(io.BytesIO(image))
+    
+    # Prefer the in-process binding over running the tesseract binary per page
+    if tesserocr is not None:
+        api = get_tesseract_api()
+        api.SetImage(image)
+        return api.GetUTF8Text()
+    
+    # Imported on first OCR, so uploads that never need OCR don't load it
+    import pytesseract
+    return pytesseract.image_to_string(image)
+
+def ocr_page_images(page_images):
+    """
+    OCR page images concurrently and label the text found on each page
+    
+    Tesseract releases the GIL (and pytesseract runs it as a subprocess), so
+    worker threads OCR pages in parallel.
+    Pages are submitted as the iterable yields them, so rendering the next page
+    overlaps with OCR of the previous ones.
+    
+    Args:
+        page_images: Iterable of (page number, page image) pairs in page order
         
-        # Ensure the file exists before proceeding
-        if not os.path.exists(tmp_path):
-            st.error(f"Temporary file {tmp_path} does not exist.")
-            return None
-            
-        # Force garbage collection to clean up any lingering file handles
-        gc.collect()
+    Returns:
+        OCR text with a page marker before each page that had text
+    """
+    executor = get_ocr_executor()
+    futures = [(page_num, executor.submit(ocr_page_image, image)) for page_num, image in page_images]
+    page_texts = [(page_num, future.result()) for page_num, future in futures]
+    
+    return "".join(
+        f"\n\n[OCR from page {page_num}]:\n{page_text}"
+        for page_num, page_text in page_texts
+        if page_text.strip()
+    )
+
+def has_text_layer(page_text):
+    """Check whether a PDF page's embedded text is enough to skip OCR"""
+    return len("".join(page_text.split())) >= MIN_TEXT_LAYER_CHARS
+
+def extract_pdf_with_pymupdf(pdf_path, file_name, perform_ocr):
+    """
+    Extract a PDF's text layer with PyMuPDF, OCR'ing scanned pages in the same pass
+    
+    Args:
+        pdf_path: Path to the PDF file
+        file_name: Original file name, used as the pages' source
+        perform_ocr: Whether to OCR pages without a usable text layer
         
-        if file_extension == ".pdf":
-            # Check if OCR should be used on PDF
-            perform_ocr = st.session_state.get("perform_ocr", False)
-            
-            loader = PyPDFLoader(tmp_path)
-            pages = loader.load_and_split()
-            text = "\n".join([page.page_content for page in pages])
-            
-            # Only perform OCR on PDF pages if OCR is enabled
-            if perform_ocr:
-                st.info("Processing PDF with OCR enabled.")
-                try:
-                    # Try to use PyMuPDF for PDF page rendering and OCR
-                    try:
-                        import fitz  # PyMuPDF
-                        ocr_text = ""
-                        pdf_document = fitz.open(tmp_path)
-                        
-                        for page_num in range(len(pdf_document)):
-                            page = pdf_document[page_num]
-                            # Convert page to image
-                            pix = page.get_pixmap(matrix=fitz.Matrix(2.0, 2.0))  # 2x zoom for better OCR
-                            img_bytes = pix.pil_tobytes(format="PNG")
-                            img = Image.open(io.BytesIO(img_bytes))
-                            
-                            # Perform OCR on the page image
-                            page_text = pytesseract.image_to_string(img)
-                            if page_text.strip():
-                                ocr_text += f"\n\n[OCR from page {page_num+1}]:\n{page_text}"
-                        
-                        # Add OCR text to the document text if any was found
-                        if ocr_text.strip():
-                            text += "\n\n[OCR TEXT FROM PDF PAGES]\n" + ocr_text
-                        
-                        # Make sure to close the PDF document
-                        pdf_document.close()
-                            
-                    except ImportError:
-                        # If PyMuPDF is not installed, fallback to simpler method
-                        st.info("PyMuPDF (fitz) not installed. Using fallback OCR method for PDFs.")
-                        # Use pdf2image as an alternative if available
-                        try:
-                            from pdf2image import convert_from_path
-                            images = convert_from_path(tmp_path)
-                            ocr_text = ""
-                            
-                            for i, image in enumerate(images):
-                                page_text = pytesseract.image_to_string(image)
-                                if page_text.strip():
-                                    ocr_text += f"\n\n[OCR from page {i+1}]:\n{page_text}"
-                            
-                            if ocr_text.strip():
-                                text += "\n\n[OCR TEXT FROM PDF PAGES]\n" + ocr_text
-                        except ImportError:
-                            st.warning("Neither PyMuPDF nor pdf2image are installed. OCR for PDF pages skipped.")
-                    
-                except Exception as e:
-                    st.warning(f"Error performing OCR on PDF: {str(e)}")
-            else:
-                st.info("Processing PDF with OCR disabled. Text will be extracted only from text layers.")
-                
-        elif file_extension in [".docx", ".doc"]:
-            loader = Docx2txtLoader(tmp_path)
-            pages = loader.load_and_split()
-            text = "\n".join([page.page_content for page in pages])
-        elif file_extension == ".txt":
-            loader = TextLoader(tmp_path)
-            pages = loader.load_and_split()
-            text = "\n".join([page.page_content for page in pages])
-        elif file_extension in [".jpg", ".jpeg", ".png"]:
-            # For images, check if OCR is enabled
-            if st.session_state.get("perform_ocr", False):
-                text = extract_text_from_image(tmp_path)
-                st.info(f"OCR extracted {len(text.split())} words from image.")
-            else:
-                text = "OCR is disabled. No text was extracted from this image."
-                st.warning("OCR is disabled. No text was extracted from this image.")
+    Returns:
+        Tuple of (text, list of one Document per page)
+    """
+    pages = []
+    zoom = fitz.Matrix(OCR_ZOOM, OCR_ZOOM)
+    
+    def scanned_page_images(pdf_document):
+        # Pages are read here one at a time (fitz documents aren't thread-safe),
+        # while scanned pages rendered earlier are already being OCR'd
+        for page_num, page in enumerate(pdf_document, 1):
+            page_text = page.get_text("text")
+            pages.append(Document(page_content=page_text, metadata={"source": file_name, "page": page_num - 1}))
+            if perform_ocr and not has_text_layer(page_text):
+                # Render straight to raw grayscale pixels; OCR doesn't need colour or PNG encoding
+                pix = page.get_pixmap(matrix=zoom, colorspace=fitz.csGRAY, alpha=False)
+                yield page_num, (pix.samples, pix.width, pix.height, pix.n, pix.stride)
+    
+    with fitz.open(pdf_path) as pdf_document:
+        try:
+            ocr_text = ocr_page_images(scanned_page_images(pdf_document))
+        except Exception as e:
+            report("warning", f"Error performing OCR on PDF: {str(e)}")
+            # Keep the text layer of every page even though OCR failed part way
+            ocr_text = ""
+            pages = [
+                Document(page_content=page.get_text("text"), metadata={"source": file_name, "page": page_num})
+                for page_num, page in enumerate(pdf_document)
+            ]
+    
+    text = "\n".join(page.page_content for page in pages)
+    # Add OCR text to the document text if any was found
+    if ocr_text.strip():
+        text += "\n\n[OCR TEXT FROM PDF PAGES]\n" + ocr_text
+    
+    return text, pages
+
+def extract_pdf_with_pypdf(pdf_path, perform_ocr):
+    """
+    Extract a PDF's text with PyPDFLoader, used when PyMuPDF isn't installed
+    
+    Args:
+        pdf_path: Path to the PDF file
+        perform_ocr: Whether to OCR every page with pdf2image
+        
+    Returns:
+        Tuple of (text, list of Documents)
+    """
+    loader = PyPDFLoader(pdf_path)
+    pages = loader.load()
+    text = "\n".join([page.page_content for page in pages])
+    
+    # Only perform OCR on PDF pages if OCR is enabled
+    if perform_ocr:
+        report("info", "PyMuPDF (fitz) not installed. Using fallback OCR method for PDFs.")
+        # Use pdf2image as an alternative if available
+        try:
+            from pdf2image import convert_from_path
+            ocr_text = ocr_page_images(enumerate(convert_from_path(pdf_path), 1))
             
-            # Create a proper document object instead of just a string
-            from langchain_core.documents import Document
-            pages = [Document(page_content=text, metadata={"source": uploaded_file.name, "page": 0})]
+            if ocr_text.strip():
+                text += "\n\n[OCR TEXT FROM PDF PAGES]\n" + ocr_text
+        except ImportError:
+            report("warning", "Neither PyMuPDF nor pdf2image are installed. OCR for PDF pages skipped.")
+        except Exception as e:
+            report("warning", f"Error performing OCR on PDF: {str(e)}")
+    
+    return text, pages
+
+def hash_file(file):
+    """Hash a file-like object or a file path in chunks, without reading the whole file"""
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, "rb") as f:
+            return hash_file(f)
+    
+    hasher = hashlib.blake2b()
+    file.seek(0)
+    while chunk := file.read(FILE_CHUNK_SIZE):
+        hasher.update(chunk)
+    file.seek(0)
+    return hasher.hexdigest()
+
+def spool_to_temp_file(file, suffix=""):
+    """
+    Copy a file-like object to a temporary file on disk in chunks
+    
+    The caller is responsible for deleting the file (see safely_delete_temp_file).
+    
+    Args:
+        file: File-like object, e.g. a Streamlit UploadedFile
+        suffix: Suffix for the temporary file name, e.g. the file extension
+        
+    Returns:
+        Path of the temporary file
+    """
+    with tempfile.NamedTemporaryFile(delete=False, prefix=TEMP_FILE_PREFIX, suffix=suffix) as tmp:
+        file.seek(0)
+        shutil.copyfileobj(file, tmp, FILE_CHUNK_SIZE)
+    return tmp.name
+
+def process_document(uploaded_file, doc_type, case_id, doc_title, tags=[], file_name=None, perform_ocr=None):
+    """
+    Process a document and extract its text and metadata
+    
+    Status messages go through utils.report, so a worker thread can collect them
+    (see utils.collect_messages).
+    
+    Args:
+        uploaded_file: Uploaded file object, or the path of a file already on disk
+        doc_type: Document type
+        case_id: Case ID
+        doc_title: Title, defaulting to the file name
+        tags: List of tags
+        file_name: Original file name (defaults to the uploaded file's name)
+        perform_ocr: Whether to OCR images and scanned pages (defaults to the session's setting)
+        
+    Returns:
+        Document dictionary, or None if processing failed
+    """
+    tmp_path = None
+    if perform_ocr is None:
+        perform_ocr = st.session_state.get("perform_ocr", False)
+    
+    try:
+        if isinstance(uploaded_file, (str, os.PathLike)):
+            file_path = uploaded_file
+            file_name = file_name or Path(file_path).name
         else:
-            st.error(f"Unsupported file format: {file_extension}")
-            safely_delete_temp_file(tmp_path)
+            # Extractors read from disk (PyMuPDF maps the file instead of loading it)
+            file_name = file_name or uploaded_file.name
+            file_path = tmp_path = spool_to_temp_file(uploaded_file, Path(file_name).suffix.lower())
+        file_extension = Path(file_name).suffix.lower()
+        
+        # Identical uploads share one extraction (and OCR) pass
+        file_hash = hash_file(file_path)
+        extracted = extract_document_content(
+            file_hash,
+            file_extension,
+            file_name,
+            perform_ocr,
+            file_path
+        )
+        if extracted is None:
             return None
-            
-        # Clean up the temporary file
-        safely_delete_temp_file(tmp_path)
+        text, pages = extracted
         
         # Create document object
         doc_id = str(uuid.uuid4())
         document = {
             "id": doc_id,
-            "title": doc_title or uploaded_file.name,
+            "title": doc_title or file_name,
             "type": doc_type,
             "case_id": case_id,
             "text": text,
-            "filename": uploaded_file.name,
+            "filename": file_name,
             "uploaded_at": time.strftime("%Y-%m-%d %H:%M:%S"),
             "pages": pages,
+            "page_texts": [page_text(page) for page in pages],
             "tags": tags
         }
         
         return document
         
     except Exception as e:
-        st.error(f"Error processing document: {str(e)}")
+        report("error", f"Error processing document: {str(e)}")
+        return None
+    finally:
+        # Clean up the temporary file
         if tmp_path:
             safely_delete_temp_file(tmp_path)
+
+@st.cache_data(show_spinner=False, ttl=24 * 3600)
+def extract_document_content(file_hash, file_extension, file_name, perform_ocr, _file_path):
+    """
+    Extract the text and pages of an uploaded file, cached by the file's content hash
+    
+    Args:
+        file_hash: Hash of the file bytes, used as the cache key
+        file_extension: Lower-case file extension, including the dot
+        file_name: Original file name, used as the source of image and PDF pages
+        perform_ocr: Whether to OCR images and PDF pages
+        _file_path: Path of the file on disk (excluded from the cache key)
+        
+    Returns:
+        Tuple of (text, pages), or None if the file format is unsupported
+    """
+    if file_extension == ".pdf":
+        if perform_ocr:
+            report("info", "Processing PDF with OCR enabled.")
+        else:
+            report("info", "Processing PDF with OCR disabled. Text will be extracted only from text layers.")
+    
+        if fitz is not None:
+            text, pages = extract_pdf_with_pymupdf(_file_path, file_name, perform_ocr)
+        else:
+            text, pages = extract_pdf_with_pypdf(_file_path, perform_ocr)
+    
+    elif file_extension in [".docx", ".doc"]:
+        loader = Docx2txtLoader(_file_path)
+        pages = loader.load()
+        text = "\n".join([page.page_content for page in pages])
+    elif file_extension == ".txt":
+        # Plain text needs no loader: the whole file is one page
+        text = Path(_file_path).read_text(encoding="utf-8", errors="replace")
+        pages = [Document(page_content=text, metadata={"source": file_name, "page": 0})]
+    elif file_extension in [".jpg", ".jpeg", ".png"]:
+        # For images, check if OCR is enabled
+        if perform_ocr:
+            text = extract_text_from_image(_file_path, perform_ocr)
+            report("info", f"OCR extracted {len(text.split())} words from image.")
+        else:
+            text = "OCR is disabled. No text was extracted from this image."
+            report("warning", "OCR is disabled. No text was extracted from this image.")
+    
+        # Create a proper document object instead of just a string
+        pages = [Document(page_content=text, metadata={"source": file_name, "page": 0})]
+    else:
+        report("error", f"Unsupported file format: {file_extension}")
         return None
+    
+    return text, pages
 
 def safely_delete_temp_file(tmp_path):
     """Safely delete a temporary file with error handling"""
-    import streamlit as st
-    
     if not tmp_path or not os.path.exists(tmp_path):
         return
         
     try:
         os.unlink(tmp_path)
     except PermissionError as e:
-        st.warning(f"Could not delete temporary file {tmp_path}. It will be cleaned up later.")
+        report("warning", f"Could not delete temporary file {tmp_path}. It will be cleaned up later.")
         # Schedule file for deletion on Windows when process exits
         try:
             import atexit
@@ -227,17 +471,21 @@ def safely_delete_temp_file(tmp_path):
         except:
             pass
     except Exception as e:
-        st.warning(f"Error deleting temporary file: {str(e)}")
+        report("warning", f"Error deleting temporary file: {str(e)}")
 
 def parse_tags(tags_input):
     """Parse tags from comma-separated string"""
     if not tags_input:
         return []
     
+    # Return a fresh list, since callers store and edit the tags they get back
+    return list(_parse_tags_cached(tags_input))
+
+@functools.lru_cache(maxsize=512)
+def _parse_tags_cached(tags_input):
+    """Split and clean a tags string (memoized, as the inputs are re-parsed on every rerun)"""
     # Split by comma and clean whitespace
-    tags = [tag.strip() for tag in tags_input.split(',')]
+    tags = (tag.strip() for tag in tags_input.split(','))
     
     # Remove empty tags
-    tags = [tag for tag in tags if tag]
-    
-    return tags
\ No newline at end of file
+    return tuple(tag for tag in tags if tag)
\ No newline at end of file
@@ -0,0 +1,70 @@
+import threading
+import numpy as np
+
+class QueryCache:
+    """
+    Bounded semantic cache mapping query embeddings to retrieval results.
+    
+    Embeddings are stored L2-normalised in one preallocated float32 matrix, so a
+    lookup is a single matrix-vector product. When the cache is full the oldest
+    entry is overwritten.
+    """
+    def __init__(self, max_entries=1000, threshold=0.95):
+        """
+        Initialize the query cache
+        
+        Args:
+            max_entries: Maximum number of cached queries
+            threshold: Minimum cosine similarity for a cache hit
+        """
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self._matrix = None
+        self._results = [None] * max_entries
+        self._count = 0
+        self._next = 0
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _normalize(embedding):
+        """Convert an embedding to a unit-length float32 vector"""
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+    
+    def lookup(self, embedding):
+        """
+        Find the results of a previously seen, semantically similar query
+        
+        Args:
+            embedding: Query embedding
+            
+        Returns:
+            Cached results, or None on a miss
+        """
+        query = self._normalize(embedding)
+        with self._lock:
+            if not self._count:
+                return None
+            similarities = self._matrix[:self._count] @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.threshold:
+                return self._results[best]
+        return None
+    
+    def insert(self, embedding, results):
+        """
+        Cache the results for a query
+        
+        Args:
+            embedding: Query embedding
+            results: Retrieval results to return for similar queries
+        """
+        query = self._normalize(embedding)
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = np.zeros((self.max_entries, query.shape[0]), dtype=np.float32)
+            self._matrix[self._next] = query
+            self._results[self._next] = results
+            self._next = (self._next + 1) % self.max_entries
+            self._count = min(self._count + 1, self.max_entries)
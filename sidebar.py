@@ -1,17 +1,36 @@
 import streamlit as st
 import os
-import pytesseract
-from document_processing import process_document, parse_tags
-from vector_store import initialize_vectorstore
-from utils import format_tags_html, add_tags_to_document, remove_tag_from_document, debug_document_format, test_retriever_functionality
+import functools
+import logging
+import pandas as pd
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from document_processing import process_document, parse_tags, spool_to_temp_file, safely_delete_temp_file
+from utils import (format_tags_html, debug_document_format, test_retriever_functionality, warm_openai_connection,
+                   collect_messages, show_messages)
 from sidebar_components import (document_uploader, document_list, ocr_settings, 
-                               tag_manager, storage_settings)
+                               tag_manager, storage_settings, sync_vectorstore, get_embedding_model_setting,
+                               get_vectorstore_options, set_rebuilt_vectorstore)
 from document_manager import build_document_manager
+from vector_store import EMBEDDING_MODELS, DEFAULT_EMBEDDING_MODEL, initialize_vectorstore, prefetch_embeddings, get_embeddings, can_embed, get_pinecone_client, list_pinecone_indexes, get_pinecone_vector_count, faiss
+
+logger = logging.getLogger(__name__)
+
+# Uploads processed at once in the background, and how often the sidebar checks on them
+UPLOAD_WORKERS = 4
+UPLOAD_POLL_SECONDS = 2
 
-# Update the build_sidebar function to include the new document manager
-# Update the build_sidebar function to remove Vector DB Management
 def build_sidebar():
-    """Build the sidebar interface with document management and settings"""
+    """
+    Build the sidebar interface with document management and settings
+    
+    The settings panels and document management are fragments, so their widgets
+    only rerun their own panel instead of the whole app.
+    """
+    # Warm the shared connection pool before the first upload or question needs it
+    if os.environ.get("OPENAI_API_KEY"):
+        warm_openai_connection(os.environ["OPENAI_API_KEY"])
+    
     with st.sidebar:
         # For authenticated users, show firm name if available
         if st.session_state.get('current_user') and st.session_state.current_user.get('firm_name'):
@@ -19,6 +38,10 @@ def build_sidebar():
         else:
             st.header("Legal Document AI Assistant")
         
+        # A background rebuild shows its progress above every tab
+        finish_pending_rebuild()
+        pending_rebuild_status()
+        
         # Tabs for sidebar content - removed Vector DB Management
         sidebar_tabs = ["Document Management", "Document Explorer", "Settings"]
         selected_tab = st.radio("Select tab", sidebar_tabs)
@@ -38,73 +61,261 @@ def build_sidebar():
         elif selected_tab == "Settings":
             build_settings_panel()
 
+@st.fragment
 def build_document_management():
     """Build the document management interface in the sidebar"""
     st.markdown("### Upload Documents")
     
-    # Document upload section
-    doc_type, case_id, doc_title, tags, uploaded_file = document_uploader()
+    # Pick up uploads that finished processing in the background
+    finish_pending_uploads()
     
-    # OCR settings
-    ocr_settings()
+    # The upload inputs are a form, so typing in them doesn't rerun anything until submit
+    with st.form("upload_form", clear_on_submit=True):
+        # Document upload section
+        doc_type, case_id, doc_title, tags, uploaded_file = document_uploader()
+        
+        # OCR settings
+        ocr_settings()
+        
+        # Process document button
+        submitted = st.form_submit_button("Process Document")
     
-    # Process document button
-    if uploaded_file is not None:
-        if st.button("Process Document"):
+    if submitted:
+        if uploaded_file is not None:
             process_uploaded_document(uploaded_file, doc_type, case_id, doc_title, tags)
+        else:
+            st.warning("Choose a document to upload first.")
+    
+    pending_uploads_status()
     
     # Show uploaded documents
     if st.session_state.documents:
         document_list()
 
 def process_uploaded_document(uploaded_file, doc_type, case_id, doc_title, tags):
-    """Process an uploaded document and add it to the knowledge base"""
-    with st.spinner("Processing document..."):
-        document = process_document(uploaded_file, doc_type, case_id, doc_title, tags)
+    """Start processing an uploaded document in the background"""
+    # Spool the upload to disk now, so the worker reads the file rather than the upload buffer
+    tmp_path = spool_to_temp_file(uploaded_file, Path(uploaded_file.name).suffix.lower())
+    
+    # The worker can't read session state or render elements, so it gets the settings it needs
+    # here and hands its messages back; the embedding model is loaded here, with its spinner
+    embedding_model = get_embedding_model_setting()
+    if can_embed(embedding_model):
+        get_embeddings(embedding_model)
+    future = get_upload_executor().submit(
+        process_spooled_upload, tmp_path, uploaded_file.name, doc_type, case_id, doc_title, tags,
+        embedding_model, st.session_state.get("perform_ocr", False)
+    )
+    st.session_state.setdefault("pending_uploads", []).append((future, doc_title or uploaded_file.name))
+    st.info(f"Processing {doc_title or uploaded_file.name} in the background...")
+
+@st.cache_resource
+def get_upload_executor():
+    """Process-wide thread pool that extracts uploaded documents off the script thread"""
+    return ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix="upload")
+
+def process_spooled_upload(tmp_path, file_name, doc_type, case_id, doc_title, tags, embedding_model, perform_ocr):
+    """
+    Process an upload spooled to a temporary file, deleting the file afterwards
+    
+    Runs on an upload worker, which can't render Streamlit elements, so status
+    messages are collected and returned for the script thread to show. The
+    document's chunks are embedded here as well, so adding it to the vector
+    store on the script thread only reads the embedding cache.
+    
+    Returns:
+        Tuple of (document dictionary or None, list of collected messages)
+    """
+    with collect_messages() as messages:
+        try:
+            document = process_document(tmp_path, doc_type, case_id, doc_title, tags, file_name=file_name,
+                                        perform_ocr=perform_ocr)
+        finally:
+            safely_delete_temp_file(tmp_path)
         
         if document:
-            # Add user information to document metadata
-            if st.session_state.get('current_user'):
-                document['uploaded_by'] = st.session_state.current_user['username']
-                document['uploaded_by_name'] = st.session_state.current_user['full_name']
+            prefetch_embeddings([document], embedding_model)
+    return document, messages
+
+@st.fragment(run_every=UPLOAD_POLL_SECONDS)
+def pending_uploads_status():
+    """Show uploads still being processed, rerunning the app once any of them finishes"""
+    pending = st.session_state.get("pending_uploads", [])
+    if not pending:
+        return
+    
+    if any(future.done() for future, _ in pending):
+        st.rerun()
+    
+    st.info(f"Processing {len(pending)} document(s): {', '.join(title for _, title in pending)}")
+
+def start_background_rebuild():
+    """Rebuild the vector store on the upload pool, so the app stays usable meanwhile"""
+    documents = list(st.session_state.documents)
+    options = get_vectorstore_options()
+    progress = {"embedded": 0, "total": 0}
+    messages = []
+    
+    def update_progress(embedded, total):
+        progress["embedded"], progress["total"] = embedded, total
+    
+    # Load the embedding model here, where its loading spinner can be shown
+    if can_embed(options["embedding_model"]):
+        get_embeddings(options["embedding_model"])
+    
+    future = get_upload_executor().submit(
+        build_vectorstore_quietly, documents, options, update_progress, messages,
+        st.session_state.get("debug_mode", False)
+    )
+    st.session_state.pending_rebuild = (future, progress, messages, documents, options["embedding_model"])
+
+def build_vectorstore_quietly(documents, options, progress_callback, messages, debug_mode):
+    """
+    Build a vector store on a worker thread, which can't render Streamlit elements
+    
+    Status messages are appended to messages instead, for the script thread to show.
+    
+    Returns:
+        The new vector store, or None if it could not be created
+    """
+    with collect_messages(messages):
+        return initialize_vectorstore(documents, progress_callback=progress_callback, debug_mode=debug_mode, **options)
+
+@st.fragment(run_every=UPLOAD_POLL_SECONDS)
+def pending_rebuild_status():
+    """Show the progress of a background rebuild, rerunning the app once it finishes"""
+    pending = st.session_state.get("pending_rebuild")
+    if pending is None:
+        return
+    
+    future, progress, messages, _, _ = pending
+    if future.done():
+        st.rerun()
+    
+    with st.status("Rebuilding vector store...", expanded=True):
+        show_messages(list(messages))
+        if progress["total"]:
+            st.progress(
+                progress["embedded"] / progress["total"],
+                text=f"Embedded {progress['embedded']}/{progress['total']} chunks"
+            )
+        else:
+            st.write("Splitting documents into chunks...")
+
+def finish_pending_rebuild():
+    """
+    Switch to the vector store built in the background once it's ready
+    
+    Document changes made while it was being built were held back from the
+    stores (see sync_vectorstore) and are then applied to it in place.
+    """
+    pending = st.session_state.get("pending_rebuild")
+    if pending is None or not pending[0].done():
+        return
+    st.session_state.pending_rebuild = None
+    
+    future, _, messages, documents, embedding_model = pending
+    try:
+        vectorstore = future.result()
+    except Exception as e:
+        st.error(f"Error rebuilding vector store: {str(e)}")
+        # The old store is kept, so it gets the changes held back meanwhile
+        apply_deferred_changes(documents)
+        return
+    finally:
+        show_messages(messages)
+    
+    set_rebuilt_vectorstore(vectorstore, embedding_model)
+    if not vectorstore:
+        st.session_state.pop("deferred_sync", None)
+        st.error("Failed to rebuild vector store. Check settings and try again.")
+        return
+    
+    apply_deferred_changes(documents)
+    st.success("Vector store rebuilt successfully!")
+
+def apply_deferred_changes(rebuilt_documents):
+    """
+    Apply the document changes made during a background rebuild to the current store
+    
+    Args:
+        rebuilt_documents: Documents the rebuild started from
+    """
+    deferred = st.session_state.pop("deferred_sync", None) or {"upserted": set(), "deleted": set(), "retagged": set()}
+    documents_by_id = st.session_state.documents_by_id
+    rebuilt_ids = {doc["id"] for doc in rebuilt_documents}
+    
+    deleted_ids = (rebuilt_ids | deferred["deleted"]) - documents_by_id.keys()
+    upserted_ids = (documents_by_id.keys() - rebuilt_ids) | (deferred["upserted"] & documents_by_id.keys())
+    retagged_ids = (deferred["retagged"] & documents_by_id.keys()) - upserted_ids
+    if deleted_ids or upserted_ids or retagged_ids:
+        sync_vectorstore(
+            upserted=[documents_by_id[doc_id] for doc_id in upserted_ids],
+            deleted_ids=list(deleted_ids),
+            retagged=[documents_by_id[doc_id] for doc_id in retagged_ids]
+        )
+
+def finish_pending_uploads():
+    """
+    Add finished background uploads to the knowledge base
+    
+    Documents that finished since the last rerun are embedded together in one
+    vector store update.
+    """
+    pending = st.session_state.get("pending_uploads", [])
+    finished = [(future, title) for future, title in pending if future.done()]
+    if not finished:
+        return
+    st.session_state.pending_uploads = [(future, title) for future, title in pending if not future.done()]
+    
+    new_documents = []
+    for future, title in finished:
+        try:
+            document, messages = future.result()
+        except Exception as e:
+            st.error(f"Error processing {title}: {str(e)}")
+            continue
+        show_messages(messages)
+        
+        if not document:
+            st.error(f"Failed to process {title}")
+            continue
+        
+        # Add user information to document metadata
+        if st.session_state.get('current_user'):
+            document['uploaded_by'] = st.session_state.current_user['username']
+            document['uploaded_by_name'] = st.session_state.current_user['full_name']
+        
+        st.session_state.documents.append(document)
+        st.session_state.documents_by_id[document["id"]] = document
+        new_documents.append(document)
+        st.success(f"Successfully processed {document['title']}")
+    
+    if not new_documents:
+        return
+    
+    # Add the new documents' chunks to the vectorstore
+    try:
+        with st.spinner("Updating knowledge base..."):
+            # Debug mode - show document format if there's an issue
+            debug_mode = st.session_state.get("debug_mode", False)
+            if debug_mode:
+                st.write("### Document Format Debug")
+                debug_document_format(st.session_state.documents)
             
-            st.session_state.documents.append(document)
-            st.success(f"Successfully processed {document['title']}")
+            # Only the new documents are embedded; a store is built if there isn't one yet
+            sync_vectorstore(upserted=new_documents)
             
-            # Reinitialize vectorstore
-            try:
-                with st.spinner("Updating knowledge base..."):
-                    # Debug mode - show document format if there's an issue
-                    debug_mode = st.session_state.get("debug_mode", False)
-                    if debug_mode:
-                        st.write("### Document Format Debug")
-                        debug_document_format(st.session_state.documents)
-                    
-                    # Get vectorstore settings
-                    vectorstore_type = st.session_state.get("vectorstore_type", "chroma")
-                    use_in_memory = True  # Always use in-memory for Chroma
-                    pinecone_index = st.session_state.get("pinecone_index", None)
-                    
-                    # Initialize vector store with appropriate settings
-                    st.session_state.vectorstore = initialize_vectorstore(
-                        st.session_state.documents, 
-                        use_in_memory=use_in_memory,
-                        vectorstore_type=vectorstore_type,
-                        pinecone_index=pinecone_index
-                    )
-                    
-                    if st.session_state.vectorstore:
-                        st.success("Knowledge base updated!")
-                    else:
-                        st.error("Failed to create vector store. Check settings and try again.")
-            except Exception as e:
-                st.error(f"Error updating knowledge base: {str(e)}")
-                
-                # Enable debug mode automatically when there's an error
-                st.session_state.debug_mode = True
-                st.warning("Debug mode enabled. Please try again to see document format details.")
-        else:
-            st.error("Failed to process document")
+            if st.session_state.vectorstore:
+                st.success("Knowledge base updated!")
+            else:
+                st.error("Failed to create vector store. Check settings and try again.")
+    except Exception as e:
+        st.error(f"Error updating knowledge base: {str(e)}")
+        
+        # Enable debug mode automatically when there's an error
+        st.session_state.debug_mode = True
+        st.warning("Debug mode enabled. Please try again to see document format details.")
 
 def build_settings_panel():
     """Build the settings panel in the sidebar"""
@@ -130,7 +341,10 @@ def build_settings_panel():
             help="Path to tesseract.exe (Windows only)"
         )
         if tesseract_path:
-            pytesseract.pytesseract.tesseract_cmd = tesseract_path
+            try:
+                set_tesseract_path(tesseract_path)
+            except FileNotFoundError:
+                st.error(f"Tesseract not found at {tesseract_path}. OCR will fail until the path is corrected.")
     
     # Tag management
     st.markdown("### Tag Management")
@@ -143,6 +357,24 @@ def build_settings_panel():
     # Debug mode toggle
     debug_settings()
 
+@functools.lru_cache(maxsize=1)
+def set_tesseract_path(tesseract_path):
+    """
+    Point pytesseract at a Tesseract executable, again only when the path changes
+    
+    Only the last path is cached, so switching back to an earlier path reapplies it.
+    
+    Raises:
+        FileNotFoundError: If there is no file at the path (not cached, so a
+            corrected path is picked up)
+    """
+    if not os.path.isfile(tesseract_path):
+        raise FileNotFoundError(tesseract_path)
+    # Only imported where it's configured, so other platforms never load it here
+    import pytesseract
+    pytesseract.pytesseract.tesseract_cmd = tesseract_path
+    return tesseract_path
+
 def user_admin_settings():
     """Admin settings for user management"""
     st.markdown("### User Management (Admin)")
@@ -156,20 +388,28 @@ def user_admin_settings():
         user_data = load_users()
         users = user_data.get('users', [])
         
-        # Display user list
+        # Display user list as one table rather than a markdown block per user
         if users:
             st.markdown("#### Registered Users")
-            for user in users:
-                st.markdown(f"""
-                **{user['full_name']}** ({user['username']})  
-                Email: {user['email']}  
-                Role: {user.get('role', 'user')}  
-                Created: {user.get('created_at', 'Unknown')}
-                """)
-                st.markdown("---")
+            users_df = pd.DataFrame(users, columns=["full_name", "username", "email", "role", "created_at"])
+            users_df["role"] = users_df["role"].fillna("user")
+            users_df["created_at"] = users_df["created_at"].fillna("Unknown")
+            st.dataframe(
+                users_df,
+                hide_index=True,
+                use_container_width=True,
+                column_config={
+                    "full_name": "Name",
+                    "username": "Username",
+                    "email": "Email",
+                    "role": "Role",
+                    "created_at": "Created"
+                }
+            )
         else:
             st.warning("No users found in the system.")
 
+@st.fragment
 def api_settings():
     """API key settings"""
     # OpenAI API Key input
@@ -194,6 +434,7 @@ def api_settings():
     if pinecone_api_key:
         os.environ["PINECONE_API_KEY"] = pinecone_api_key
 
+@st.fragment
 def model_settings():
     """LLM model settings"""
     st.markdown("### Model Settings")
@@ -225,9 +466,13 @@ def model_settings():
     if "settings" not in st.session_state:
         st.session_state.settings = {}
     
-    st.session_state.settings["model_name"] = model_name
-    st.session_state.settings["temperature"] = temperature
-    st.session_state.settings["legal_expert_mode"] = legal_expert_mode
+    new_settings = {
+        "model_name": model_name,
+        "temperature": temperature,
+        "legal_expert_mode": legal_expert_mode
+    }
+    if any(st.session_state.settings.get(key) != value for key, value in new_settings.items()):
+        st.session_state.settings.update(new_settings)
     
     # Display legal expert mode information
     if legal_expert_mode:
@@ -244,25 +489,50 @@ def model_settings():
     else:
         st.info("Legal Expert Mode is disabled. The AI will use more conversational language.")
 
+@st.fragment
 def vectorstore_settings():
     """Vector store settings"""
     st.markdown("### Vector Store Settings")
     
     # Vector store type selection
+    vectorstore_types = ["Chroma", "FAISS", "Pinecone"]
     vectorstore_type = st.radio(
         "Vector Store Type",
-        ["Chroma", "Pinecone"],
-        index=0 if st.session_state.get("vectorstore_type", "chroma") == "chroma" else 1,
+        vectorstore_types,
+        index=[option.lower() for option in vectorstore_types].index(st.session_state.get("vectorstore_type", "chroma")),
         help="Select which vector database to use"
     )
     
     # Convert selection to lowercase for internal use
-    st.session_state.vectorstore_type = vectorstore_type.lower()
+    if st.session_state.get("vectorstore_type") != vectorstore_type.lower():
+        st.session_state.vectorstore_type = vectorstore_type.lower()
+        # The rest of the app reads the store type, so rerun all of it rather than this panel
+        st.rerun(scope="app")
     
     # Show appropriate settings based on vector store type
     if vectorstore_type == "Chroma":
-        # For Chroma, always use in-memory storage
-        st.info("Using Chroma with in-memory storage. Vector database will not be saved between sessions.")
+        # For Chroma, choose between in-memory and persistent storage
+        storage_settings()
+    
+    elif vectorstore_type == "FAISS":
+        # FAISS does exact cosine search in memory and saves its index to disk
+        st.info("FAISS searches every vector in memory (8-bit quantized for large collections) and saves the index to disk between sessions.")
+        if faiss is None:
+            st.warning("FAISS is not installed. Install it with: pip install faiss-cpu")
+    
+    if vectorstore_type in ("Chroma", "FAISS"):
+        # Local stores can use a smaller local embedding model instead of OpenAI's
+        embedding_model = st.selectbox(
+            "Embedding Model",
+            EMBEDDING_MODELS,
+            index=EMBEDDING_MODELS.index(st.session_state.get("embedding_model", DEFAULT_EMBEDDING_MODEL)),
+            format_func=lambda model: "OpenAI" if model == DEFAULT_EMBEDDING_MODEL else f"{model} (local)",
+            help="Local models run on this machine with sentence-transformers: much faster to embed, and smaller vectors"
+        )
+        if st.session_state.get("embedding_model", DEFAULT_EMBEDDING_MODEL) != embedding_model:
+            st.session_state.embedding_model = embedding_model
+        if embedding_model != st.session_state.get("indexed_embedding_model", embedding_model) and st.session_state.documents:
+            st.info("The vector store is re-embedded with this model on the next rebuild or document change.")
     
     elif vectorstore_type == "Pinecone":
         # Pinecone settings
@@ -274,10 +544,11 @@ def vectorstore_settings():
             value=st.session_state.get("pinecone_index", ""),
             help="Enter the name of your Pinecone index"
         )
-        st.session_state.pinecone_index = pinecone_index
+        if st.session_state.get("pinecone_index") != pinecone_index:
+            st.session_state.pinecone_index = pinecone_index
         
         # Dimension info
-        st.info("For OpenAI embeddings, use a Pinecone index with dimension=1536")
+        st.info("Pinecone always uses OpenAI embeddings, so use a Pinecone index with dimension=1536")
         
         # Check if Pinecone API key is set
         if not os.environ.get("PINECONE_API_KEY"):
@@ -291,13 +562,15 @@ def vectorstore_settings():
         if st.button("Test Pinecone Connection"):
             with st.spinner("Testing Pinecone connection..."):
                 try:
-                    from pinecone import Pinecone
+                    # Shared Pinecone client (raises ImportError if it isn't installed)
+                    pinecone_api_key = os.environ.get("PINECONE_API_KEY", "")
+                    pc = get_pinecone_client(pinecone_api_key)
                     
-                    # Initialize Pinecone client
-                    pc = Pinecone(api_key=os.environ.get("PINECONE_API_KEY", ""))
-                    
-                    # List indexes to test connection
-                    indexes = pc.list_indexes().names()
+                    # List indexes to test connection, fetching the index stats at the same time
+                    with ThreadPoolExecutor(max_workers=2) as executor:
+                        indexes_future = executor.submit(list_pinecone_indexes, pinecone_api_key)
+                        vector_count_future = executor.submit(get_pinecone_vector_count, pinecone_api_key, pinecone_index)
+                        indexes = indexes_future.result()
                     
                     # Check if specified index exists
                     if pinecone_index in indexes:
@@ -305,9 +578,7 @@ def vectorstore_settings():
                         
                         # Get index stats if available
                         try:
-                            index = pc.Index(pinecone_index)
-                            stats = index.describe_index_stats()
-                            st.write(f"Index contains {stats.namespaces.get('', {}).get('vector_count', 0)} vectors")
+                            st.write(f"Index contains {vector_count_future.result()} vectors")
                         except:
                             pass
                     else:
@@ -340,6 +611,7 @@ def vectorstore_settings():
                                         metric="cosine"
                                     )
                                 
+                                list_pinecone_indexes.clear()
                                 st.success(f"Index '{pinecone_index}' created successfully!")
                             except Exception as e:
                                 st.error(f"Error creating index: {str(e)}")
@@ -347,34 +619,21 @@ def vectorstore_settings():
                 except ImportError:
                     st.error("Pinecone Python client not installed. Please install with: pip install pinecone-client>=3.0.0")
                 except Exception as e:
+                    logger.exception("Pinecone connection test failed")
                     st.error(f"Error connecting to Pinecone: {str(e)}")
-                    import traceback
-                    st.error(f"Traceback: {traceback.format_exc()}")
+                    
+                    # The full traceback is in the server log; only render it in debug mode
+                    if st.session_state.get("debug_mode", False):
+                        import traceback
+                        st.code(traceback.format_exc())
                     
     # Add button to rebuild vector store
     if st.session_state.documents:
-        if st.button("Rebuild Vector Store"):
-            with st.spinner("Rebuilding vector store..."):
-                try:
-                    # Get vectorstore settings
-                    use_in_memory = True  # Always use in-memory for Chroma
-                    vectorstore_type = st.session_state.get("vectorstore_type", "chroma")
-                    pinecone_index = st.session_state.get("pinecone_index", None)
-                    
-                    # Initialize vector store with appropriate settings
-                    st.session_state.vectorstore = initialize_vectorstore(
-                        st.session_state.documents, 
-                        use_in_memory=use_in_memory,
-                        vectorstore_type=vectorstore_type,
-                        pinecone_index=pinecone_index
-                    )
-                    
-                    if st.session_state.vectorstore:
-                        st.success("Vector store rebuilt successfully!")
-                    else:
-                        st.error("Failed to rebuild vector store. Check settings and try again.")
-                except Exception as e:
-                    st.error(f"Error rebuilding vector store: {str(e)}")
+        rebuilding = st.session_state.get("pending_rebuild") is not None
+        if st.button("Rebuild Vector Store", disabled=rebuilding):
+            # Re-embed every document with the current settings, in the background
+            start_background_rebuild()
+            st.rerun(scope="app")
 
 def debug_settings():
     """Debug mode settings"""
@@ -382,11 +641,13 @@ def debug_settings():
     debug_mode = st.checkbox("Enable Debug Mode", 
                           value=st.session_state.get("debug_mode", False),
                           help="Shows additional diagnostic information when errors occur")
-    st.session_state.debug_mode = debug_mode
+    if st.session_state.get("debug_mode", False) != debug_mode:
+        st.session_state.debug_mode = debug_mode
     
     if debug_mode:
         build_debug_panel()
 
+@st.fragment
 def build_debug_panel():
     """Build the debug panel in the settings sidebar"""
     st.info("Debug mode is enabled. Document format information will be displayed when processing documents.")
@@ -428,6 +689,21 @@ def build_debug_panel():
         ```
         """)
     
+    elif vectorstore_type == "faiss":
+        st.markdown("""
+        ### FAISS Information
+        FAISS vector store details:
+        - Inner-product search over L2-normalized vectors, i.e. cosine similarity
+        - Exact (IndexFlatIP), or 8-bit scalar quantized when built from 10,000+ chunks
+        - The index and its chunks are saved under `.streamlit/` and reloaded on restart
+        
+        You can check your FAISS installation with:
+        ```python
+        import faiss
+        print(f"FAISS version: {faiss.__version__}")
+        ```
+        """)
+    
     elif vectorstore_type == "pinecone":
         # Add Pinecone debug info
         st.markdown("""
@@ -1,7 +1,11 @@
 import streamlit as st
-from utils import format_tags_html, add_tags_to_document, remove_tag_from_document
+import pandas as pd
+from utils import format_tags_html, get_sorted_tags, get_document_filter_index
 from document_processing import parse_tags
-from vector_store import initialize_vectorstore
+from vector_store import (initialize_vectorstore, clear_persisted_vectorstore, FaissVectorStore,
+                          get_vectorstore_type, vectorstore_upsert, vectorstore_delete, vectorstore_update_metadata,
+                          save_documents, DEFAULT_EMBEDDING_MODEL)
+from ui_components import paginate
 
 def document_uploader():
     """
@@ -64,7 +68,8 @@ def ocr_settings():
             st.info("OCR is disabled. Text will not be extracted from images in PDFs or image files.")
         
         # Store OCR setting in session state
-        st.session_state.perform_ocr = perform_ocr
+        if st.session_state.get("perform_ocr", False) != perform_ocr:
+            st.session_state.perform_ocr = perform_ocr
 
 def storage_settings():
     """UI component for vector store storage settings"""
@@ -72,7 +77,7 @@ def storage_settings():
     
     # Initialize the setting if it doesn't exist
     if "use_in_memory_storage" not in st.session_state:
-        st.session_state.use_in_memory_storage = True
+        st.session_state.use_in_memory_storage = False
     
     # Create the toggle
     use_in_memory = st.toggle(
@@ -82,7 +87,8 @@ def storage_settings():
     )
     
     # Store the setting in session state
-    st.session_state.use_in_memory_storage = use_in_memory
+    if st.session_state.use_in_memory_storage != use_in_memory:
+        st.session_state.use_in_memory_storage = use_in_memory
     
     # Add help text
     if use_in_memory:
@@ -110,23 +116,28 @@ def document_list():
     # Apply filters
     filtered_docs = filter_documents(filter_case, filter_type)
     
-    # Display documents
-    for doc in filtered_docs:
+    # Display documents, one page at a time
+    page_docs, _ = paginate(filtered_docs, key="document_list_page", page_size=10)
+    bulk_tag_editor(page_docs)
+    for doc in page_docs:
         display_document_item(doc)
     
-    # Button to clear all documents
-    if st.button("Clear All Documents"):
+    # Button to clear all documents (not while a background rebuild is writing the stores)
+    if st.button("Clear All Documents", disabled=st.session_state.get("pending_rebuild") is not None):
         st.session_state.documents = []
+        st.session_state.documents_by_id = {}
         st.session_state.vectorstore = None
-        st.session_state.tags = set()
+        save_documents([], st.session_state.library_dir)
+        if not st.session_state.get("use_in_memory_storage", False):
+            clear_persisted_vectorstore(st.session_state.library_dir)
+        FaissVectorStore.clear(st.session_state.library_dir)
         st.success("All documents cleared from the knowledge base")
         st.rerun()
 
 def tag_filter_controls():
     """UI controls for filtering by tags"""
-    if st.session_state.tags:
-        tag_list = list(st.session_state.tags)
-        tag_list.sort()
+    tag_list = get_sorted_tags(st.session_state.documents)
+    if tag_list:
         selected_tags = st.multiselect(
             "Filter by Tags",
             tag_list,
@@ -134,7 +145,8 @@ def tag_filter_controls():
         )
         
         # Store selected tags in session state for use in filtering
-        st.session_state.selected_filter_tags = selected_tags
+        if st.session_state.get("selected_filter_tags", []) != selected_tags:
+            st.session_state.selected_filter_tags = selected_tags
 
 def filter_documents(filter_case, filter_type):
     """
@@ -143,25 +155,41 @@ def filter_documents(filter_case, filter_type):
     Returns:
         list: Filtered document list
     """
-    filtered_docs = st.session_state.documents
+    documents = st.session_state.documents
+    ids_by_type, ids_by_tag, case_ids_lower = get_document_filter_index(documents)
     
-    # Filter by case ID
-    if filter_case:
-        filtered_docs = [doc for doc in filtered_docs if filter_case.lower() in doc["case_id"].lower()]
+    # Intersect the ID sets of the type and tag filters instead of scanning every document's tags
+    matching_ids = None
     
     # Filter by document type
     if filter_type != "All":
-        filtered_docs = [doc for doc in filtered_docs if doc["type"] == filter_type]
+        matching_ids = ids_by_type.get(filter_type, frozenset())
     
-    # Filter by tags
+    # Filter by tags (documents with any of the selected tags)
     selected_tags = st.session_state.get("selected_filter_tags", [])
-    if st.session_state.tags and selected_tags:
-        filtered_docs = [doc for doc in filtered_docs if any(tag in selected_tags for tag in doc.get("tags", []))]
+    if selected_tags and ids_by_tag:
+        tagged_ids = frozenset().union(*(ids_by_tag.get(tag, frozenset()) for tag in selected_tags))
+        matching_ids = tagged_ids if matching_ids is None else matching_ids & tagged_ids
     
-    return filtered_docs
+    if matching_ids is None and not filter_case:
+        return documents
+    
+    # One pass in upload order; the case ID is a substring match, so it can't use an exact-match index,
+    # but it is matched against the index's lowercased case IDs instead of lowercasing each one again
+    filter_case = filter_case.lower()
+    return [
+        doc for doc in documents
+        if (matching_ids is None or doc["id"] in matching_ids)
+        and (not filter_case or filter_case in case_ids_lower[doc["id"]])
+    ]
 
+@st.fragment
 def display_document_item(doc):
-    """Display a single document item with its controls"""
+    """
+    Display a single document item with its controls
+    
+    Runs as a fragment, so expanding or interacting with an item reruns only that item.
+    """
     with st.expander(f"{doc['title']} ({doc['type']})"):
         st.write(f"**Case ID:** {doc['case_id']}")
         st.write(f"**Uploaded:** {doc['uploaded_at']}")
@@ -173,71 +201,184 @@ def display_document_item(doc):
         else:
             st.markdown("*No tags added yet*")
         
-        # Simple tag management UI
-        st.markdown("##### Add or Remove Tags")
-        
-        document_tag_controls(doc)
+        st.caption("Edit tags in the table above the document list")
         
         # Option to remove document
         st.markdown("---")
         if st.button(f"Remove Document", key=f"remove_{doc['id']}"):
             remove_document(doc)
 
-def document_tag_controls(doc):
-    """Tag management controls for a document"""
-    # Add new tags
-    new_tag_input = st.text_input(
-        "Add Tags (comma-separated)", 
-        key=f"add_tags_{doc['id']}",
-        placeholder="Enter tags to add..."
-    )
+def bulk_tag_editor(docs):
+    """
+    Edit the tags of a page of documents in a single table
     
-    if new_tag_input:
-        new_tags = parse_tags(new_tag_input)
-        if new_tags and st.button("Add Tags", key=f"add_tags_btn_{doc['id']}"):
-            if add_tags_to_document(doc["id"], new_tags, st.session_state.documents, st.session_state.tags):
-                st.success(f"Added tags to {doc['title']}")
-                # Reinitialize vectorstore
-                with st.spinner("Updating knowledge base..."):
-                    use_in_memory = st.session_state.get("use_in_memory_storage", True)
-                    st.session_state.vectorstore = initialize_vectorstore(st.session_state.documents, use_in_memory=use_in_memory)
-                st.rerun()
+    One data editor covers every row instead of separate tag widgets per document,
+    and all changed rows go to the vector store in one metadata-only update.
     
-    # Remove tags dropdown
-    if doc.get("tags"):
-        tag_to_remove = st.selectbox(
-            "Select tag to remove",
-            ["Select a tag..."] + doc["tags"],
-            key=f"remove_tag_select_{doc['id']}"
+    Args:
+        docs: Documents on the current page
+    """
+    if not docs:
+        return
+    
+    original = pd.DataFrame(
+        [{"title": doc["title"], "type": doc["type"], "case_id": doc["case_id"],
+          "tags": ", ".join(doc.get("tags", []))} for doc in docs],
+        index=[doc["id"] for doc in docs]
+    )
+    
+    # A form, so editing cells doesn't rerun the app until the edits are saved
+    with st.form("bulk_tag_form"):
+        edited = st.data_editor(
+            original,
+            hide_index=True,
+            use_container_width=True,
+            disabled=["title", "type", "case_id"],
+            column_config={
+                "title": "Title",
+                "type": "Type",
+                "case_id": "Case ID",
+                "tags": st.column_config.TextColumn("Tags (comma-separated)")
+            }
         )
-        
-        if tag_to_remove != "Select a tag...":
-            if st.button(f"Remove '{tag_to_remove}'", key=f"remove_tag_btn_{doc['id']}"):
-                if remove_tag_from_document(doc["id"], tag_to_remove, st.session_state.documents, st.session_state.tags):
-                    st.success(f"Removed tag '{tag_to_remove}' from {doc['title']}")
-                    # Reinitialize vectorstore
-                    with st.spinner("Updating knowledge base..."):
-                        use_in_memory = st.session_state.get("use_in_memory_storage", True)
-                        st.session_state.vectorstore = initialize_vectorstore(st.session_state.documents, use_in_memory=use_in_memory)
-                    st.rerun()
+        submitted = st.form_submit_button("Save Tags")
+    
+    if not submitted:
+        return
+    
+    retagged = []
+    for doc_id in edited.index[edited["tags"] != original["tags"]]:
+        doc = st.session_state.documents_by_id.get(doc_id)
+        if doc is not None:
+            doc["tags"] = parse_tags(edited.at[doc_id, "tags"])
+            retagged.append(doc)
+    
+    if retagged:
+        # Tags only change chunk metadata, so nothing is re-embedded
+        with st.spinner("Updating knowledge base..."):
+            sync_vectorstore(retagged=retagged)
+        st.success(f"Updated tags on {len(retagged)} document(s)")
+        st.rerun()
 
 def remove_document(doc):
     """Remove a document from the system"""
+    # One pass comparing IDs only; list.remove would compare whole document dicts
     st.session_state.documents = [d for d in st.session_state.documents if d["id"] != doc["id"]]
+    st.session_state.documents_by_id.pop(doc["id"], None)
     st.success(f"Removed {doc['title']}")
     
-    # Reinitialize vectorstore
+    # Drop only this document's chunks from the vector store
     with st.spinner("Updating knowledge base..."):
-        use_in_memory = st.session_state.get("use_in_memory_storage", True)
-        st.session_state.vectorstore = initialize_vectorstore(st.session_state.documents, use_in_memory=use_in_memory)
+        sync_vectorstore(deleted_ids=[doc["id"]])
         st.success("Knowledge base updated!")
     st.rerun()
 
+def get_embedding_model_setting():
+    """Embedding model for the selected store type (Pinecone indexes always use OpenAI's)"""
+    if st.session_state.get("vectorstore_type", "chroma") == "pinecone":
+        return DEFAULT_EMBEDDING_MODEL
+    return st.session_state.get("embedding_model", DEFAULT_EMBEDDING_MODEL)
+
+def get_vectorstore_options():
+    """Current vector store settings, as keyword arguments for initialize_vectorstore"""
+    return {
+        "use_in_memory": st.session_state.get("use_in_memory_storage", False),
+        "vectorstore_type": st.session_state.get("vectorstore_type", "chroma"),
+        "pinecone_index": st.session_state.get("pinecone_index", None),
+        "embedding_model": get_embedding_model_setting(),
+        "library_dir": st.session_state.library_dir,
+        "removed_doc_ids": set(st.session_state.get("removed_doc_ids", ()))
+    }
+
+def set_rebuilt_vectorstore(vectorstore, embedding_model):
+    """
+    Make a rebuilt vector store the current one
+    
+    Args:
+        vectorstore: The new vector store, or None if the rebuild failed
+        embedding_model: Embedding model the store was built with
+    """
+    st.session_state.vectorstore = vectorstore
+    st.session_state.indexed_embedding_model = embedding_model
+
+def rebuild_vectorstore():
+    """
+    Rebuild the vector store from every document using the current settings
+    
+    Returns:
+        The new vector store, or None if it could not be created
+    """
+    options = get_vectorstore_options()
+    vectorstore = initialize_vectorstore(st.session_state.documents, **options)
+    set_rebuilt_vectorstore(vectorstore, options["embedding_model"])
+    return vectorstore
+
+def sync_vectorstore(upserted=(), deleted_ids=(), retagged=()):
+    """
+    Apply document changes to the existing vector store in place
+    
+    Only added or changed documents are indexed, each under its own chunk IDs and
+    metadata; text embedded before (such as a re-upload of the same file) is read
+    from the embedding cache instead of embedded again. Falls back to a full rebuild when
+    there is no vector store yet, the store doesn't match the selected type or
+    embedding model, or the in-place update fails.
+    
+    Args:
+        upserted: Documents that were added or whose content changed
+        deleted_ids: IDs of documents that were removed
+        retagged: Documents whose tags changed
+    
+    Returns:
+        The updated vector store, or None if there is none
+    """
+    vectorstore = st.session_state.vectorstore
+    
+    # Keep the saved document list in step with the vectors, for the next restart
+    save_documents(st.session_state.documents, st.session_state.library_dir)
+    
+    # Remembered so a rebuild of the persistent store prunes only what this session removed
+    st.session_state.setdefault("removed_doc_ids", set()).update(str(doc_id) for doc_id in deleted_ids)
+    
+    # A background rebuild writes to the same library, so the changes are recorded and
+    # applied to the rebuilt store once it is swapped in (see finish_pending_rebuild)
+    if st.session_state.get("pending_rebuild") is not None:
+        deferred = st.session_state.setdefault("deferred_sync", {"upserted": set(), "deleted": set(), "retagged": set()})
+        deferred["upserted"].update(doc["id"] for doc in upserted)
+        deferred["deleted"].update(deleted_ids)
+        deferred["retagged"].update(doc["id"] for doc in retagged)
+        return vectorstore
+    
+    vectorstore_type = st.session_state.get("vectorstore_type", "chroma")
+    if not st.session_state.documents:
+        st.session_state.vectorstore = None
+        if vectorstore_type == "chroma" and not st.session_state.get("use_in_memory_storage", False):
+            clear_persisted_vectorstore(st.session_state.library_dir)
+        elif vectorstore_type == "faiss":
+            FaissVectorStore.clear(st.session_state.library_dir)
+        return None
+    
+    if (vectorstore is None or get_vectorstore_type(vectorstore) != vectorstore_type
+            or st.session_state.get("indexed_embedding_model") != get_embedding_model_setting()):
+        return rebuild_vectorstore()
+    
+    try:
+        vectorstore_delete(vectorstore, deleted_ids)
+        if upserted:
+            vectorstore_upsert(vectorstore, list(upserted))
+        if retagged:
+            vectorstore_update_metadata(vectorstore, retagged)
+    except Exception as e:
+        st.warning(f"Could not update the vector store in place, rebuilding it: {str(e)}")
+        return rebuild_vectorstore()
+    
+    # The store object is unchanged, so bump a version to invalidate cached retrievals
+    st.session_state.vectorstore_version = st.session_state.get("vectorstore_version", 0) + 1
+    return vectorstore
+
 def tag_manager():
     """Global tag management UI"""
-    if st.session_state.tags:
-        all_tags = list(st.session_state.tags)
-        all_tags.sort()
+    all_tags = get_sorted_tags(st.session_state.documents)
+    if all_tags:
         
         st.markdown("**All Tags in System:**")
         for tag in all_tags:
@@ -247,24 +388,25 @@ def tag_manager():
         st.markdown("**Rename Tags Globally:**")
         tag_to_rename = st.selectbox(
             "Select tag to rename",
-            ["Select a tag..."] + all_tags
+            ["Select a tag...", *all_tags]
         )
         
         if tag_to_rename != "Select a tag...":
             new_tag_name = st.text_input("New tag name", key="global_rename_tag")
             
             if new_tag_name and st.button("Rename Tag"):
-                rename_tag_globally(tag_to_rename, new_tag_name, st.session_state.documents, st.session_state.tags)
+                renamed_docs = rename_tag_globally(
+                    tag_to_rename, new_tag_name, st.session_state.documents, st.session_state.documents_by_id
+                )
                 st.success(f"Renamed tag '{tag_to_rename}' to '{new_tag_name}'")
-                # Reinitialize vectorstore
+                # Tags only change chunk metadata, so nothing is re-embedded
                 with st.spinner("Updating knowledge base..."):
-                    use_in_memory = st.session_state.get("use_in_memory_storage", True)
-                    st.session_state.vectorstore = initialize_vectorstore(st.session_state.documents, use_in_memory=use_in_memory)
+                    sync_vectorstore(retagged=renamed_docs)
                 st.rerun()
     else:
         st.info("No tags in the system yet. Add tags to documents to manage them here.")
 
-def rename_tag_globally(old_tag, new_tag, documents, global_tags):
+def rename_tag_globally(old_tag, new_tag, documents, documents_by_id):
     """
     Rename a tag across all documents.
     
@@ -272,20 +414,26 @@ def rename_tag_globally(old_tag, new_tag, documents, global_tags):
         old_tag: The tag to rename
         new_tag: The new tag name
         documents: List of all documents
-        global_tags: Set of all unique tags
+        documents_by_id: Index of all documents by ID
+    
+    Returns:
+        List of the documents whose tags changed
     """
     if old_tag == new_tag:
-        return
+        return []
+    
+    # Only visit the documents that have the tag, via the tag index
+    _, ids_by_tag, _ = get_document_filter_index(documents)
+    renamed_docs = []
     
-    # Update the tag in all documents
-    for i, doc in enumerate(documents):
-        if "tags" in doc and old_tag in doc["tags"]:
-            tags = doc["tags"].copy()
+    for doc_id in ids_by_tag.get(old_tag, ()):
+        doc = documents_by_id[doc_id]
+        tags = doc["tags"]
+        if new_tag in tags:
+            # The document already has the new tag, so just drop the old one
             tags.remove(old_tag)
-            tags.append(new_tag)
-            documents[i]["tags"] = tags
+        else:
+            tags[tags.index(old_tag)] = new_tag
+        renamed_docs.append(doc)
     
-    # Update global tags
-    if old_tag in global_tags:
-        global_tags.remove(old_tag)
-        global_tags.add(new_tag)
\ No newline at end of file
+    return renamed_docs
@@ -1,45 +1,51 @@
 import streamlit as st
 import os
+from importlib.util import find_spec
 
 def check_dependencies():
     """Check if required libraries are installed and provide installation instructions"""
     check_tesseract()
     check_pdf_libraries()
 
+@st.cache_data(show_spinner=False)
+def installed_modules(module_names):
+    """
+    Find which of the given modules are installed, without importing them
+    
+    Args:
+        module_names: Tuple of top-level module names
+    
+    Returns:
+        Tuple of the names that are installed
+    """
+    return tuple(name for name in module_names if find_spec(name) is not None)
+
 def check_tesseract():
     """Check if Tesseract OCR is installed and configured"""
-    try:
-        import pytesseract
-        # If on Windows, check if tesseract path is set
-        if os.name == 'nt':
-            if not pytesseract.pytesseract.tesseract_cmd:
-                st.warning("Tesseract path not set. Please install Tesseract OCR and set the path in Settings.")
-                st.markdown("""
-                ### Installing Tesseract OCR on Windows:
-                1. Download from: https://github.com/UB-Mannheim/tesseract/wiki
-                2. Install and note the installation path
-                3. Enter the path in the Settings tab (typically `C:\\Program Files\\Tesseract-OCR\\tesseract.exe`)
-                """)
-    except ImportError:
+    if not installed_modules(("pytesseract",)):
         st.error("pytesseract not installed. Install with: pip install pytesseract")
+        return
+    
+    # If on Windows, check if tesseract path is set (it can change, so it isn't cached)
+    if os.name == 'nt':
+        import pytesseract
+        if not pytesseract.pytesseract.tesseract_cmd:
+            st.warning("Tesseract path not set. Please install Tesseract OCR and set the path in Settings.")
+            st.markdown("""
+            ### Installing Tesseract OCR on Windows:
+            1. Download from: https://github.com/UB-Mannheim/tesseract/wiki
+            2. Install and note the installation path
+            3. Enter the path in the Settings tab (typically `C:\\Program Files\\Tesseract-OCR\\tesseract.exe`)
+            """)
 
 def check_pdf_libraries():
     """Check for PDF processing libraries"""
-    pdf_libs = []
-    
-    try:
-        import fitz
-        pdf_libs.append("PyMuPDF")
-    except ImportError:
-        pass
-    
-    try:
-        import pdf2image
-        pdf_libs.append("pdf2image")
-    except ImportError:
-        pass
+    pdf_libs = [
+        label for label, module_name in (("PyMuPDF", "fitz"), ("pdf2image", "pdf2image"))
+        if module_name in installed_modules(("fitz", "pdf2image"))
+    ]
     
     if not pdf_libs:
         st.info("For enhanced PDF OCR, install PyMuPDF: `pip install PyMuPDF` or pdf2image: `pip install pdf2image poppler-utils`")
     else:
-        st.success(f"PDF OCR enabled using: {', '.join(pdf_libs)}")
\ No newline at end of file
+        st.success(f"PDF OCR enabled using: {', '.join(pdf_libs)}")
@@ -1,17 +1,36 @@
 import streamlit as st
+import math
 
-# CSS styles for the UI
-def apply_custom_css():
-    """Apply custom CSS styles to the Streamlit app"""
-    st.markdown("""
-    <style>
-     
-    </style>
-    """, unsafe_allow_html=True)
+# Default number of items rendered per page in long lists
+PAGE_SIZE = 25
 
-def add_tag_management_js():
-    """Add JavaScript for tag management"""
-    st.markdown("""
+def paginate(items, key, page_size=PAGE_SIZE):
+    """
+    Show a page selector for a long list and return only the current page
+    
+    Keeps the number of widgets created per rerun bounded regardless of list length.
+    
+    Args:
+        items: List to paginate
+        key: Widget key for the page selector
+        page_size: Number of items per page
+        
+    Returns:
+        Tuple of (items on the current page, index of the first item on the page)
+    """
+    page_count = math.ceil(len(items) / page_size)
+    if page_count <= 1:
+        return items, 0
+    
+    page = st.number_input(f"Page (1-{page_count})", min_value=1, max_value=page_count, value=1, key=key)
+    start = (page - 1) * page_size
+    return items[start:start + page_size], start
+
+# Custom CSS rules for the UI (left empty when the default theme is enough)
+_CSS = ""
+
+# Tag management script, built once at import instead of on every rerun
+_TAG_MANAGEMENT_JS = """
     <script>
         // Function to handle tag removal events
         function setupTagRemoval() {
@@ -45,4 +64,15 @@ def add_tag_management_js():
             });
         }
     </script>
-    """, unsafe_allow_html=True)
\ No newline at end of file
+    """
+
+def apply_custom_css():
+    """Apply custom CSS styles to the Streamlit app"""
+    # Streamlit drops elements that aren't re-sent on a rerun, so this still runs every
+    # time; an empty stylesheet just isn't sent at all
+    if _CSS:
+        st.markdown(f"<style>{_CSS}</style>", unsafe_allow_html=True)
+
+def add_tag_management_js():
+    """Add JavaScript for tag management"""
+    st.markdown(_TAG_MANAGEMENT_JS, unsafe_allow_html=True)
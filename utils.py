@@ -1,3 +1,22 @@
+import asyncio
+import contextlib
+import functools
+import html
+import threading
+from collections import Counter
+import httpx
+from langchain_openai import OpenAIEmbeddings
+
+# Markup for a single tag, formatted once per tag
+TAG_HTML = '<span class="tag-item">{tag}</span>'
+EDITABLE_TAG_HTML = '''
+            <span class="tag-item">
+                {tag}
+                <button class="tag-remove-btn" data-doc-id="{doc_id}" data-tag="{tag}" 
+                    title="Remove this tag">×</button>
+            </span>
+            '''
+
 def format_tags_html(tags, doc_id=None, editable=False):
     """
     Format tags as HTML for display in Streamlit.
@@ -13,83 +32,151 @@ def format_tags_html(tags, doc_id=None, editable=False):
     if not tags:
         return ""
     
-    html = '<div class="tag-container">'
+    return _format_tags_html_cached(tuple(tags), doc_id, editable)
+
+@functools.lru_cache(maxsize=4096)
+def _format_tags_html_cached(tags, doc_id, editable):
+    """
+    Build the tag HTML for a tuple of tags (memoized so identical tag sets share work)
     
-    for tag in tags:
-        if editable and doc_id:
-            # Create editable/removable tag with remove button
-            html += f'''
-            <span class="tag-item">
-                {tag}
-                <button class="tag-remove-btn" data-doc-id="{doc_id}" data-tag="{tag}" 
-                    title="Remove this tag">×</button>
-            </span>
-            '''
-        else:
-            # Create regular non-editable tag
-            html += f'<span class="tag-item">{tag}</span>'
+    Editable tags are keyed per document, so the cache is sized for a few thousand
+    documents to stay warm while the list is filtered and paged.
+    """
+    # Tags are user input, so they're escaped before going into the markup
+    escaped_tags = (html.escape(tag) for tag in tags)
+    if editable and doc_id:
+        # Editable/removable tags with a remove button
+        items = (EDITABLE_TAG_HTML.format(tag=tag, doc_id=doc_id) for tag in escaped_tags)
+    else:
+        # Regular non-editable tags
+        items = (TAG_HTML.format(tag=tag) for tag in escaped_tags)
     
-    html += '</div>'
+    return '<div class="tag-container">' + "".join(items) + '</div>'
+
+def page_text(page):
+    """Get the text of a page, whether it is a Document, a string or a dict"""
+    if hasattr(page, 'page_content'):
+        return page.page_content
+    elif isinstance(page, str):
+        return page
+    elif isinstance(page, dict) and "page_content" in page:
+        return page["page_content"]
+    else:
+        return str(page)
+
+def get_page_texts(doc):
+    """
+    Get the text of every page of a document
     
-    return html
+    Uses the "page_texts" list stored at ingest when present, so renders don't
+    repeat the per-page type dispatch.
+    """
+    if "page_texts" not in doc:
+        doc["page_texts"] = [page_text(page) for page in doc.get("pages", [])]
+    return doc["page_texts"]
+
+def index_documents(documents):
+    """Build a doc_id -> document index over the document list"""
+    return {doc["id"]: doc for doc in documents}
 
-def add_tags_to_document(doc_id, new_tags, documents, global_tags):
+def get_all_tags(documents):
     """
-    Add tags to an existing document.
+    Get all unique tags across documents.
+    
+    The result is derived from the documents themselves, so it never goes stale,
+    and is memoized on the documents' tags so unchanged documents cost one lookup.
     
     Args:
-        doc_id: ID of the document to tag
-        new_tags: List of new tags to add
         documents: List of all documents
-        global_tags: Set of all unique tags
     
     Returns:
-        Boolean indicating success
+        Frozenset of tag strings
     """
-    for i, doc in enumerate(documents):
-        if doc["id"] == doc_id:
-            current_tags = set(doc.get("tags", []))
-            current_tags.update(new_tags)
-            documents[i]["tags"] = list(current_tags)
-            
-            # Add to global tags set
-            for tag in new_tags:
-                global_tags.add(tag)
-            
-            return True
+    return _all_tags_cached(tuple(tuple(doc.get("tags", ())) for doc in documents))
+
+@functools.lru_cache(maxsize=32)
+def _all_tags_cached(tags_per_document):
+    """Union of the per-document tag tuples"""
+    return frozenset(tag for tags in tags_per_document for tag in tags)
+
+def get_sorted_tags(documents):
+    """
+    Get all unique tags across documents, sorted for display.
     
-    return False
+    Args:
+        documents: List of all documents
+    
+    Returns:
+        Sorted tuple of tag strings
+    """
+    return _sorted_tags_cached(get_all_tags(documents))
+
+@functools.lru_cache(maxsize=32)
+def _sorted_tags_cached(tags):
+    """Sort a tag set (memoized, so an unchanged set isn't re-sorted on every rerun)"""
+    return tuple(sorted(tags))
 
-def remove_tag_from_document(doc_id, tag_to_remove, documents, global_tags):
+def get_document_facets(documents):
     """
-    Remove a tag from a document.
+    Get the distinct document types, case IDs and tags used for filtering.
+    
+    Memoized on the documents' filterable fields like get_all_tags, so the sets are
+    only rebuilt when a document is added, removed or re-tagged.
     
     Args:
-        doc_id: ID of the document
-        tag_to_remove: Tag to remove
         documents: List of all documents
-        global_tags: Set of all unique tags
     
     Returns:
-        Boolean indicating success
+        Tuple of (types, case IDs, tags, tag counts); the first three are sorted
+        tuples and tag counts maps each tag to the number of documents that have it
     """
-    for i, doc in enumerate(documents):
-        if doc["id"] == doc_id:
-            current_tags = list(doc.get("tags", []))
-            
-            if tag_to_remove in current_tags:
-                # Remove the tag from the document
-                current_tags.remove(tag_to_remove)
-                documents[i]["tags"] = current_tags
-                
-                # Update global tags if needed
-                tag_still_used = any(tag_to_remove in d.get("tags", []) for d in documents)
-                if not tag_still_used:
-                    global_tags.discard(tag_to_remove)
-                
-                return True
+    return _document_facets_cached(tuple(
+        (doc["type"], doc["case_id"], tuple(doc.get("tags") or ()))
+        for doc in documents
+    ))
+
+@functools.lru_cache(maxsize=32)
+def _document_facets_cached(facets_per_document):
+    """Sorted distinct values of each facet, plus per-tag document counts"""
+    types = {doc_type for doc_type, _, _ in facets_per_document}
+    case_ids = {case_id for _, case_id, _ in facets_per_document if case_id}
+    tag_counts = Counter(tag for _, _, doc_tags in facets_per_document for tag in set(doc_tags))
+    return tuple(sorted(types)), tuple(sorted(case_ids)), tuple(sorted(tag_counts)), tag_counts
+
+def get_document_filter_index(documents):
+    """
+    Get inverted indexes from document type and tag to document IDs.
     
-    return False
+    Memoized on the documents' filterable fields like get_document_facets, so the
+    indexes are only rebuilt when a document is added, removed, re-tagged or renamed.
+    
+    Args:
+        documents: List of all documents
+    
+    Returns:
+        Tuple of (type -> frozenset of IDs, tag -> frozenset of IDs, ID -> lowercased case ID)
+    """
+    return _document_filter_index_cached(tuple(
+        (doc["id"], doc["type"], doc["case_id"], tuple(doc.get("tags") or ()))
+        for doc in documents
+    ))
+
+@functools.lru_cache(maxsize=32)
+def _document_filter_index_cached(fields_per_document):
+    """Build the type and tag inverted indexes and the lowercased case IDs"""
+    ids_by_type = {}
+    ids_by_tag = {}
+    case_ids_lower = {}
+    for doc_id, doc_type, case_id, tags in fields_per_document:
+        ids_by_type.setdefault(doc_type, set()).add(doc_id)
+        for tag in tags:
+            ids_by_tag.setdefault(tag, set()).add(doc_id)
+        case_ids_lower[doc_id] = case_id.lower()
+    return (
+        {doc_type: frozenset(ids) for doc_type, ids in ids_by_type.items()},
+        {tag: frozenset(ids) for tag, ids in ids_by_tag.items()},
+        case_ids_lower
+    )
 
 def debug_document_format(documents):
     """
@@ -141,7 +228,6 @@ def test_retriever_functionality(vectorstore, query="test query"):
         List of retrieved documents or None if error
     """
     import streamlit as st
-    from langchain_openai import OpenAIEmbeddings
     
     try:
         # First check if the vectorstore is initialized
@@ -175,10 +261,11 @@ def test_retriever_functionality(vectorstore, query="test query"):
         # Try to diagnose the issue
         try:
             # Check if embeddings can be created
-            st.write("Testing embeddings functionality...")
-            embeddings = OpenAIEmbeddings()
-            test_embedding = embeddings.embed_query("test")
-            st.write(f"Embedding generation works. Vector length: {len(test_embedding)}")
+            # The probe is a paid API call, so it runs at most once per session
+            if "_embedding_probe_length" not in st.session_state:
+                st.write("Testing embeddings functionality...")
+                st.session_state._embedding_probe_length = len(OpenAIEmbeddings().embed_query("test"))
+            st.write(f"Embedding generation works. Vector length: {st.session_state._embedding_probe_length}")
             
             # Check if the collection exists and has documents
             st.write("Checking vector store collection...")
@@ -198,4 +285,184 @@ def test_retriever_functionality(vectorstore, query="test query"):
         except Exception as inner_e:
             st.error(f"Error during diagnostics: {str(inner_e)}")
             
-        return None
\ No newline at end of file
+        return None
+
+# Messages being collected on each thread instead of rendered (see collect_messages)
+_collected_messages = threading.local()
+
+@contextlib.contextmanager
+def collect_messages(messages=None):
+    """
+    Collect the status messages reported on this thread instead of rendering them
+    
+    For work running off the script thread, where Streamlit elements can't be
+    rendered; the script thread shows the messages afterwards (see show_messages).
+    
+    Args:
+        messages: List to append to, so another thread can read it as it fills
+        
+    Yields:
+        List of (element name, message) pairs
+    """
+    messages = [] if messages is None else messages
+    previous = getattr(_collected_messages, "messages", None)
+    _collected_messages.messages = messages
+    try:
+        yield messages
+    finally:
+        _collected_messages.messages = previous
+
+def report(element, message):
+    """
+    Show a status message, or collect it if this thread is collecting messages
+    
+    Args:
+        element: Name of the Streamlit element that shows it, e.g. "info", "warning" or "write"
+        message: Message to show
+    """
+    messages = getattr(_collected_messages, "messages", None)
+    if messages is not None:
+        messages.append((element, message))
+        return
+    
+    import streamlit as st
+    getattr(st, element)(message)
+
+def show_messages(messages):
+    """Render status messages collected off the script thread"""
+    import streamlit as st
+    
+    for element, message in messages:
+        getattr(st, element)(message)
+
+# Connection pool shared by the OpenAI clients, keeping TLS connections open between calls
+HTTP_POOL_LIMITS = httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=30)
+# Same timeouts as the OpenAI client's defaults
+HTTP_TIMEOUT = httpx.Timeout(600.0, connect=5.0)
+
+@functools.lru_cache(maxsize=1)
+def get_http_client():
+    """Process-wide HTTP client, so embedding and chat calls reuse open connections"""
+    return httpx.Client(limits=HTTP_POOL_LIMITS, timeout=HTTP_TIMEOUT)
+
+@functools.lru_cache(maxsize=4)
+def warm_openai_connection(api_key):
+    """
+    Open a pooled connection to the OpenAI API in the background, once per API key
+    
+    Otherwise the first embedding or chat call pays for the TLS handshake. Listing
+    models costs no tokens, and failures are ignored since this is only a warmup.
+    
+    Args:
+        api_key: OpenAI API key (part of the cache key)
+    """
+    def warm():
+        try:
+            from openai import OpenAI
+            OpenAI(api_key=api_key, http_client=get_http_client()).models.list()
+        except Exception:
+            pass
+    
+    threading.Thread(target=warm, name="openai-warmup", daemon=True).start()
+
+@functools.lru_cache(maxsize=1)
+def get_async_http_client():
+    """
+    Process-wide async HTTP client for calls made on the shared event loop
+    
+    Only use it from coroutines submitted with submit_async, since its connections
+    belong to that loop.
+    """
+    return httpx.AsyncClient(limits=HTTP_POOL_LIMITS, timeout=HTTP_TIMEOUT)
+
+# Shared event loop for async network calls
+_event_loop = None
+_event_loop_lock = threading.Lock()
+_STREAM_END = object()
+
+def get_event_loop():
+    """
+    Get the process-wide event loop used for async network calls.
+    
+    The loop runs forever in a daemon thread, so async HTTP clients that are cached
+    across reruns stay bound to a live loop. Only pure I/O coroutines should be
+    submitted here; Streamlit calls must stay on the script thread.
+    
+    Returns:
+        asyncio event loop
+    """
+    global _event_loop
+    with _event_loop_lock:
+        if _event_loop is None:
+            _event_loop = asyncio.new_event_loop()
+            threading.Thread(target=_event_loop.run_forever, name="async-io-loop", daemon=True).start()
+    return _event_loop
+
+def submit_async(coro):
+    """
+    Schedule a coroutine on the shared event loop without waiting for it.
+    
+    Args:
+        coro: Coroutine to run
+    
+    Returns:
+        concurrent.futures.Future for the coroutine's result
+    """
+    return asyncio.run_coroutine_threadsafe(coro, get_event_loop())
+
+def run_async(coro):
+    """Run a coroutine on the shared event loop and wait for its result"""
+    return submit_async(coro).result()
+
+async def _anext_or_end(iterator):
+    """Await the next item of an async iterator, returning a sentinel when it is exhausted"""
+    try:
+        return await iterator.__anext__()
+    except StopAsyncIteration:
+        return _STREAM_END
+
+async def _aclose_after(pending, iterator):
+    """Close an async iterator once its in-flight __anext__ call has settled"""
+    try:
+        await asyncio.wrap_future(pending)
+    except (Exception, asyncio.CancelledError):
+        pass
+    aclose = getattr(iterator, "aclose", None)
+    if aclose is not None:
+        await aclose()
+
+def iterate_async(async_iterable):
+    """
+    Consume an async iterable from synchronous code.
+    
+    The first item is requested as soon as this is called and each following item
+    is requested as soon as the previous one arrives, so network I/O overlaps with
+    whatever the caller does in between. If the caller stops early, the iterable is
+    closed on the event loop so its stream and connection are released.
+    
+    Args:
+        async_iterable: Async iterable to consume, e.g. llm.astream(...)
+    
+    Returns:
+        Generator over the items
+    """
+    iterator = async_iterable.__aiter__()
+    pending = submit_async(_anext_or_end(iterator))
+    
+    def items():
+        nonlocal pending
+        ended = False
+        try:
+            while True:
+                item = pending.result()
+                if item is _STREAM_END:
+                    ended = True
+                    return
+                pending = submit_async(_anext_or_end(iterator))
+                yield item
+        finally:
+            if not ended:
+                pending.cancel()
+                submit_async(_aclose_after(pending, iterator))
+    
+    return items()
@@ -1,33 +1,800 @@
 import streamlit as st
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_openai import OpenAIEmbeddings
+from langchain.embeddings import CacheBackedEmbeddings
+from langchain.storage import LocalFileStore
 from langchain_community.vectorstores import Chroma
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from utils import get_http_client, get_page_texts, report
 import os
 import uuid
+import numpy as np
+import asyncio
+import functools
+import hashlib
+import itertools
+import json
+import orjson
+import logging
+import pickle
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
-def initialize_vectorstore(documents, use_in_memory=True, vectorstore_type="chroma", pinecone_index=None):
+logger = logging.getLogger(__name__)
+
+# FAISS, used for the local exact-search vector store when installed
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+# Directory in a library used for the persistent Chroma store
+CHROMA_DIRECTORY_NAME = "chroma_db"
+
+# Each user's documents and local vector stores live in their own directory here,
+# so sessions of different users never read or overwrite each other's library
+LIBRARIES_DIRECTORY = ".streamlit/libraries"
+
+# File in a library the document list is saved to, so a restart can reuse the persisted vectors
+DOCUMENTS_FILE_NAME = "documents.pkl"
+
+# Document keys rebuilt on demand, which aren't worth saving
+DERIVED_DOCUMENT_KEYS = ("search_index", "pages_json")
+
+# FAISS index file in a library, and the chunks it holds (FAISS itself only stores
+# vectors), with a suffix per embedding model (see get_store_suffix)
+FAISS_INDEX_FILE_NAME = "faiss{suffix}.index"
+FAISS_DOCSTORE_FILE_NAME = "faiss_docstore{suffix}.pkl"
+
+# Embedding models for the local stores: OpenAI (the only one Pinecone uses), or
+# sentence-transformers models that run on this machine
+DEFAULT_EMBEDDING_MODEL = "openai"
+LOCAL_EMBEDDING_MODELS = {
+    "all-MiniLM-L6-v2": "sentence-transformers/all-MiniLM-L6-v2",
+    "bge-small-en-v1.5": "BAAI/bge-small-en-v1.5"
+}
+EMBEDDING_MODELS = (DEFAULT_EMBEDDING_MODEL, *LOCAL_EMBEDDING_MODELS)
+LOCAL_EMBEDDING_BATCH_SIZE = 64
+
+# Collections are re-indexed into an 8-bit scalar quantized FAISS index (a quarter
+# of the memory) once they hold this many chunks; smaller ones stay full precision,
+# being too few vectors to train the quantizer's ranges on
+FAISS_QUANTIZE_MIN_VECTORS = 10_000
+# Widen the trained ranges by this fraction, for vectors added after training
+FAISS_QUANTIZER_RANGE_MARGIN = 0.1
+
+# On-disk cache of chunk embeddings, keyed by a hash of the chunk text per model
+EMBEDDING_CACHE_DIRECTORY = ".streamlit/embedding_cache"
+
+# Size and overlap, in characters, of the chunks documents are split into
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 100
+
+# Most vector IDs Pinecone accepts in one delete request
+PINECONE_DELETE_BATCH_SIZE = 1000
+
+# Chunks embedded and upserted per Pinecone request, and upserts in flight at once
+PINECONE_UPSERT_BATCH_SIZE = 100
+PINECONE_POOL_THREADS = 30
+# Upsert requests kept in flight before waiting on the oldest, so the payloads
+# held for retrying throttled requests stay bounded regardless of corpus size
+PINECONE_MAX_PENDING_UPSERTS = 2 * PINECONE_POOL_THREADS
+
+# Seconds that Pinecone index listings and stats are cached for the settings panel
+PINECONE_INFO_TTL_SECONDS = 60
+
+# Pinecone rejects upsert requests over 2MB and throttles writes per namespace
+# at 50MB/s, so requests and throughput are kept safely under both
+PINECONE_MAX_REQUEST_BYTES = 1_800_000
+PINECONE_MAX_BYTES_PER_SECOND = 45_000_000
+
+# Delays before retrying a throttled upsert
+PINECONE_RETRY_DELAYS = (0.5, 1, 2, 4, 8)
+
+# SQLite database of the text of chunks uploaded to Pinecone, which only stores their vectors
+PINECONE_CHUNK_TEXTS_PATH = ".streamlit/pinecone_chunks.sqlite"
+# Most vector IDs looked up or deleted per SQLite statement (SQLite's variable limit is 999)
+SQLITE_MAX_VARIABLES = 900
+
+# Chunks embedded per request when adding to Chroma, and embedding requests kept
+# in flight ahead of the batch being written to the store
+EMBED_BATCH_SIZE = 100
+EMBED_AHEAD_BATCHES = 4
+
+def chunks(iterable, batch_size):
+    """Split an iterable into tuples of at most batch_size items"""
+    iterator = iter(iterable)
+    while batch := tuple(itertools.islice(iterator, batch_size)):
+        yield batch
+
+def embed_batches_ahead(embeddings, batches, ahead=EMBED_AHEAD_BATCHES):
+    """
+    Embed batches of chunks with several requests in flight, yielding them in order
+    
+    While the caller writes one batch to the vector store, the next batches are
+    already being embedded, so ingest takes about as long as the slower of the two
+    stages instead of their sum.
+    
+    Args:
+        embeddings: Embeddings used for the chunks
+        batches: Iterable of tuples of LangChain Documents
+        ahead: Most embedding requests in flight at once
+        
+    Yields:
+        Tuples of (batch, list of embeddings)
+    """
+    with ThreadPoolExecutor(max_workers=ahead, thread_name_prefix="embed") as executor:
+        in_flight = deque()
+        for batch in batches:
+            in_flight.append((batch, executor.submit(embeddings.embed_documents, [doc.page_content for doc in batch])))
+            if len(in_flight) >= ahead:
+                batch, future = in_flight.popleft()
+                yield batch, future.result()
+        while in_flight:
+            batch, future = in_flight.popleft()
+            yield batch, future.result()
+
+def pack_vectors(vectors, max_bytes=PINECONE_MAX_REQUEST_BYTES):
+    """
+    Greedily group vector records into requests whose JSON payload fits in max_bytes
+    
+    Args:
+        vectors: List of Pinecone vector records
+        max_bytes: Largest request payload allowed
+        
+    Yields:
+        Tuples of (list of vectors, payload size in bytes)
+    """
+    batch = []
+    batch_bytes = 0
+    for vector in vectors:
+        vector_bytes = len(orjson.dumps(vector))
+        if batch and batch_bytes + vector_bytes > max_bytes:
+            yield batch, batch_bytes
+            batch = []
+            batch_bytes = 0
+        batch.append(vector)
+        batch_bytes += vector_bytes
+    if batch:
+        yield batch, batch_bytes
+
+def is_rate_limited(error):
+    """Whether a Pinecone error means the request was throttled"""
+    return getattr(error, "status", None) == 429 or "RESOURCE_EXHAUSTED" in str(error) or "Too Many Requests" in str(error)
+
+class TokenBucket:
+    """
+    Token bucket rate limiter
+    
+    acquire() sleeps until the bucket holds enough tokens for the request, so the
+    sustained rate stays under rate tokens per second.
+    """
+    
+    def __init__(self, rate, capacity=None):
+        """Initialize the bucket full, holding at most capacity (default: rate) tokens"""
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def acquire(self, amount):
+        """Take amount tokens, waiting for them to refill if necessary"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            
+            # Requests bigger than the bucket just wait for a full bucket
+            amount = min(amount, self.capacity)
+            if self.tokens < amount:
+                time.sleep((amount - self.tokens) / self.rate)
+                self.tokens = amount
+                self.updated_at = time.monotonic()
+            self.tokens -= amount
+
+def compute_document_hash(doc):
+    """
+    Compute a stable hash of a document's content and the metadata stored with its chunks.
+    
+    Any change to the text, title, type, case ID or tags produces a new hash, so
+    persisted chunks carrying an old hash can be recognised as stale.
+    
+    Args:
+        doc: Document dictionary
+    
+    Returns:
+        Hex digest string
+    """
+    hasher = hashlib.sha256()
+    hasher.update(json.dumps({
+        "id": doc.get("id", ""),
+        "title": doc.get("title", ""),
+        "type": doc.get("type", ""),
+        "case_id": doc.get("case_id", ""),
+        "tags": doc.get("tags", []),
+        "uploaded_by": doc.get("uploaded_by", ""),
+        "uploaded_by_name": doc.get("uploaded_by_name", "")
+    }, sort_keys=True, default=str).encode("utf-8"))
+    
+    for page_content in get_page_texts(doc):
+        hasher.update(page_content.encode("utf-8"))
+    
+    return hasher.hexdigest()
+
+class DeduplicatingEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that embeds each distinct text in a call only once.
+    
+    Legal documents share a lot of boilerplate, so identical chunks are common
+    within one upload or rebuild.
+    """
+    
+    def __init__(self, embeddings):
+        """Wrap an embeddings object"""
+        self.embeddings = embeddings
+    
+    def embed_documents(self, texts):
+        """Embed texts, sending duplicates to the wrapped embeddings only once"""
+        unique_texts = list(dict.fromkeys(texts))
+        if len(unique_texts) == len(texts):
+            return self.embeddings.embed_documents(texts)
+        
+        vectors = dict(zip(unique_texts, self.embeddings.embed_documents(unique_texts)))
+        return [vectors[text] for text in texts]
+    
+    def embed_query(self, text):
+        """Embed a query"""
+        return self.embeddings.embed_query(text)
+
+@st.cache_resource(show_spinner="Loading embedding model...")
+def get_local_embeddings(embedding_model):
+    """
+    Load a sentence-transformers embedding model once per process
+    
+    Args:
+        embedding_model: Key of LOCAL_EMBEDDING_MODELS
+        
+    Returns:
+        Embeddings object producing normalized vectors
+    """
+    import torch
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+    
+    return HuggingFaceEmbeddings(
+        model_name=LOCAL_EMBEDDING_MODELS[embedding_model],
+        model_kwargs={"device": "cuda" if torch.cuda.is_available() else "cpu"},
+        encode_kwargs={"batch_size": LOCAL_EMBEDDING_BATCH_SIZE, "normalize_embeddings": True}
+    )
+
+@st.cache_resource(show_spinner=False)
+def get_openai_embeddings(api_key):
+    """
+    Get a shared OpenAI embeddings client for an API key
+    
+    Args:
+        api_key: OpenAI API key (part of the cache key)
+        
+    Returns:
+        OpenAIEmbeddings reused across reruns, rebuilds and upload workers
+    """
+    return OpenAIEmbeddings(openai_api_key=api_key, http_client=get_http_client())
+
+def get_embeddings(embedding_model=DEFAULT_EMBEDDING_MODEL):
+    """
+    Get embeddings backed by the on-disk embedding cache.
+    
+    Chunks whose text was embedded before (by any rebuild, store type or session)
+    are read from the cache, and only new distinct texts are embedded, in one
+    batch. Queries are not cached here; the chat's semantic query cache covers them.
+    
+    Args:
+        embedding_model: One of EMBEDDING_MODELS
+    
+    Returns:
+        Embeddings object
+    """
+    if embedding_model in LOCAL_EMBEDDING_MODELS:
+        embeddings = get_local_embeddings(embedding_model)
+        namespace = embedding_model
+    else:
+        embeddings = get_openai_embeddings(os.environ.get("OPENAI_API_KEY"))
+        namespace = embeddings.model
+    return DeduplicatingEmbeddings(CacheBackedEmbeddings.from_bytes_store(
+        embeddings,
+        LocalFileStore(EMBEDDING_CACHE_DIRECTORY),
+        namespace=namespace
+    ))
+
+def get_store_suffix(embedding_model):
+    """
+    Suffix for the names of stores persisted with an embedding model
+    
+    Vectors from different models can't share an index, so each model persists
+    its own. The default model keeps the original names.
+    """
+    if embedding_model == DEFAULT_EMBEDDING_MODEL:
+        return ""
+    return "_" + embedding_model.replace("-", "_").replace(".", "_").lower()
+
+def can_embed(embedding_model):
+    """Whether an embedding model can be used now (OpenAI needs an API key)"""
+    return embedding_model in LOCAL_EMBEDDING_MODELS or bool(os.environ.get("OPENAI_API_KEY"))
+
+def get_library_directory(username):
+    """
+    Directory holding a user's saved documents and local vector stores
+    
+    Args:
+        username: Username of the library's owner
+    
+    Returns:
+        Path of the directory (created when first written to)
+    """
+    # Readable, filesystem-safe name, with a hash so distinct usernames never collide
+    safe_name = "".join(c if c.isalnum() or c in "-_" else "_" for c in username)
+    digest = hashlib.sha256(username.encode("utf-8")).hexdigest()[:8]
+    return os.path.join(LIBRARIES_DIRECTORY, f"{safe_name}_{digest}")
+
+def save_documents(documents, library_dir):
+    """
+    Save a user's document list next to their persistent vector store.
+    
+    Written to a temporary file and renamed, so a crash never leaves a partial file.
+    
+    Args:
+        documents: List of all the user's documents
+        library_dir: The user's library directory
+    """
+    documents_path = os.path.join(library_dir, DOCUMENTS_FILE_NAME)
+    try:
+        os.makedirs(library_dir, exist_ok=True)
+        tmp_path = documents_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(
+                [{key: value for key, value in doc.items() if key not in DERIVED_DOCUMENT_KEYS} for doc in documents],
+                f,
+                protocol=pickle.HIGHEST_PROTOCOL
+            )
+        os.replace(tmp_path, documents_path)
+    except Exception as e:
+        st.warning(f"Could not save documents: {str(e)}")
+
+def load_documents(library_dir):
+    """
+    Load the document list a user saved in a previous session.
+    
+    Args:
+        library_dir: The user's library directory
+    
+    Returns:
+        List of documents, empty if none were saved
+    """
+    documents_path = os.path.join(library_dir, DOCUMENTS_FILE_NAME)
+    if not os.path.exists(documents_path):
+        return []
+    
+    try:
+        with open(documents_path, "rb") as f:
+            return pickle.load(f)
+    except Exception as e:
+        st.warning(f"Could not load saved documents: {str(e)}")
+        return []
+
+def load_vectorstore(documents, library_dir, vectorstore_type="chroma", pinecone_index=None, embedding_model=DEFAULT_EMBEDDING_MODEL):
+    """
+    Reconnect to the vectors of saved documents without re-embedding them.
+    
+    Chroma and FAISS are reloaded from disk. Pinecone keeps vectors
+    server-side, so the index is reopened and the chunk IDs of the saved
+    documents are recomputed (splitting only, no embedding calls).
+    
+    Args:
+        documents: Documents saved by a previous session
+        library_dir: Library directory the documents were loaded from
+        vectorstore_type: Type of vectorstore to use ("chroma", "faiss" or "pinecone")
+        pinecone_index: Name of Pinecone index to use (if vectorstore_type is "pinecone")
+        embedding_model: Embedding model of a Chroma or FAISS store
+    
+    Returns:
+        Vector store, or None if there is nothing to reconnect to
+    """
+    if vectorstore_type == "chroma":
+        return load_persisted_vectorstore(library_dir, embedding_model)
+    
+    if vectorstore_type == "faiss":
+        if not documents or not can_embed(embedding_model):
+            return None
+        try:
+            return FaissVectorStore.load(get_embeddings(embedding_model), library_dir, embedding_model)
+        except Exception as e:
+            st.warning(f"Could not load saved FAISS index: {str(e)}")
+            return None
+    
+    if not documents or not pinecone_index or not os.environ.get("PINECONE_API_KEY"):
+        return None
+    
+    try:
+        vectorstore = PineconeVectorStore(
+            langchain_docs=[],
+            embeddings=get_embeddings(),
+            pinecone_index=pinecone_index
+        )
+        vectorstore.register_documents(iter_document_chunks(documents))
+        return vectorstore
+    except Exception as e:
+        st.warning(f"Could not reconnect to Pinecone index: {str(e)}")
+        return None
+
+def get_chroma_collection_name(embedding_model):
+    """Name of the persistent Chroma collection holding an embedding model's vectors"""
+    return "langchain" + get_store_suffix(embedding_model)
+
+def get_chroma_directory(library_dir):
+    """Directory of a library's persistent Chroma store"""
+    return os.path.join(library_dir, CHROMA_DIRECTORY_NAME)
+
+def load_persisted_vectorstore(library_dir, embedding_model=DEFAULT_EMBEDDING_MODEL):
+    """
+    Load a library's persistent Chroma store from disk if one exists.
+    
+    Args:
+        library_dir: The user's library directory
+        embedding_model: Embedding model the store was built with
+    
+    Returns:
+        Chroma vector store, or None if nothing has been persisted
+    """
+    persist_directory = get_chroma_directory(library_dir)
+    if not os.path.isdir(persist_directory) or not can_embed(embedding_model):
+        return None
+    
+    try:
+        vectorstore = Chroma(
+            collection_name=get_chroma_collection_name(embedding_model),
+            persist_directory=persist_directory,
+            embedding_function=get_embeddings(embedding_model)
+        )
+        if vectorstore._collection.count() == 0:
+            return None
+        return vectorstore
+    except Exception as e:
+        st.warning(f"Could not load persisted vector store: {str(e)}")
+        return None
+
+def clear_persisted_vectorstore(library_dir):
+    """Delete all chunks from a library's persistent Chroma store, for every embedding model"""
+    persist_directory = get_chroma_directory(library_dir)
+    if os.path.isdir(persist_directory):
+        for embedding_model in EMBEDDING_MODELS:
+            Chroma(
+                collection_name=get_chroma_collection_name(embedding_model),
+                persist_directory=persist_directory
+            ).delete_collection()
+
+def update_persistent_chroma(langchain_docs, embeddings, library_dir, embedding_model=DEFAULT_EMBEDDING_MODEL,
+                             progress_callback=None, removed_doc_ids=()):
+    """
+    Sync a library's persistent Chroma store with the current document chunks.
+    
+    Only chunks of documents this session removed, or of current documents whose
+    content changed, are deleted; chunks of documents this session doesn't know
+    about are left alone. Only chunks from new or changed documents are embedded
+    and added.
+    
+    Args:
+        langchain_docs: List of LangChain Documents carrying "doc_id" and "doc_hash" metadata
+        embeddings: Embeddings used for new chunks
+        library_dir: The user's library directory
+        embedding_model: Embedding model the embeddings come from
+        progress_callback: Called with (chunks embedded, chunks to embed) as they're written
+        removed_doc_ids: IDs of documents this session removed
+    
+    Returns:
+        Chroma vector store
+    """
+    vectorstore = Chroma(
+        collection_name=get_chroma_collection_name(embedding_model),
+        persist_directory=get_chroma_directory(library_dir),
+        embedding_function=embeddings
+    )
+    
+    current_hashes = {doc.metadata["doc_id"]: doc.metadata["doc_hash"] for doc in langchain_docs}
+    existing = vectorstore.get(include=["metadatas"])
+    existing_hashes = {metadata.get("doc_hash") for metadata in existing["metadatas"] if metadata}
+    
+    # Prune chunks of documents this session removed, and stale chunks of changed documents
+    removed_doc_ids = {str(doc_id) for doc_id in removed_doc_ids}
+    stale_ids = [
+        chunk_id for chunk_id, metadata in zip(existing["ids"], existing["metadatas"])
+        if metadata and (metadata.get("doc_id") in removed_doc_ids
+                         or metadata.get("doc_id") in current_hashes
+                         and metadata.get("doc_hash") != current_hashes[metadata.get("doc_id")])
+    ]
+    if stale_ids:
+        vectorstore._collection.delete(ids=stale_ids)
+    
+    # Only embed chunks that are not already persisted
+    new_docs = [doc for doc in langchain_docs if doc.metadata["doc_hash"] not in existing_hashes]
+    if new_docs:
+        add_chunks_to_chroma(vectorstore, new_docs, progress_callback)
+    
+    report("info", f"Persisted vector store updated: {len(new_docs)} chunks embedded, {len(langchain_docs) - len(new_docs)} reused.")
+    return vectorstore
+
+@functools.lru_cache(maxsize=1)
+def get_text_splitter():
+    """Text splitter used to chunk document pages for embedding (built once and shared, as it keeps no state)"""
+    return RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE, 
+        chunk_overlap=CHUNK_OVERLAP
+    )
+
+def iter_document_chunks(documents):
+    """
+    Lazily split documents into chunks, one document at a time
+    
+    For consumers that don't need the total up front, so only the current
+    document's chunks and the batch being processed are held in memory.
+    
+    Args:
+        documents: Iterable of document dictionaries
+    
+    Yields:
+        LangChain Documents with simple-typed metadata
+    """
+    text_splitter = get_text_splitter()
+    for doc in documents:
+        yield from build_document_chunks(doc, text_splitter)
+
+def build_document_chunks(doc, text_splitter, unique_chunks=None):
+    """
+    Split a document's pages into LangChain Documents ready for embedding.
+    
+    Args:
+        doc: Document dictionary
+        text_splitter: Text splitter used to chunk each page
+        unique_chunks: Optional set of chunk keys already produced, used to skip duplicates
+    
+    Returns:
+        List of LangChain Documents with simple-typed metadata
+    """
+    if unique_chunks is None:
+        unique_chunks = set()
+    
+    langchain_docs = []
+    
+    try:
+        # Skip invalid documents
+        if not isinstance(doc, dict) or "pages" not in doc:
+            report("warning", f"Skipping invalid document: {type(doc)}")
+            return langchain_docs
+            
+        # Get the tags as a comma-separated string
+        tags_list = doc.get("tags", [])
+        if not isinstance(tags_list, list):
+            tags_list = []
+        tags_str = ",".join(tags_list)
+        doc_hash = compute_document_hash(doc)
+        doc_id = str(doc.get("id", ""))
+        
+        # Metadata shared by every chunk of the document, with only simple types
+        base_metadata = {
+            "source": str(doc.get("title", "")),
+            "doc_id": doc_id,
+            "doc_type": str(doc.get("type", "")),
+            "case_id": str(doc.get("case_id", "")),
+            "tags_str": tags_str,  # Store as string
+            "doc_hash": doc_hash  # Used to prune stale chunks from persisted stores
+        }
+        
+        # Add uploader information if available
+        if doc.get("uploaded_by"):
+            base_metadata["uploaded_by"] = str(doc.get("uploaded_by", ""))
+            base_metadata["uploaded_by_name"] = str(doc.get("uploaded_by_name", ""))
+        
+        # Process each page; the page texts are extracted once per document, not dispatched per page
+        for i, page_content in enumerate(get_page_texts(doc)):
+            # Split the content into chunks. A page that fits in one chunk comes back from
+            # the splitter as its stripped text, so skip the separator walk for it.
+            if len(page_content) <= CHUNK_SIZE:
+                stripped = page_content.strip()
+                chunks = [stripped] if stripped else []
+            else:
+                chunks = text_splitter.split_text(page_content)
+            
+            # Create document objects for each chunk
+            for j, chunk in enumerate(chunks):
+                # Create a unique key for this chunk to detect duplicates
+                # Using doc id, page number, chunk index and hash of content
+                chunk_hash = hashlib.sha256(chunk.encode("utf-8")).hexdigest()[:16]
+                chunk_key = f"{doc_id}_{i}_{j}_{chunk_hash}"
+                
+                # Skip if we've already processed this exact chunk
+                if chunk_key in unique_chunks:
+                    continue
+                
+                # Add to unique chunks set
+                unique_chunks.add(chunk_key)
+                
+                # Copy the shared metadata and add the chunk's own fields
+                metadata = {
+                    **base_metadata,
+                    "page": i,
+                    "chunk": j,
+                    "chunk_key": chunk_key  # Store unique key for future deduplication
+                }
+                
+                # Create a LangChain Document
+                langchain_docs.append(Document(
+                    page_content=chunk,
+                    metadata=metadata
+                ))
+        
+    except Exception as e:
+        report("warning", f"Error processing document {doc.get('title', 'Unknown') if isinstance(doc, dict) else ''}: {str(e)}")
+    
+    return langchain_docs
+
+def add_chunks_to_chroma(vectorstore, langchain_docs, progress_callback=None):
+    """
+    Embed chunks and write them to a Chroma collection in batches
+    
+    Each batch is written with one collection upsert, keyed by chunk key, while
+    the following batches are embedded.
+    
+    Args:
+        vectorstore: Chroma vector store
+        langchain_docs: List of LangChain Documents carrying "chunk_key" metadata
+        progress_callback: Called with (chunks written, total chunks) after each batch
+    """
+    written = 0
+    batches = chunks(langchain_docs, EMBED_BATCH_SIZE)
+    for batch, embeddings in embed_batches_ahead(vectorstore.embeddings, batches):
+        vectorstore._collection.upsert(
+            ids=[doc.metadata["chunk_key"] for doc in batch],
+            embeddings=embeddings,
+            metadatas=[doc.metadata for doc in batch],
+            documents=[doc.page_content for doc in batch]
+        )
+        written += len(batch)
+        if progress_callback:
+            progress_callback(written, len(langchain_docs))
+
+def prefetch_embeddings(documents, embedding_model=DEFAULT_EMBEDDING_MODEL):
+    """
+    Embed documents' chunks into the embedding cache without indexing them.
+    
+    Run on an upload worker, so that adding the documents to the vector store on
+    the script thread later reads cached vectors instead of calling the API.
+    Failures are ignored; the chunks are then embedded when they're indexed.
+    
+    Args:
+        documents: List of document dictionaries
+        embedding_model: Embedding model the documents will be indexed with
+    """
+    try:
+        for _ in embed_batches_ahead(get_embeddings(embedding_model), chunks(iter_document_chunks(documents), EMBED_BATCH_SIZE)):
+            pass
+    except Exception:
+        pass
+
+def get_vectorstore_type(vectorstore):
+    """Name of a vector store's type, as used for the "vectorstore_type" setting"""
+    if isinstance(vectorstore, PineconeVectorStore):
+        return "pinecone"
+    if isinstance(vectorstore, FaissVectorStore):
+        return "faiss"
+    return "chroma"
+
+def vectorstore_upsert(vectorstore, documents):
+    """
+    Embed and add the chunks of new or changed documents to an existing vector store.
+    
+    Any chunks the documents already had are replaced, and no other document is
+    re-embedded.
+    
+    Args:
+        vectorstore: Chroma or PineconeVectorStore to update
+        documents: List of document dictionaries to (re-)index
+    
+    Returns:
+        Number of chunks embedded
+    """
+    text_splitter = get_text_splitter()
+    langchain_docs = [chunk for doc in documents for chunk in build_document_chunks(doc, text_splitter)]
+    
+    vectorstore_delete(vectorstore, [doc["id"] for doc in documents])
+    if langchain_docs:
+        if isinstance(vectorstore, (PineconeVectorStore, FaissVectorStore)):
+            vectorstore.add_documents(langchain_docs)
+        else:
+            add_chunks_to_chroma(vectorstore, langchain_docs)
+    
+    return len(langchain_docs)
+
+def vectorstore_delete(vectorstore, doc_ids):
+    """
+    Delete every chunk of the given documents from a vector store.
+    
+    Args:
+        vectorstore: Chroma or PineconeVectorStore to update
+        doc_ids: IDs of the documents to remove
+    """
+    doc_ids = [str(doc_id) for doc_id in doc_ids]
+    if not doc_ids:
+        return
+    
+    if isinstance(vectorstore, (PineconeVectorStore, FaissVectorStore)):
+        vectorstore.delete_documents(doc_ids)
+    else:
+        vectorstore._collection.delete(where={"doc_id": {"$in": doc_ids}})
+
+def vectorstore_update_metadata(vectorstore, documents):
+    """
+    Update the tags stored with documents' chunks without re-embedding them.
+    
+    Tags only live in chunk metadata, so a tag change never needs new embeddings.
+    
+    Args:
+        vectorstore: Chroma or PineconeVectorStore to update
+        documents: List of document dictionaries whose tags changed
+    """
+    for doc in documents:
+        tags_list = doc.get("tags", [])
+        metadata_update = {
+            "tags_str": ",".join(tags_list if isinstance(tags_list, list) else []),
+            "doc_hash": compute_document_hash(doc)
+        }
+        
+        if isinstance(vectorstore, (PineconeVectorStore, FaissVectorStore)):
+            vectorstore.update_document_metadata(str(doc["id"]), metadata_update)
+        else:
+            existing = vectorstore._collection.get(where={"doc_id": str(doc["id"])}, include=["metadatas"])
+            if existing["ids"]:
+                vectorstore._collection.update(
+                    ids=existing["ids"],
+                    metadatas=[{**metadata, **metadata_update} for metadata in existing["metadatas"]]
+                )
+
+def initialize_vectorstore(documents, use_in_memory=True, vectorstore_type="chroma", pinecone_index=None,
+                           embedding_model=DEFAULT_EMBEDDING_MODEL, progress_callback=None,
+                           library_dir=None, removed_doc_ids=(), debug_mode=None):
     """
     Initialize vector store with documents, ensuring no duplicates.
     
     Args:
         documents: List of document objects
         use_in_memory: Whether to use in-memory storage (True) or persistent storage (False) for Chroma
-        vectorstore_type: Type of vectorstore to use ("chroma" or "pinecone")
+        vectorstore_type: Type of vectorstore to use ("chroma", "faiss" or "pinecone")
         pinecone_index: Name of Pinecone index to use (if vectorstore_type is "pinecone")
+        embedding_model: Embedding model for Chroma or FAISS (Pinecone always uses OpenAI)
+        progress_callback: Called with (chunks embedded, chunks to embed) after each batch
+        library_dir: The user's library directory, for the persistent stores
+        removed_doc_ids: IDs of documents this session removed, pruned from the persistent Chroma store
+        debug_mode: Whether to show debugging details (defaults to the session's setting)
     
     Returns:
         Vector store object
     """
+    if debug_mode is None:
+        debug_mode = st.session_state.get("debug_mode", False)
+    
     # Handle empty documents case
     if not documents:
-        st.warning("No documents provided for vectorstore initialization.")
+        if vectorstore_type == "chroma" and not use_in_memory:
+            clear_persisted_vectorstore(library_dir)
+        elif vectorstore_type == "faiss":
+            FaissVectorStore.clear(library_dir)
+        report("warning", "No documents provided for vectorstore initialization.")
         return None
-        
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000, 
-        chunk_overlap=100
-    )
+    
+    text_splitter = get_text_splitter()
     
     langchain_docs = []
     
@@ -35,98 +802,28 @@ def initialize_vectorstore(documents, use_in_memory=True, vectorstore_type="chro
     unique_chunks = set()
     
     for doc in documents:
-        try:
-            # Skip invalid documents
-            if not isinstance(doc, dict) or "pages" not in doc:
-                st.warning(f"Skipping invalid document: {type(doc)}")
-                continue
-                
-            # Get the tags as a comma-separated string
-            tags_list = doc.get("tags", [])
-            if not isinstance(tags_list, list):
-                tags_list = []
-            tags_str = ",".join(tags_list)
-            
-            # Process each page
-            for i, page in enumerate(doc["pages"]):
-                try:
-                    # Extract page content based on type
-                    if hasattr(page, 'page_content'):
-                        # It's already a Document object
-                        page_content = page.page_content
-                    elif isinstance(page, str):
-                        # It's a string
-                        page_content = page
-                    elif isinstance(page, dict) and "page_content" in page:
-                        # It's a dict with page_content
-                        page_content = page["page_content"]
-                    else:
-                        # Try to convert to string
-                        page_content = str(page)
-                    
-                    # Split the content into chunks
-                    chunks = text_splitter.split_text(page_content)
-                    
-                    # Create document objects for each chunk
-                    for j, chunk in enumerate(chunks):
-                        # Create a unique key for this chunk to detect duplicates
-                        # Using doc id, page number, chunk index and hash of content
-                        chunk_key = f"{doc.get('id', '')}_{i}_{j}_{hash(chunk)}"
-                        
-                        # Skip if we've already processed this exact chunk
-                        if chunk_key in unique_chunks:
-                            continue
-                        
-                        # Add to unique chunks set
-                        unique_chunks.add(chunk_key)
-                        
-                        # Create metadata dictionary with only simple types
-                        metadata = {
-                            "source": str(doc.get("title", "")),
-                            "doc_id": str(doc.get("id", "")),
-                            "doc_type": str(doc.get("type", "")),
-                            "case_id": str(doc.get("case_id", "")),
-                            "tags_str": tags_str,  # Store as string
-                            "page": i,
-                            "chunk": j,
-                            "text": chunk,  # Add text as metadata for Pinecone
-                            "chunk_key": chunk_key  # Store unique key for future deduplication
-                        }
-                        
-                        # Add uploader information if available
-                        if doc.get("uploaded_by"):
-                            metadata["uploaded_by"] = str(doc.get("uploaded_by", ""))
-                            metadata["uploaded_by_name"] = str(doc.get("uploaded_by_name", ""))
-                        
-                        # Create a LangChain Document
-                        langchain_docs.append(Document(
-                            page_content=chunk,
-                            metadata=metadata
-                        ))
-                        
-                except Exception as e:
-                    st.warning(f"Error processing page {i} of document {doc.get('title', 'Unknown')}: {str(e)}")
-                    continue
-        except Exception as e:
-            st.warning(f"Error processing document: {str(e)}")
-            continue
+        langchain_docs.extend(build_document_chunks(doc, text_splitter, unique_chunks))
     
     if not langchain_docs:
-        st.warning("No documents were processed successfully for the vector store.")
+        report("warning", "No documents were processed successfully for the vector store.")
         return None
     
     try:
-        # Create embeddings
-        embeddings = OpenAIEmbeddings()
+        # Create embeddings, reusing cached vectors for chunks embedded before
+        if vectorstore_type == "pinecone":
+            embedding_model = DEFAULT_EMBEDDING_MODEL
+        embeddings = get_embeddings(embedding_model)
         
         # Log the first few documents for debugging
-        if st.session_state.get("debug_mode", False):
-            st.write(f"### Processed {len(langchain_docs)} unique document chunks (from {len(documents)} documents)")
-            st.write("### Sample Documents For Vector Store:")
+        if debug_mode:
+            # Rendered as one markdown element rather than one element per line
+            lines = [
+                f"### Processed {len(langchain_docs)} unique document chunks (from {len(documents)} documents)",
+                "### Sample Documents For Vector Store:"
+            ]
             for i, doc in enumerate(langchain_docs[:3]):  # Show first 3
-                st.write(f"Document {i}:")
-                st.write(f"  Content: {doc.page_content[:100]}...")
-                st.write(f"  Metadata: {doc.metadata}")
+                lines += [f"Document {i}:", f"  Content: {doc.page_content[:100]}...", f"  Metadata: {doc.metadata}"]
+            report("markdown", "\n\n".join(lines))
         
         # Create vectorstore based on selected type
         if vectorstore_type == "pinecone":
@@ -134,57 +831,213 @@ def initialize_vectorstore(documents, use_in_memory=True, vectorstore_type="chro
             return PineconeVectorStore(
                 langchain_docs=langchain_docs,
                 embeddings=embeddings,
-                pinecone_index=pinecone_index
+                pinecone_index=pinecone_index,
+                progress_callback=progress_callback
+            )
+        elif vectorstore_type == "faiss":
+            report("info", f"Creating FAISS vector store with {len(langchain_docs)} document chunks...")
+            FaissVectorStore.clear(library_dir)
+            return FaissVectorStore(
+                langchain_docs=langchain_docs,
+                embeddings=embeddings,
+                library_dir=library_dir,
+                embedding_model=embedding_model,
+                progress_callback=progress_callback
             )
         else:
             # Default to Chroma
-            st.info(f"Creating Chroma vector store with {len(langchain_docs)} document chunks (using in-memory storage)...")
+            if not use_in_memory:
+                report("info", f"Syncing {len(langchain_docs)} document chunks with the persistent Chroma store...")
+                return update_persistent_chroma(langchain_docs, embeddings, library_dir, embedding_model,
+                                                progress_callback, removed_doc_ids)
             
-            # Always create vectorstore with in-memory storage for now
-            vectorstore = Chroma.from_documents(
-                documents=langchain_docs,
-                embedding=embeddings
-                # No persist_directory parameter means in-memory storage
-            )
+            report("info", f"Creating Chroma vector store with {len(langchain_docs)} document chunks (using in-memory storage)...")
+            
+            # No persist_directory parameter means in-memory storage
+            vectorstore = Chroma(embedding_function=embeddings)
+            add_chunks_to_chroma(vectorstore, langchain_docs, progress_callback)
             return vectorstore
         
     except Exception as e:
-        st.error(f"Error creating vector store: {str(e)}")
+        report("error", f"Error creating vector store: {str(e)}")
         
-        if st.session_state.get("debug_mode", False):
+        if debug_mode:
             # More detailed error info in debug mode
-            st.write("Error details:")
-            st.write(str(e))
+            report("write", "Error details:")
+            report("write", str(e))
             import traceback
-            st.write(f"Traceback: {traceback.format_exc()}")
+            report("write", f"Traceback: {traceback.format_exc()}")
             
             # Print the first few documents to help diagnose
-            st.write("First document metadata sample:")
+            report("write", "First document metadata sample:")
             if langchain_docs:
-                st.write(langchain_docs[0].metadata)
+                report("write", langchain_docs[0].metadata)
             
         return None
 
+@st.cache_resource(show_spinner=False)
+def get_pinecone_client(api_key):
+    """
+    Get a shared Pinecone client for an API key
+    
+    Args:
+        api_key: Pinecone API key (part of the cache key)
+        
+    Returns:
+        Pinecone client reused across reruns and rebuilds
+    """
+    from pinecone import Pinecone
+    return Pinecone(api_key=api_key)
+
+class PineconeChunkTexts:
+    """
+    Text of the chunks uploaded to a Pinecone index, keyed by vector ID
+    
+    Chunk text isn't sent to Pinecone, so it is kept in a local SQLite database
+    that survives restarts. One connection is shared by every session, so
+    statements are serialized with a lock.
+    """
+    
+    def __init__(self, index_name, path=PINECONE_CHUNK_TEXTS_PATH):
+        """
+        Open (creating if needed) the chunk texts of an index
+        
+        Args:
+            index_name: Name of the Pinecone index
+            path: Path of the SQLite database
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.index_name = index_name
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS chunk_texts ("
+                "index_name TEXT NOT NULL, vector_id TEXT NOT NULL, text TEXT NOT NULL, "
+                "PRIMARY KEY (index_name, vector_id))"
+            )
+    
+    def set_many(self, texts):
+        """
+        Store chunk texts, replacing any already stored under the same IDs
+        
+        Args:
+            texts: Iterable of (vector ID, chunk text) pairs
+        """
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO chunk_texts (index_name, vector_id, text) VALUES (?, ?, ?)",
+                ((self.index_name, vector_id, text) for vector_id, text in texts)
+            )
+    
+    def get_many(self, vector_ids):
+        """
+        Look up the text of chunks
+        
+        Args:
+            vector_ids: List of vector IDs
+            
+        Returns:
+            Dict of vector ID -> chunk text, for the IDs that have text stored
+        """
+        texts = {}
+        with self.lock:
+            for i in range(0, len(vector_ids), SQLITE_MAX_VARIABLES):
+                batch = vector_ids[i:i + SQLITE_MAX_VARIABLES]
+                rows = self.connection.execute(
+                    "SELECT vector_id, text FROM chunk_texts WHERE index_name = ? "
+                    f"AND vector_id IN ({', '.join('?' * len(batch))})",
+                    (self.index_name, *batch)
+                )
+                texts.update(rows)
+        return texts
+    
+    def delete_many(self, vector_ids):
+        """Delete the text of chunks removed from the index"""
+        with self.lock, self.connection:
+            for i in range(0, len(vector_ids), SQLITE_MAX_VARIABLES):
+                batch = vector_ids[i:i + SQLITE_MAX_VARIABLES]
+                self.connection.execute(
+                    "DELETE FROM chunk_texts WHERE index_name = ? "
+                    f"AND vector_id IN ({', '.join('?' * len(batch))})",
+                    (self.index_name, *batch)
+                )
+
+@st.cache_resource(show_spinner=False)
+def get_pinecone_chunk_texts(index_name):
+    """
+    Get the process-wide chunk texts of a Pinecone index
+    
+    Every session searching the index resolves matches to text through this
+    shared store.
+    
+    Args:
+        index_name: Name of the Pinecone index (part of the cache key)
+        
+    Returns:
+        PineconeChunkTexts
+    """
+    return PineconeChunkTexts(index_name)
+
+@st.cache_data(ttl=PINECONE_INFO_TTL_SECONDS, show_spinner=False)
+def list_pinecone_indexes(api_key):
+    """
+    List the names of the indexes in a Pinecone account, cached briefly
+    
+    Args:
+        api_key: Pinecone API key (part of the cache key)
+        
+    Returns:
+        Tuple of index names
+    """
+    return tuple(get_pinecone_client(api_key).list_indexes().names())
+
+@st.cache_data(ttl=PINECONE_INFO_TTL_SECONDS, show_spinner=False)
+def get_pinecone_vector_count(api_key, index_name):
+    """
+    Count the vectors in a Pinecone index's default namespace, cached briefly
+    
+    Args:
+        api_key: Pinecone API key (part of the cache key)
+        index_name: Name of the Pinecone index
+        
+    Returns:
+        Number of vectors
+    """
+    stats = get_pinecone_client(api_key).Index(index_name).describe_index_stats()
+    return stats.namespaces.get('', {}).get('vector_count', 0)
+
 class PineconeVectorStore:
     """
     Custom wrapper for Pinecone that implements a compatible interface with LangChain
     but doesn't rely on LangChain's Pinecone integration.
     """
     
-    def __init__(self, langchain_docs, embeddings, pinecone_index):
-        """Initialize the Pinecone vector store"""
+    def __init__(self, langchain_docs, embeddings, pinecone_index,
+                 batch_size=PINECONE_UPSERT_BATCH_SIZE, pool_threads=PINECONE_POOL_THREADS, progress_callback=None):
+        """
+        Initialize the Pinecone vector store
+        
+        Args:
+            langchain_docs: Chunks to upload
+            embeddings: Embeddings used for chunks and queries
+            pinecone_index: Name of the Pinecone index
+            batch_size: Chunks embedded and upserted per request
+            pool_threads: Upsert requests sent in parallel
+            progress_callback: Called with (chunks embedded, total chunks) after each batch
+        """
         # Check if Pinecone API key is available
         pinecone_api_key = os.environ.get("PINECONE_API_KEY")
         if not pinecone_api_key:
-            st.error("Pinecone API key not found. Please enter it in settings.")
+            report("error", "Pinecone API key not found. Please enter it in settings.")
             raise ValueError("Pinecone API key not found")
             
         # Check if Pinecone index name is provided
         if not pinecone_index:
-            st.error("Pinecone index name not provided. Please enter it in settings.")
+            report("error", "Pinecone index name not provided. Please enter it in settings.")
             raise ValueError("Pinecone index name not provided")
             
-        st.info(f"Creating Pinecone vector store with {len(langchain_docs)} document chunks...")
+        report("info", f"Creating Pinecone vector store with {len(langchain_docs)} document chunks...")
         
         # Import and initialize Pinecone with new API
         try:
@@ -193,55 +1046,68 @@ class PineconeVectorStore:
             # Store for use in queries
             self.embeddings = embeddings
             self.index_name = pinecone_index
+            self.batch_size = batch_size
+            self.write_limiter = TokenBucket(PINECONE_MAX_BYTES_PER_SECOND)
+            # Vector IDs of each document's chunks, so a document can be deleted or re-tagged
+            self.doc_vector_ids = {}
+            # Chunk text by vector ID, kept locally instead of in Pinecone metadata
+            self.chunk_texts = get_pinecone_chunk_texts(pinecone_index)
             
-            # Initialize Pinecone client
-            self.pc = Pinecone(api_key=pinecone_api_key)
+            # Shared Pinecone client, so its connection pool outlives this store
+            self.pc = get_pinecone_client(pinecone_api_key)
             
             # Check if index exists
             indexes = self.pc.list_indexes().names()
             if pinecone_index not in indexes:
-                st.error(f"Pinecone index '{pinecone_index}' not found. Please create it first.")
+                report("error", f"Pinecone index '{pinecone_index}' not found. Please create it first.")
                 raise ValueError(f"Pinecone index '{pinecone_index}' not found")
             
             # Get the index
-            self.index = self.pc.Index(pinecone_index)
+            # The connection pool lets upserts run in parallel with async_req
+            self.index = self.pc.Index(pinecone_index, pool_threads=pool_threads)
             
             # Upload documents if provided
             if langchain_docs:
-                self._upload_documents(langchain_docs)
+                self._upload_documents(langchain_docs, progress_callback)
                 
-            st.success(f"Successfully connected to Pinecone index '{pinecone_index}'")
+            report("success", f"Successfully connected to Pinecone index '{pinecone_index}'")
             
         except ImportError:
-            st.error("Pinecone Python client not installed. Please install with: pip install pinecone-client>=3.0.0")
+            report("error", "Pinecone Python client not installed. Please install with: pip install pinecone-client>=3.0.0")
             raise
         except Exception as e:
-            st.error(f"Error initializing Pinecone vector store: {str(e)}")
+            report("error", f"Error initializing Pinecone vector store: {str(e)}")
             import traceback
-            st.error(f"Traceback: {traceback.format_exc()}")
+            report("error", f"Traceback: {traceback.format_exc()}")
             raise
     
-    def _upload_documents(self, langchain_docs):
-        """Upload documents to Pinecone"""
+    def _upload_documents(self, langchain_docs, progress_callback=None):
+        """
+        Upload documents to Pinecone
+        
+        Each batch is embedded with one request, with a few batches embedded
+        ahead, and upserted asynchronously, so embedding and upserting overlap.
+        Upserts are split to stay under Pinecone's request size limit and
+        throttled to its write rate; throttled requests are retried with backoff.
+        At most PINECONE_MAX_PENDING_UPSERTS requests are in flight, and finished
+        ones are released as the upload goes, so memory doesn't grow with the corpus.
+        """
         try:
-            # Process in batches to avoid overloading
-            batch_size = 100
             total_docs = len(langchain_docs)
+            uploaded = 0
+            pending_upserts = deque()
+            # One progress bar updated in place, unless the caller reports progress itself
+            progress_bar = None if progress_callback else st.progress(0.0, text="Embedding documents for Pinecone...")
             
-            for i in range(0, total_docs, batch_size):
-                # Get current batch
-                batch = langchain_docs[i:min(i+batch_size, total_docs)]
-                
+            for batch, embeddings in embed_batches_ahead(self.embeddings, chunks(langchain_docs, self.batch_size)):
                 # Create vectors for batch
                 vectors = []
-                for doc in batch:
-                    # Generate embedding for the document text
-                    embedding = self.embeddings.embed_query(doc.page_content)
+                for doc, embedding in zip(batch, embeddings):
+                    # The chunk key is stable, so re-uploading a chunk overwrites it
+                    vector_id = doc.metadata.get("chunk_key") or str(uuid.uuid4())
+                    self.doc_vector_ids.setdefault(doc.metadata.get("doc_id"), []).append(vector_id)
                     
-                    # Create a vector with a unique ID
-                    vector_id = str(uuid.uuid4())
-                    
-                    # Create the vector record
+                    # Create the vector record (the chunk text stays local)
                     vector = {
                         "id": vector_id,
                         "values": embedding,
@@ -249,24 +1115,93 @@ class PineconeVectorStore:
                     }
                     
                     vectors.append(vector)
+                self.chunk_texts.set_many((vector["id"], doc.page_content) for vector, doc in zip(vectors, batch))
                 
-                # Upsert vectors to Pinecone
-                self.index.upsert(vectors=vectors)
+                # Upsert vectors to Pinecone without waiting for the response
+                for request_vectors, request_bytes in pack_vectors(vectors):
+                    # Release finished requests, and wait for the oldest when too many are in flight
+                    while pending_upserts and (pending_upserts[0][1].ready()
+                                               or len(pending_upserts) >= PINECONE_MAX_PENDING_UPSERTS):
+                        self._finish_upsert(*pending_upserts.popleft())
+                    self.write_limiter.acquire(request_bytes)
+                    pending_upserts.append((request_vectors, self.index.upsert(vectors=request_vectors, async_req=True)))
                 
-                st.write(f"Uploaded {min(i+batch_size, total_docs)}/{total_docs} documents to Pinecone")
+                uploaded += len(batch)
+                if progress_callback:
+                    progress_callback(uploaded, total_docs)
+                else:
+                    progress_bar.progress(uploaded / total_docs, text=f"Embedded {uploaded}/{total_docs} documents for Pinecone")
+            
+            # Wait for the remaining upserts
+            while pending_upserts:
+                self._finish_upsert(*pending_upserts.popleft())
             
-            st.success(f"Successfully uploaded {total_docs} documents to Pinecone")
+            report("success", f"Successfully uploaded {total_docs} documents to Pinecone")
         
         except Exception as e:
-            st.error(f"Error uploading documents to Pinecone: {str(e)}")
+            report("error", f"Error uploading documents to Pinecone: {str(e)}")
             import traceback
-            st.error(f"Traceback: {traceback.format_exc()}")
+            report("error", f"Traceback: {traceback.format_exc()}")
             raise
     
+    def _finish_upsert(self, request_vectors, result):
+        """Wait for an asynchronous upsert, retrying it if throttled and raising any other failure"""
+        try:
+            result.get()
+        except Exception as e:
+            if not is_rate_limited(e):
+                raise
+            self._upsert_with_retry(request_vectors)
+    
+    def _upsert_with_retry(self, vectors):
+        """Upsert vectors, backing off exponentially while Pinecone throttles the request"""
+        for delay in PINECONE_RETRY_DELAYS:
+            time.sleep(delay)
+            try:
+                return self.index.upsert(vectors=vectors)
+            except Exception as e:
+                if not is_rate_limited(e):
+                    raise
+        raise RuntimeError(f"Pinecone kept throttling an upsert after {len(PINECONE_RETRY_DELAYS)} retries")
+    
+    def register_documents(self, langchain_docs):
+        """Record the vector IDs and text of chunks that are already in the index"""
+        texts = []
+        for doc in langchain_docs:
+            self.doc_vector_ids.setdefault(doc.metadata.get("doc_id"), []).append(doc.metadata["chunk_key"])
+            texts.append((doc.metadata["chunk_key"], doc.page_content))
+        self.chunk_texts.set_many(texts)
+    
+    def add_documents(self, langchain_docs):
+        """Embed and upload chunks to the index"""
+        self._upload_documents(langchain_docs)
+    
+    def delete_documents(self, doc_ids):
+        """Delete every chunk of the given documents from the index"""
+        vector_ids = [
+            vector_id
+            for doc_id in doc_ids
+            for vector_id in self.doc_vector_ids.pop(doc_id, [])
+        ]
+        self.chunk_texts.delete_many(vector_ids)
+        for i in range(0, len(vector_ids), PINECONE_DELETE_BATCH_SIZE):
+            self.index.delete(ids=vector_ids[i:i + PINECONE_DELETE_BATCH_SIZE])
+    
+    def update_document_metadata(self, doc_id, metadata_update):
+        """Set metadata fields on every chunk of a document, keeping its embeddings"""
+        # Pinecone updates one vector per request, so send them all through the pool at once
+        async_results = [
+            self.index.update(id=vector_id, set_metadata=metadata_update, async_req=True)
+            for vector_id in self.doc_vector_ids.get(doc_id, [])
+        ]
+        for result in async_results:
+            result.get()
+    
     def as_retriever(self, search_type="similarity", search_kwargs=None):
         """Return a retriever that can be used with LangChain"""
         return PineconeRetriever(
             pinecone_store=self,
+            search_type=search_type,
             search_kwargs=search_kwargs or {"k": 5}
         )
     
@@ -275,6 +1210,10 @@ class PineconeVectorStore:
         # Generate embedding for the query
         query_embedding = self.embeddings.embed_query(query)
         
+        return self.similarity_search_by_vector(query_embedding, k=k)
+    
+    def similarity_search_by_vector(self, query_embedding, k=5):
+        """Search for documents similar to an already-computed query embedding"""
         # Search Pinecone
         results = self.index.query(
             vector=query_embedding,
@@ -282,23 +1221,66 @@ class PineconeVectorStore:
             include_metadata=True
         )
         
-        # Convert to LangChain documents
+        return self._matches_to_documents(results.matches)
+    
+    def max_marginal_relevance_search(self, query, k=5, fetch_k=20, lambda_mult=0.5):
+        """Search for documents similar to the query while avoiding near-duplicates"""
+        query_embedding = self.embeddings.embed_query(query)
+        
+        return self.max_marginal_relevance_search_by_vector(
+            query_embedding, k=k, fetch_k=fetch_k, lambda_mult=lambda_mult
+        )
+    
+    def max_marginal_relevance_search_by_vector(self, query_embedding, k=5, fetch_k=20, lambda_mult=0.5):
+        """
+        Maximal marginal relevance search over an already-computed query embedding
+        
+        Args:
+            query_embedding: Query embedding
+            k: Number of documents to return
+            fetch_k: Number of candidates fetched from Pinecone to choose from
+            lambda_mult: Trade-off between relevance (1) and diversity (0)
+            
+        Returns:
+            List of Documents in selection order
+        """
+        results = self.index.query(
+            vector=query_embedding,
+            top_k=fetch_k,
+            include_metadata=True,
+            include_values=True
+        )
+        matches = results.matches
+        if not matches:
+            return []
+        
+        selected = maximal_marginal_relevance(
+            np.array(query_embedding, dtype=np.float32),
+            [match.values for match in matches],
+            lambda_mult=lambda_mult,
+            k=k
+        )
+        return self._matches_to_documents([matches[i] for i in selected])
+    
+    def _matches_to_documents(self, matches):
+        """
+        Convert Pinecone matches to LangChain Documents, in order
+        
+        Matches whose text is neither stored locally nor in their metadata are
+        logged and skipped, rather than returned as empty documents.
+        """
+        texts = self.chunk_texts.get_many([match.id for match in matches])
         documents = []
-        for match in results.matches:
+        for match in matches:
+            # The match's metadata is built fresh for each response, so the legacy text
+            # field (on vectors uploaded before chunk text was kept locally) is popped in place
             metadata = match.metadata
-            text = metadata.get("text", "")
-            # Remove text from metadata to avoid duplication
-            if "text" in metadata:
-                metadata_copy = metadata.copy()
-                del metadata_copy["text"]
-            else:
-                metadata_copy = metadata
-                
-            documents.append(Document(
-                page_content=text,
-                metadata=metadata_copy
-            ))
-        
+            legacy_text = metadata.pop("text", "")
+            text = texts.get(match.id) or legacy_text
+            if not text:
+                logger.warning("Skipping Pinecone match %s: no chunk text stored for it", match.id)
+                continue
+            documents.append(Document(page_content=text, metadata=metadata))
         return documents
 
 
@@ -308,13 +1290,16 @@ class PineconeRetriever:
     interface with LangChain.
     """
     
-    def __init__(self, pinecone_store, search_kwargs=None):
+    def __init__(self, pinecone_store, search_type="similarity", search_kwargs=None):
         """Initialize the retriever"""
         self.pinecone_store = pinecone_store
+        self.search_type = search_type
         self.search_kwargs = search_kwargs or {"k": 5}
     
     def get_relevant_documents(self, query):
         """Get relevant documents for a query"""
+        if self.search_type == "mmr":
+            return self.pinecone_store.max_marginal_relevance_search(query, **self.search_kwargs)
         return self.pinecone_store.similarity_search(
             query,
             k=self.search_kwargs.get("k", 5)
@@ -322,4 +1307,246 @@ class PineconeRetriever:
     
     def invoke(self, query):
         """Invoke the retriever (compatible with LangChain)"""
-        return self.get_relevant_documents(query)
\ No newline at end of file
+        return self.get_relevant_documents(query)
+    
+    async def aget_relevant_documents(self, query):
+        """Get relevant documents for a query without blocking the event loop"""
+        return await asyncio.to_thread(self.get_relevant_documents, query)
+    
+    async def ainvoke(self, query):
+        """Invoke the retriever asynchronously (compatible with LangChain)"""
+        return await self.aget_relevant_documents(query)
+
+class FaissVectorStore:
+    """
+    Local vector store backed by a FAISS inner product index, with the same
+    interface as PineconeVectorStore.
+    
+    Vectors are L2-normalized before they are added, so inner product search is
+    cosine search: exact for small collections, over 8-bit quantized vectors for
+    large ones. FAISS only stores vectors, so the chunks are kept in a
+    separate docstore keyed by their FAISS ID, and both are saved to disk.
+    """
+    
+    def __init__(self, langchain_docs, embeddings, library_dir, embedding_model=DEFAULT_EMBEDDING_MODEL, index=None,
+                 docstore=None, progress_callback=None):
+        """
+        Initialize the FAISS vector store
+        
+        Args:
+            langchain_docs: Chunks to add
+            embeddings: Embeddings used for chunks and queries
+            library_dir: The user's library directory, which the files are saved to
+            embedding_model: Embedding model the embeddings come from, which names the saved files
+            index: FAISS index restored from disk, if any
+            docstore: Chunks of a restored index, keyed by FAISS ID
+            progress_callback: Called with (chunks embedded, total chunks) after each batch
+        """
+        if faiss is None:
+            report("error", "FAISS not installed. Please install with: pip install faiss-cpu")
+            raise ImportError("faiss is not installed")
+        
+        self.embeddings = embeddings
+        self.index_path, self.docstore_path = self.get_paths(library_dir, embedding_model)
+        self.index = index
+        self.docstore = docstore or {}
+        # FAISS IDs of each chunk, and of each document's chunks
+        self.chunk_ids = {doc.metadata["chunk_key"]: faiss_id for faiss_id, doc in self.docstore.items()}
+        self.doc_vector_ids = {}
+        for faiss_id, doc in self.docstore.items():
+            self.doc_vector_ids.setdefault(doc.metadata.get("doc_id"), []).append(faiss_id)
+        self.next_id = max(self.docstore, default=-1) + 1
+        
+        if langchain_docs:
+            self.add_documents(langchain_docs, progress_callback)
+    
+    @staticmethod
+    def get_paths(library_dir, embedding_model=DEFAULT_EMBEDDING_MODEL):
+        """Paths of a library's index and docstore files for an embedding model"""
+        suffix = get_store_suffix(embedding_model)
+        return (os.path.join(library_dir, FAISS_INDEX_FILE_NAME.format(suffix=suffix)),
+                os.path.join(library_dir, FAISS_DOCSTORE_FILE_NAME.format(suffix=suffix)))
+    
+    @classmethod
+    def load(cls, embeddings, library_dir, embedding_model=DEFAULT_EMBEDDING_MODEL):
+        """
+        Restore the index and docstore a user saved in a previous session
+        
+        Returns:
+            FaissVectorStore, or None if nothing has been saved
+        """
+        index_path, docstore_path = cls.get_paths(library_dir, embedding_model)
+        if faiss is None or not os.path.exists(index_path) or not os.path.exists(docstore_path):
+            return None
+        
+        with open(docstore_path, "rb") as f:
+            docstore = pickle.load(f)
+        if not docstore:
+            return None
+        return cls([], embeddings, library_dir, embedding_model, index=faiss.read_index(index_path), docstore=docstore)
+    
+    @staticmethod
+    def clear(library_dir):
+        """Delete a library's saved indexes and docstores, for every embedding model"""
+        for embedding_model in EMBEDDING_MODELS:
+            for path in FaissVectorStore.get_paths(library_dir, embedding_model):
+                if os.path.exists(path):
+                    os.remove(path)
+    
+    def save(self):
+        """Write the index and docstore to disk, each through a temporary file"""
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        if self.index is not None:
+            faiss.write_index(self.index, self.index_path + ".tmp")
+            os.replace(self.index_path + ".tmp", self.index_path)
+        with open(self.docstore_path + ".tmp", "wb") as f:
+            pickle.dump(self.docstore, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(self.docstore_path + ".tmp", self.docstore_path)
+    
+    def add_documents(self, langchain_docs, progress_callback=None):
+        """
+        Embed chunks and add them to the index
+        
+        Each batch is normalized and added to the index as soon as it is embedded,
+        so only the batches in flight are held outside the index. Chunks that are
+        already indexed are replaced.
+        """
+        if not langchain_docs:
+            return
+        
+        replaced_ids = {self.chunk_ids[doc.metadata["chunk_key"]] for doc in langchain_docs if doc.metadata["chunk_key"] in self.chunk_ids}
+        self._remove_ids(list(replaced_ids))
+        
+        embedded = 0
+        for batch, batch_embeddings in embed_batches_ahead(self.embeddings, chunks(langchain_docs, EMBED_BATCH_SIZE)):
+            vectors = np.ascontiguousarray(batch_embeddings, dtype=np.float32)
+            faiss.normalize_L2(vectors)
+            
+            if self.index is None:
+                # IDMap2 keeps stable IDs across removals and can return stored vectors for MMR
+                self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(vectors.shape[1]))
+            
+            faiss_ids = np.arange(self.next_id, self.next_id + len(batch), dtype=np.int64)
+            self.next_id += len(batch)
+            self.index.add_with_ids(vectors, faiss_ids)
+            
+            for faiss_id, doc in zip(faiss_ids.tolist(), batch):
+                self.docstore[faiss_id] = doc
+                self.chunk_ids[doc.metadata["chunk_key"]] = faiss_id
+                self.doc_vector_ids.setdefault(doc.metadata.get("doc_id"), []).append(faiss_id)
+            
+            embedded += len(batch)
+            if progress_callback:
+                progress_callback(embedded, len(langchain_docs))
+        
+        self._quantize_if_large()
+        self.save()
+    
+    def _quantize_if_large(self):
+        """
+        Re-index a full-precision collection into 8-bit scalar quantized vectors once it is large
+        
+        Collections start exact and grow through uploads, so this is checked after
+        every addition. The quantizer is trained on every stored vector, which stores
+        a quarter of the bytes per vector at a small recall cost. Vector IDs are kept.
+        """
+        flat_index = faiss.downcast_index(self.index.index)
+        if not isinstance(flat_index, faiss.IndexFlat) or self.index.ntotal < FAISS_QUANTIZE_MIN_VECTORS:
+            return
+        
+        vectors = flat_index.reconstruct_n(0, flat_index.ntotal)
+        faiss_ids = faiss.vector_to_array(self.index.id_map)
+        
+        index = faiss.IndexScalarQuantizer(flat_index.d, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+        index.sq.rangestat = faiss.ScalarQuantizer.RS_minmax
+        index.sq.rangestat_arg = FAISS_QUANTIZER_RANGE_MARGIN
+        index.train(vectors)
+        self.index = faiss.IndexIDMap2(index)
+        self.index.add_with_ids(vectors, faiss_ids)
+    
+    def _remove_ids(self, faiss_ids):
+        """Remove vectors and their chunks by FAISS ID"""
+        if not faiss_ids:
+            return
+        self.index.remove_ids(np.asarray(faiss_ids, dtype=np.int64))
+        for faiss_id in faiss_ids:
+            doc = self.docstore.pop(faiss_id)
+            self.chunk_ids.pop(doc.metadata["chunk_key"], None)
+            doc_ids = self.doc_vector_ids.get(doc.metadata.get("doc_id"), [])
+            if faiss_id in doc_ids:
+                doc_ids.remove(faiss_id)
+    
+    def delete_documents(self, doc_ids):
+        """Delete every chunk of the given documents from the index"""
+        faiss_ids = [
+            faiss_id
+            for doc_id in doc_ids
+            for faiss_id in self.doc_vector_ids.pop(doc_id, [])
+        ]
+        if faiss_ids:
+            self._remove_ids(faiss_ids)
+            self.save()
+    
+    def update_document_metadata(self, doc_id, metadata_update):
+        """Set metadata fields on every chunk of a document, keeping its embeddings"""
+        for faiss_id in self.doc_vector_ids.get(doc_id, []):
+            self.docstore[faiss_id].metadata.update(metadata_update)
+        self.save()
+    
+    def as_retriever(self, search_type="similarity", search_kwargs=None):
+        """Return a retriever that can be used with LangChain"""
+        # The retriever only calls the search methods, which this store shares with Pinecone's
+        return PineconeRetriever(
+            pinecone_store=self,
+            search_type=search_type,
+            search_kwargs=search_kwargs or {"k": 5}
+        )
+    
+    def _search(self, query_embedding, k):
+        """Return the FAISS IDs of the k chunks closest to a query embedding"""
+        if self.index is None or self.index.ntotal == 0:
+            return []
+        query = np.array([query_embedding], dtype=np.float32)
+        faiss.normalize_L2(query)
+        _, ids = self.index.search(query, min(k, self.index.ntotal))
+        # FAISS pads missing results with -1
+        return [faiss_id for faiss_id in ids[0].tolist() if faiss_id != -1]
+    
+    def similarity_search(self, query, k=5):
+        """Search for similar documents to the query"""
+        return self.similarity_search_by_vector(self.embeddings.embed_query(query), k=k)
+    
+    def similarity_search_by_vector(self, query_embedding, k=5):
+        """Search for documents similar to an already-computed query embedding"""
+        return [self.docstore[faiss_id] for faiss_id in self._search(query_embedding, k)]
+    
+    def max_marginal_relevance_search(self, query, k=5, fetch_k=20, lambda_mult=0.5):
+        """Search for documents similar to the query while avoiding near-duplicates"""
+        return self.max_marginal_relevance_search_by_vector(
+            self.embeddings.embed_query(query), k=k, fetch_k=fetch_k, lambda_mult=lambda_mult
+        )
+    
+    def max_marginal_relevance_search_by_vector(self, query_embedding, k=5, fetch_k=20, lambda_mult=0.5):
+        """
+        Maximal marginal relevance search over an already-computed query embedding
+        
+        Args:
+            query_embedding: Query embedding
+            k: Number of documents to return
+            fetch_k: Number of candidates fetched from the index to choose from
+            lambda_mult: Trade-off between relevance (1) and diversity (0)
+            
+        Returns:
+            List of Documents in selection order
+        """
+        candidate_ids = self._search(query_embedding, fetch_k)
+        if not candidate_ids:
+            return []
+        
+        selected = maximal_marginal_relevance(
+            np.array(query_embedding, dtype=np.float32),
+            [self.index.reconstruct(faiss_id) for faiss_id in candidate_ids],
+            lambda_mult=lambda_mult,
+            k=k
+        )
+        return [self.docstore[candidate_ids[i]] for i in selected]